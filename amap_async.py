@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高德地图异步下载器
+基于asyncio并发执行多个区域、多个缩放级别的下载，并发数受 max_concurrency 限制
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from amap_downloader import AmapDownloader
+
+
+class AsyncAmapDownloader:
+    def __init__(self, api_key=None, default_scale=None, max_concurrency=None, downloader=None):
+        """
+        初始化异步下载器
+
+        HTTP请求仍由 AmapDownloader 的传输层（连接池+重试）完成，
+        在线程池中执行，asyncio负责调度与并发控制。
+
+        :param api_key: 高德地图API密钥
+        :param default_scale: 默认图片清晰度 (1=普通, 2=高清)
+        :param max_concurrency: 同时进行的最大请求数，None时使用配置 max_concurrency
+        :param downloader: 复用已有的 AmapDownloader 实例（共享连接池）
+        """
+        self.downloader = downloader or AmapDownloader(api_key, default_scale)
+        self.max_concurrency = max_concurrency or self.downloader.max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                            thread_name_prefix='amap-async')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def search_district(self, keywords, subdistrict=1):
+        """
+        搜索行政区域信息（协程版本，参数同 AmapDownloader.search_district）
+        """
+        return await self._run(self.downloader.search_district, keywords, subdistrict)
+
+    async def get_static_map(self, **kwargs):
+        """
+        获取静态地图图片（协程版本，参数同 AmapDownloader.get_static_map）
+        :return: 图片二进制数据，失败时返回None
+        """
+        return await self._run(self.downloader.get_static_map, **kwargs)
+
+    async def download_district_map(self, district_name, output_dir="./maps", zoom_levels=None,
+                                    map_style="normal", traffic=False, labels=True, show_boundary=True,
+                                    boundary_simplify_step=2, scale=None):
+        """
+        下载指定行政区域的地图（协程版本，各缩放级别并发下载）
+        参数与返回值同 AmapDownloader.download_district_map
+        :return: 保存的文件路径列表（按缩放级别顺序），未找到区域时返回None
+        """
+        saved_files = await self._download_district_map(district_name, output_dir, zoom_levels, map_style,
+                                                        traffic, labels, show_boundary, boundary_simplify_step,
+                                                        scale)
+        # 增量刷新：保存内容索引并更新变更列表
+        await self._save_refresh_indexes()
+        return saved_files
+
+    async def _download_district_map(self, district_name, output_dir="./maps", zoom_levels=None,
+                                     map_style="normal", traffic=False, labels=True, show_boundary=True,
+                                     boundary_simplify_step=2, scale=None):
+        plan = await self._run(self.downloader.plan_district, district_name, zoom_levels,
+                               show_boundary, boundary_simplify_step)
+        if plan is None:
+            return None
+
+        os.makedirs(output_dir, exist_ok=True)
+
+        results = await asyncio.gather(*[
+            self._run(self.downloader.download_zoom, plan, zoom, output_dir,
+                      map_style, traffic, labels, scale)
+            for zoom in plan['zoom_levels']
+        ])
+        return [filepath for filepath in results if filepath]
+
+    async def download_districts(self, district_names, output_dir="./maps", **kwargs):
+        """
+        并发下载多个行政区域的地图
+        :param district_names: 行政区域名称列表
+        :param output_dir: 输出目录
+        :param kwargs: 其余参数同 download_district_map
+        :return: dict {区域名称: 保存的文件路径列表或None}
+        """
+        results = await asyncio.gather(*[
+            self._download_district_map(name, output_dir, **kwargs)
+            for name in district_names
+        ])
+        # 所有区域完成后保存一次：各区域分别保存会在其它区域仍在下载时开始新的变更列表
+        await self._save_refresh_indexes()
+        return dict(zip(district_names, results))
+
+    async def _save_refresh_indexes(self):
+        if self.downloader.refresh:
+            await self._run(self.downloader.save_refresh_indexes)
+
+    def close(self):
+        """关闭线程池"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量区域下载
+从CSV/JSON任务列表读取区域（名称或行政代码）及各自的缩放级别/样式/清晰度，
+在有界线程池中共享同一个下载器（连接池、限流器、缓存）执行，并输出机器可读的清单（manifest）；
+配合任务日志（JobJournal）可在中断后续传，只执行尚未完成的下载单元
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from amap_fileio import atomic_write
+
+# 任务列表中表示"是"的取值
+_TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on', '是'}
+
+
+def _parse_bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in _TRUE_VALUES
+
+
+def _parse_zoom_levels(value):
+    """缩放级别：整数、列表或以空格/分号/竖线分隔的字符串，如 "10 12" 或 "10;12" """
+    if value is None or value == '':
+        return None
+    if isinstance(value, int):
+        return [value]
+    if isinstance(value, (list, tuple)):
+        return [int(v) for v in value]
+    parts = str(value).replace(';', ' ').replace('|', ' ').replace(',', ' ').split()
+    return [int(v) for v in parts]
+
+
+def normalize_job(row, defaults=None):
+    """
+    规范化一条任务
+
+    :param row: dict，支持的字段：district（名称）或 adcode（行政代码）、zoom、map_style、scale、
+                traffic、labels、show_boundary、boundary_simplify_step
+    :param defaults: 未填写字段的默认值
+    :return: 规范化后的任务dict
+    """
+    defaults = defaults or {}
+    row = {k.strip().lower(): (v.strip() if isinstance(v, str) else v)
+           for k, v in row.items() if k}
+    keywords = row.get('adcode') or row.get('district') or row.get('name')
+    if not keywords:
+        raise ValueError(f"任务缺少 district/adcode 字段: {row}")
+
+    def pick(key):
+        value = row.get(key)
+        return defaults.get(key) if value is None or value == '' else value
+
+    scale = pick('scale')
+    step = pick('boundary_simplify_step')
+    return {
+        'district': str(keywords),
+        'zoom_levels': _parse_zoom_levels(pick('zoom')),
+        'map_style': pick('map_style') or 'normal',
+        'scale': int(scale) if scale not in (None, '') else None,
+        'traffic': _parse_bool(row.get('traffic'), defaults.get('traffic', False)),
+        'labels': _parse_bool(row.get('labels'), defaults.get('labels', True)),
+        'show_boundary': _parse_bool(row.get('show_boundary'), defaults.get('show_boundary', True)),
+        'boundary_simplify_step': int(step) if step not in (None, '') else 2,
+    }
+
+
+def load_jobs(path, defaults=None):
+    """
+    读取任务列表
+
+    - CSV：首行为表头，如 district,zoom,map_style,scale（多个缩放级别以空格或分号分隔）
+    - JSON：任务对象列表，或 {"jobs": [...]}；也可以直接写区域名称字符串
+
+    :param path: 任务文件路径（按扩展名识别格式）
+    :param defaults: 未填写字段的默认值（如命令行指定的缩放级别）
+    :return: 规范化后的任务列表
+    """
+    if path.lower().endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        rows = data.get('jobs', []) if isinstance(data, dict) else data
+        rows = [{'district': row} if isinstance(row, str) else row for row in rows]
+    else:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = [row for row in csv.DictReader(f) if any(row.values())]
+    return [normalize_job(row, defaults) for row in rows]
+
+
+def expand_hierarchy(downloader, keywords, depth=1, levels=None, defaults=None, include_root=True):
+    """
+    将一个上级区域展开为其整棵子树的任务（如一个省的全部市和区县）
+
+    只需一次 subdistrict 查询获得区域树，再按行政代码并发查询各区域的边界（经过区域缓存），
+    查询结果随任务传给下载器，规划时不再重复查询。街道级区域没有边界数据，不参与下载。
+
+    :param downloader: AmapDownloader 实例
+    :param keywords: 上级区域名称或行政代码
+    :param depth: 向下展开的层级数 (1-3)
+    :param levels: 只下载这些级别的区域，如 ['district']，None时下载子树中全部区域
+    :param defaults: 任务字段默认值（同 normalize_job）
+    :param include_root: 是否包含上级区域本身
+    :return: 任务列表；未找到上级区域时返回空列表
+    """
+    nodes = downloader.list_subdistricts(keywords, depth, levels, include_root)
+    if not nodes:
+        print(f"未找到 {keywords} 的区域树")
+        return []
+    streets = [node for node in nodes if node['level'] == 'street']
+    if streets:
+        print(f"⚠️  跳过 {len(streets)} 个街道级区域（没有边界数据）")
+        nodes = [node for node in nodes if node['level'] != 'street']
+    print(f"🌳 {keywords} 子树共 {len(nodes)} 个区域，正在批量获取边界...")
+
+    infos = downloader.fetch_districts([node['adcode'] for node in nodes])
+    # 同名区域（如不同城市的同名区县）以"名称_行政代码"区分输出文件
+    names = [node['name'] for node in nodes]
+    jobs = []
+    for node in nodes:
+        district = node['name'] if names.count(node['name']) == 1 else f"{node['name']}_{node['adcode']}"
+        job = normalize_job({'district': district}, defaults)
+        job['district_info'] = infos.get(node['adcode'])
+        if job['district_info'] is None:
+            print(f"⚠️  未获取到 {district} 的边界，将在下载时重新查询")
+            job['district'] = node['adcode']
+        jobs.append(job)
+    return jobs
+
+
+class BatchRunner:
+    def __init__(self, downloader, output_dir="./maps", max_workers=None, journal=None, resume=False):
+        """
+        初始化批量下载
+
+        所有任务共享同一个下载器，因此共享连接池、限流器（整体速率不超过配额）和缓存；
+        区域规划（查询边界、简化路径）与各缩放级别的下载都作为独立单元提交到同一个线程池，
+        某个区域规划完成后其下载单元立即开始，无需等待其他区域。
+
+        :param downloader: AmapDownloader 实例
+        :param output_dir: 输出目录
+        :param max_workers: 线程池大小，None时使用下载器的 max_concurrency
+        :param journal: 任务日志（JobJournal），记录每个下载单元的状态与校验和
+        :param resume: 是否续传：跳过日志中已完成且输出文件仍存在的下载单元
+        """
+        self.downloader = downloader
+        self.output_dir = output_dir
+        self.max_workers = max_workers or downloader.max_concurrency
+        self.journal = journal
+        self.resume = resume
+        self.units = []
+        self._postprocess = []
+        self._lock = threading.Lock()
+
+    def _unit_key(self, job, zoom):
+        """下载单元在任务日志中的键：(区域, 缩放级别, 样式, 清晰度)"""
+        return job['district'], zoom, job['map_style'], job['scale'] or self.downloader.default_scale
+
+    def _completed(self, job, zoom):
+        """续传模式下已完成的下载单元，返回日志记录，否则返回None"""
+        if not (self.resume and self.journal):
+            return None
+        key = self._unit_key(job, zoom)
+        if not self.journal.is_done(*key):
+            return None
+        return self.journal.get(*key)
+
+    def _plan(self, job):
+        return self.downloader.plan_district(job['district'], job['zoom_levels'],
+                                             job['show_boundary'], job['boundary_simplify_step'],
+                                             district_info=job.get('district_info'))
+
+    def _download(self, plan, job, zoom):
+        start = time.perf_counter()
+        result = self.downloader.download_zoom_unit(plan, zoom, self.output_dir, job['map_style'],
+                                                    job['traffic'], job['labels'], job['scale'])
+        elapsed = time.perf_counter() - start
+        filepath = result['filepath'] if result else None
+        if self.journal:
+            key = self._unit_key(job, zoom)
+            if filepath:
+                # 流式写入时已计算校验和，无需重新读取文件
+                self.journal.mark_done(*key, filepath, result['sha256'], result['georef'])
+            else:
+                self.journal.mark_failed(*key, '地图下载失败')
+        return result, elapsed
+
+    def _record(self, job, zoom, status, filepath=None, elapsed=0.0, error=None, district_info=None,
+                resumed=False, georef=None, change=None):
+        unit = {
+            'district': job['district'],
+            'name': (district_info or {}).get('name'),
+            'adcode': (district_info or {}).get('adcode'),
+            'zoom': zoom,
+            'map_style': job['map_style'],
+            'scale': job['scale'] or self.downloader.default_scale,
+            'status': status,
+            'filepath': filepath,
+            'bytes': os.path.getsize(filepath) if filepath else 0,
+            'elapsed': round(elapsed, 3),
+            'error': error,
+            'resumed': resumed,
+            'georef': georef,
+            'change': change,
+        }
+        with self._lock:
+            self.units.append(unit)
+        return unit
+
+    def run(self, jobs):
+        """
+        执行任务列表
+        :param jobs: load_jobs / normalize_job 返回的任务列表
+        :return: 清单dict（见 manifest）
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.units = []
+        self._postprocess = []
+        started = time.time()
+        print(f"📋 批量下载 {len(jobs)} 个区域，并发数 {self.max_workers}")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='amap-batch') as executor:
+            pending = {}
+            for job in jobs:
+                # 已指定缩放级别且全部完成的区域无需规划（不发起任何请求）
+                if job['zoom_levels'] and all(self._completed(job, zoom) for zoom in job['zoom_levels']):
+                    for zoom in job['zoom_levels']:
+                        completed = self._completed(job, zoom)
+                        self._record(job, zoom, 'done', completed['filepath'], resumed=True,
+                                     georef=completed['georef'])
+                    continue
+                pending[executor.submit(self._plan, job)] = ('plan', job, None)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, job, context = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if kind == 'plan':
+                            self._record(job, None, 'failed', error=f"区域规划失败: {e}")
+                        else:
+                            if self.journal:
+                                self.journal.mark_failed(*self._unit_key(job, context[1]), str(e))
+                            self._record(job, context[1], 'failed', error=str(e),
+                                         district_info=context[0]['district_info'])
+                        continue
+
+                    if kind == 'plan':
+                        if result is None:
+                            self._record(job, None, 'failed', error=f"未找到区域: {job['district']}")
+                            continue
+                        for zoom in result['zoom_levels']:
+                            completed = self._completed(job, zoom)
+                            if completed:
+                                self._record(job, zoom, 'done', completed['filepath'],
+                                             district_info=result['district_info'], resumed=True,
+                                             georef=completed['georef'])
+                                continue
+                            if self.journal:
+                                self.journal.mark_pending(*self._unit_key(job, zoom))
+                            pending[executor.submit(self._download, result, job, zoom)] = \
+                                ('download', job, (result, zoom))
+                    else:
+                        plan, zoom = context
+                        saved, elapsed = result
+                        if saved is None:
+                            self._record(job, zoom, 'failed', elapsed=elapsed, error='地图下载失败',
+                                         district_info=plan['district_info'])
+                            continue
+                        unit = self._record(job, zoom, 'done', saved['filepath'], elapsed,
+                                            district_info=plan['district_info'], georef=saved['georef'],
+                                            change=saved.get('change'))
+                        if saved.get('postprocess'):
+                            self._postprocess.append((job, unit, saved['postprocess']))
+
+        self._collect_postprocess()
+        return self.manifest(started, time.time())
+
+    def _collect_postprocess(self):
+        """
+        等待图片处理完成（下载期间已在进程池中进行），将输出文件记入对应的下载单元；
+        处理失败在这里报告并记入清单，关闭处理器时不再重复报告
+        """
+        if not self._postprocess:
+            return
+        print(f"🖼️  等待 {len(self._postprocess)} 张图片处理完成...")
+        for job, unit, future in self._postprocess:
+            try:
+                outputs = self.downloader.postprocessor.collect(future)['outputs']
+            except Exception as e:
+                print(f"❌ 图片处理失败 {unit['filepath']}: {e}")
+                unit['postprocess'] = {'error': str(e)}
+                continue
+            unit['postprocess'] = {'outputs': outputs}
+            # 原图被就地优化（png格式）时更新日志中的大小与校验和，否则续传会认为文件不完整
+            if any(output['path'] == os.path.abspath(unit['filepath']) for output in outputs):
+                unit['bytes'] = os.path.getsize(unit['filepath'])
+                if self.journal:
+                    self.journal.mark_done(*self._unit_key(job, unit['zoom']), unit['filepath'])
+        self._postprocess = []
+
+    def manifest(self, started, finished):
+        """
+        生成清单：每个下载单元的输出文件、字节数、耗时与状态，以及汇总与HTTP请求统计
+        """
+        units = sorted(self.units, key=lambda u: (u['district'], u['zoom'] if u['zoom'] is not None else -1))
+        done = [u for u in units if u['status'] == 'done']
+        return {
+            'started': started,
+            'finished': finished,
+            'elapsed': round(finished - started, 3),
+            'output_dir': os.path.abspath(self.output_dir),
+            'summary': {
+                'units': len(units),
+                'done': len(done),
+                'failed': len(units) - len(done),
+                'resumed': sum(1 for u in done if u['resumed']),
+                'bytes': sum(u['bytes'] for u in done),
+                'postprocessed': sum(1 for u in done if 'outputs' in u.get('postprocess', {})),
+                'changed': sum(1 for u in done if u['change'] in ('added', 'changed')),
+                'unchanged': sum(1 for u in done if u['change'] == 'unchanged'),
+            },
+            'units': units,
+            'request_stats': self.downloader.get_request_stats(),
+            'key_usage': self.downloader.get_key_usage(),
+            'metrics': self.downloader.get_metrics(),
+        }
+
+
+def write_manifest(manifest, path):
+    """
+    将清单原子写入JSON文件（续传与瓦片导出依赖该文件，进程中途被终止时保留上一次的完整清单）
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    atomic_write(path, json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高德地图下载缓存
+- 行政区域查询结果的SQLite持久化缓存（带TTL与容量淘汰），前置内存LRU
+- 静态地图图片的内容寻址缓存（按规范化请求参数哈希存储，LRU字节预算）
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from amap_fileio import temp_path
+
+
+class DistrictCache:
+    def __init__(self, path, ttl=30 * 86400, max_bytes=200 * 1024 * 1024, memory_entries=128):
+        """
+        初始化行政区域缓存
+
+        :param path: SQLite数据库文件路径（支持~），None时仅使用内存
+        :param ttl: 缓存有效期（秒）
+        :param max_bytes: 磁盘缓存容量上限（按压缩后的字节数计），超出时淘汰最久未访问的条目
+        :param memory_entries: 内存LRU的最大条目数
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        if path:
+            path = os.path.expanduser(path)
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path or ':memory:', check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS districts (
+                key TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    @staticmethod
+    def _key(keywords, subdistrict, extensions):
+        return json.dumps([str(keywords), int(subdistrict), extensions], ensure_ascii=False)
+
+    def get(self, keywords, subdistrict=1, extensions='all'):
+        """
+        读取缓存的区域查询结果
+        :return: 高德district接口的完整响应数据，未命中或已过期时返回None
+        """
+        key = self._key(keywords, subdistrict, extensions)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, data = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    return data
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT payload, created FROM districts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, created = row
+            if now - created > self.ttl:
+                self._db.execute("DELETE FROM districts WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+
+            self._db.execute("UPDATE districts SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            data = json.loads(zlib.decompress(payload).decode('utf-8'))
+            self._remember(key, created, data)
+            return data
+
+    def put(self, keywords, subdistrict, extensions, data):
+        """
+        写入区域查询结果（边界polyline压缩后存储）
+        """
+        key = self._key(keywords, subdistrict, extensions)
+        payload = zlib.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO districts (key, payload, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now)
+            )
+            self._evict()
+            self._db.commit()
+            self._remember(key, now, data)
+
+    def _remember(self, key, created, data):
+        self._memory[key] = (created, data)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """删除过期条目，并在超出容量时按最久未访问顺序淘汰"""
+        self._db.execute("DELETE FROM districts WHERE created < ?", (time.time() - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM districts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM districts ORDER BY accessed").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM districts WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            total -= size
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM districts")
+            self._db.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._db.close()
+
+
+class ImageCache:
+    INDEX_NAME = 'index.sqlite'
+
+    def __init__(self, root, max_bytes=2 * 1024 * 1024 * 1024, hardlink=True):
+        """
+        初始化静态地图图片缓存
+
+        缓存文件可能以硬链接方式放入输出目录，因此最近使用时间与大小记录在缓存目录的索引（index.sqlite）中，
+        命中时不修改缓存文件本身（否则会改变用户已有地图文件的修改时间）
+
+        :param root: 缓存目录（支持~）
+        :param max_bytes: 缓存总字节数上限，超出时按最久未使用顺序淘汰
+        :param hardlink: 命中时是否以硬链接方式放入输出目录（失败时自动回退为复制）
+        """
+        self.root = os.path.expanduser(root)
+        self.max_bytes = max_bytes
+        self.hardlink = hardlink
+        self._total = None
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.root, self.INDEX_NAME), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    @staticmethod
+    def request_key(params):
+        """
+        计算请求参数的规范化哈希（忽略API密钥与空值，参数顺序无关）
+        """
+        normalized = {k: str(v) for k, v in params.items() if k != 'key' and v is not None}
+        canonical = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _blob_path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def lookup(self, params):
+        """
+        查找缓存的图片
+        :return: 缓存文件路径，未命中时返回None
+        """
+        key = self.request_key(params)
+        path = self._blob_path(key)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        # 在索引中记录使用时间，作为LRU淘汰依据
+        with self._lock:
+            updated = self._db.execute("UPDATE blobs SET accessed = ? WHERE key = ?", (time.time(), key))
+            if not updated.rowcount:
+                self._db.execute("INSERT OR REPLACE INTO blobs (key, size, accessed) VALUES (?, ?, ?)",
+                                 (key, size, time.time()))
+                if self._total is not None:
+                    self._total += size
+            self._db.commit()
+        return path
+
+    def get(self, params):
+        """
+        读取缓存的图片
+        :return: 图片二进制数据，未命中时返回None
+        """
+        path = self.lookup(params)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def materialize(self, params, dest):
+        """
+        命中时将缓存图片放入目标路径（硬链接或复制）
+        :return: 是否命中
+        """
+        path = self.lookup(params)
+        if path is None:
+            return False
+        # 目标已是该缓存文件的硬链接（如流式下载后放入缓存的文件）时无需替换：
+        # 同一文件的两个硬链接之间 rename 不做任何操作，会留下临时文件
+        try:
+            if os.path.samefile(path, dest):
+                return True
+        except OSError:
+            pass
+        # 先链接/复制到临时路径再原子替换目标文件
+        tmp_path = temp_path(dest)
+        linked = False
+        if self.hardlink:
+            try:
+                os.link(path, tmp_path)
+                linked = True
+            except OSError:
+                pass  # 跨设备或文件系统不支持硬链接
+        if not linked:
+            shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, dest)
+        return True
+
+    def put(self, params, data):
+        """
+        写入图片到缓存
+        :return: 缓存文件路径
+        """
+        key = self.request_key(params)
+        path = self._blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._record(key, len(data))
+        return path
+
+    def put_file(self, params, src):
+        """
+        将已保存的图片文件放入缓存（硬链接或复制，不读入内存）
+        :param src: 图片文件路径
+        :return: 缓存文件路径
+        """
+        key = self.request_key(params)
+        path = self._blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        linked = False
+        if self.hardlink:
+            try:
+                os.link(src, tmp_path)
+                linked = True
+            except OSError:
+                pass
+        if not linked:
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, path)
+        self._record(key, os.path.getsize(path))
+        return path
+
+    def _record(self, key, size):
+        """在索引中记录写入的缓存文件，替换已有条目时总大小只计算差值"""
+        with self._lock:
+            if self._total is None:
+                self._total = self._sync_index()
+            row = self._db.execute("SELECT size FROM blobs WHERE key = ?", (key,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO blobs (key, size, accessed) VALUES (?, ?, ?)",
+                             (key, size, time.time()))
+            self._total += size - (row[0] if row else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _entries(self):
+        for sub in os.scandir(self.root):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    yield entry
+
+    def _sync_index(self):
+        """
+        使索引与缓存目录一致：补充索引中没有的文件（以修改时间作为使用时间），删除文件已不存在的条目
+        :return: 缓存总字节数
+        """
+        indexed = dict(self._db.execute("SELECT key, size FROM blobs").fetchall())
+        total = 0
+        for entry in self._entries():
+            stat = entry.stat()
+            total += stat.st_size
+            if indexed.pop(entry.name, None) != stat.st_size:
+                self._db.execute("INSERT OR REPLACE INTO blobs (key, size, accessed) VALUES (?, ?, ?)",
+                                 (entry.name, stat.st_size, stat.st_mtime))
+        self._db.executemany("DELETE FROM blobs WHERE key = ?", [(key,) for key in indexed])
+        return total
+
+    def _evict(self):
+        """按最近使用时间从旧到新删除，直到总大小回到预算以内"""
+        rows = self._db.execute("SELECT key, size FROM blobs ORDER BY accessed").fetchall()
+        for key, size in rows:
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._blob_path(key))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            self._db.execute("DELETE FROM blobs WHERE key = ?", (key,))
+            self._total -= size
+
+    def close(self):
+        """关闭索引数据库连接"""
+        with self._lock:
+            self._db.close()
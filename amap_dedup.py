@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+瓦片去重
+对解码后的瓦片计算精确哈希（像素内容）与向量化的感知指纹（分块均值），
+内容相同的瓦片（大片水域、空白陆地、高德错误占位图）只编码、存储一次，其余以哈希引用
+"""
+
+import hashlib
+import threading
+
+import numpy as np
+
+# 感知指纹的分块数（每边），256像素瓦片即32×32像素一块
+PERCEPTUAL_BLOCKS = 8
+
+
+def fingerprint_tiles(tiles, tolerance=4, quantize=4):
+    """
+    批量计算瓦片指纹
+
+    精确哈希基于像素内容（与编码无关）；感知指纹只对"平坦"瓦片（各分块均值的最大差不超过 tolerance）给出，
+    取量化后的平均颜色，用于合并仅有细微噪声差异的纯色瓦片。有细节的瓦片（道路、标注）只做精确去重，不会被合并。
+
+    :param tiles: (N, 高, 宽, 通道) uint8 数组，高与宽须能被 PERCEPTUAL_BLOCKS 整除
+    :param tolerance: 判断平坦瓦片的分块均值最大差
+    :param quantize: 平均颜色的量化步长
+    :return: [(精确哈希, 感知指纹或None)]
+    """
+    tiles = np.asarray(tiles)
+    count, height, width = tiles.shape[:3]
+    channels = tiles.shape[3] if tiles.ndim == 4 else 1
+    blocks = tiles.reshape(count, PERCEPTUAL_BLOCKS, height // PERCEPTUAL_BLOCKS,
+                           PERCEPTUAL_BLOCKS, width // PERCEPTUAL_BLOCKS, channels).mean(axis=(2, 4))
+    blocks = blocks.reshape(count, -1, channels)
+    spread = (blocks.max(axis=1) - blocks.min(axis=1)).max(axis=1)
+    colors = (blocks.mean(axis=1) // quantize).astype(np.int32)
+
+    result = []
+    for tile, flat, color in zip(tiles, spread <= tolerance, colors):
+        exact = hashlib.blake2b(np.ascontiguousarray(tile).data, digest_size=16).hexdigest()
+        perceptual = 'flat-' + '-'.join(map(str, color.tolist())) if flat else None
+        result.append((exact, perceptual))
+    return result
+
+
+class TileDeduplicator:
+    def __init__(self, perceptual=True):
+        """
+        瓦片去重登记表（线程安全）
+        :param perceptual: 是否按感知指纹合并近似相同的纯色瓦片
+        """
+        self.perceptual = perceptual
+        self._exact = {}
+        self._similar = {}
+        self._sizes = {}
+        self._references = []
+        self._lock = threading.Lock()
+        self.unique = 0
+        self.exact_duplicates = 0
+        self.perceptual_duplicates = 0
+
+    def claim(self, exact, perceptual=None):
+        """
+        登记一个瓦片
+        :return: (瓦片ID, 是否为新内容)；非新内容时调用方无需编码，按ID引用已有瓦片
+        """
+        with self._lock:
+            tile_id = self._exact.get(exact)
+            if tile_id is not None:
+                self.exact_duplicates += 1
+                self._references.append(tile_id)
+                return tile_id, False
+            if self.perceptual and perceptual is not None:
+                tile_id = self._similar.get(perceptual)
+                if tile_id is not None:
+                    self._exact[exact] = tile_id
+                    self.perceptual_duplicates += 1
+                    self._references.append(tile_id)
+                    return tile_id, False
+            self._exact[exact] = exact
+            if perceptual is not None:
+                self._similar.setdefault(perceptual, exact)
+            self.unique += 1
+            return exact, True
+
+    def record_size(self, tile_id, size):
+        """记录瓦片编码后的字节数（用于统计节省的存储）"""
+        with self._lock:
+            self._sizes[tile_id] = size
+
+    def summary(self):
+        """
+        去重统计
+        :return: dict {'unique', 'exact_duplicates', 'perceptual_duplicates', 'bytes_saved'}
+        """
+        with self._lock:
+            return {
+                'unique': self.unique,
+                'exact_duplicates': self.exact_duplicates,
+                'perceptual_duplicates': self.perceptual_duplicates,
+                'bytes_saved': sum(self._sizes.get(tile_id, 0) for tile_id in self._references),
+            }
@@ -8,34 +8,161 @@
 import requests
 import json
 import os
-from urllib.parse import quote
-import time
+import argparse
+import threading
 import math
-from PIL import Image
-import io
-from config import AMAP_CONFIG, MAP_SIZES, ZOOM_LEVELS, RECOMMENDED_ZOOM_COMBINATIONS
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from amap_transport import AmapTransport, RequestCancelled, encoded_url, encoded_param_length, mask_api_key
+from amap_ratelimit import RateLimiter
+from amap_keypool import KeyPool
+from amap_metrics import Metrics, JsonLinesSink, PrometheusTextSink
+from amap_cache import DistrictCache, ImageCache
+from amap_batch import load_jobs, normalize_job, expand_hierarchy, BatchRunner, write_manifest
+from amap_fileio import AtomicFile, temp_path
+from amap_journal import JobJournal
+from amap_refresh import RefreshIndex
+
+# numpy、OpenCV、PIL 及依赖它们的模块（边界几何、瓦片拼接、GeoTIFF、图片处理、瓦片导出）在首次使用时才导入：
+# 导入本模块（GUI启动、命令行 --help）与发出第一个请求前都不加载这些模块
+
+
+class _LazyConfig:
+    """
+    config 模块中的配置项，首次访问时才导入 config（与直接导入的字典是同一个对象，运行时修改同样生效）
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def _value(self):
+        # 静态导入语句（而非 importlib），打包工具（PyInstaller）可以追踪到 config 模块
+        import config
+        return getattr(config, self._name)
+
+    def __getattr__(self, attr):
+        return getattr(self._value(), attr)
+
+    def __getitem__(self, key):
+        return self._value()[key]
+
+    def __contains__(self, key):
+        return key in self._value()
+
+    def __iter__(self):
+        return iter(self._value())
+
+    def __len__(self):
+        return len(self._value())
+
+
+AMAP_CONFIG = _LazyConfig('AMAP_CONFIG')
+ZOOM_LEVELS = _LazyConfig('ZOOM_LEVELS')
+RECOMMENDED_ZOOM_COMBINATIONS = _LazyConfig('RECOMMENDED_ZOOM_COMBINATIONS')
 
 class AmapDownloader:
-    def __init__(self, api_key=None, default_scale=None):
+    def __init__(self, api_key=None, default_scale=None, quiet=None):
         """
         初始化高德地图下载器
         
         Args:
             api_key (str, optional): 高德地图API密钥
             default_scale (int, optional): 默认图片清晰度 (1=普通, 2=高清)
+            quiet (bool, optional): 安静模式，不打印每个请求的进度信息（错误信息仍会打印），None时使用配置 quiet
         """
         self.api_key = api_key or AMAP_CONFIG.get('api_key', 'YOUR_AMAP_API_KEY_HERE')
         self.default_scale = default_scale or AMAP_CONFIG.get('default_scale', 2)
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        self.quiet = AMAP_CONFIG.get('quiet', False) if quiet is None else quiet
+        # 按接口限流（令牌桶），同一API密钥在进程内共享，多个线程/下载器共同遵守配额
+        # 未配置rate_limits时按request_delay换算QPS
+        request_delay = AMAP_CONFIG.get('request_delay', 0.5)
+        default_qps = 1.0 / request_delay if request_delay else 0
+        self.rate_limiter = RateLimiter.shared(self.api_key, AMAP_CONFIG.get('rate_limits'), default_qps)
+        
+        # 多密钥池（可选）：配置了api_keys且未显式指定api_key时启用，
+        # 每次请求选择余量最多的密钥，配额用尽时自动切换
+        self.key_pool = None
+        api_keys = AMAP_CONFIG.get('api_keys') or []
+        if api_keys and not api_key:
+            pool_config = AMAP_CONFIG.get('key_pool', {})
+            self.key_pool = KeyPool(
+                api_keys,
+                daily_limits=pool_config.get('daily_limits'),
+                rate_limits=AMAP_CONFIG.get('rate_limits'),
+                default_qps=default_qps,
+                state_path=pool_config.get('state_path', '~/.amap_downloader/key_usage.json'),
+                cooldown=pool_config.get('cooldown', 5)
+            )
+            self.api_key = self.key_pool.keys[0]
+        
+        # 所有HTTP请求统一走传输层（连接池、keep-alive、超时、重试退避）
+        self.transport = AmapTransport(
+            timeout=AMAP_CONFIG.get('timeout', 30),
+            pool_size=AMAP_CONFIG.get('pool_size', 10),
+            max_retries=AMAP_CONFIG.get('max_retries', 3),
+            backoff=AMAP_CONFIG.get('retry_backoff', 0.5),
+            backoff_max=AMAP_CONFIG.get('retry_backoff_max', 10),
+            headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'},
+            rate_limiter=self.rate_limiter,
+            key_pool=self.key_pool
+        )
+        self.session = self.transport.session
+        
+        # 运行指标（请求数、延迟直方图、字节数、重试、限流等待、失败错误码、缓存命中率）
+        metrics_config = AMAP_CONFIG.get('metrics', {})
+        self.metrics = Metrics()
+        if metrics_config.get('jsonl_path'):
+            self.metrics.add_sink(JsonLinesSink(metrics_config['jsonl_path']))
+        if metrics_config.get('prometheus_path'):
+            self.metrics.add_sink(PrometheusTextSink(metrics_config['prometheus_path']))
+        self.transport.add_listener(self.metrics.record_request)
         
         # 缺失区域检测
         self.missing_regions = []
         self.downloaded_regions = []
-        self.base_url = "https://restapi.amap.com/v3"
-        self.static_map_url = "https://restapi.amap.com/v3/staticmap"
+        # 接口地址可配置（如指向本地模拟服务 mock_amap_server.py 进行离线测试与性能基准）
+        self.base_url = AMAP_CONFIG.get('api_base_url', "https://restapi.amap.com/v3").rstrip('/')
+        self.static_map_url = f"{self.base_url}/staticmap"
+        
+        # 行政区域查询缓存（边界数据几乎不变，重复运行时不再请求district接口）
+        cache_config = AMAP_CONFIG.get('district_cache', {})
+        self.district_cache = None
+        if cache_config.get('enabled', True):
+            self.district_cache = DistrictCache(
+                cache_config.get('path', '~/.amap_downloader/district_cache.sqlite'),
+                ttl=cache_config.get('ttl_days', 30) * 86400,
+                max_bytes=cache_config.get('max_mb', 200) * 1024 * 1024,
+                memory_entries=cache_config.get('memory_entries', 128)
+            )
+        
+        # 静态地图图片缓存（可选，按请求参数内容寻址）
+        image_cache_config = AMAP_CONFIG.get('image_cache', {})
+        self.image_cache = None
+        if image_cache_config.get('enabled', False):
+            self.image_cache = ImageCache(
+                image_cache_config.get('path', '~/.amap_downloader/image_cache'),
+                max_bytes=image_cache_config.get('max_mb', 2048) * 1024 * 1024,
+                hardlink=image_cache_config.get('hardlink', True)
+            )
+        
+        # 异步/并发模式下同时进行的最大请求数
+        self.max_concurrency = AMAP_CONFIG.get('max_concurrency', 8)
+        
+        # 地理参考输出：None（仅PNG）、'world'（PNG + world file/.prj）、'geotiff'（另存带概览图层的GeoTIFF）
+        self.georef_output = AMAP_CONFIG.get('georef_output')
+        self.geotiff_overviews = AMAP_CONFIG.get('geotiff_overviews', True)
+        
+        # 下载后的图片处理（可选）：下载完成的文件提交到进程池转码，不阻塞后续下载
+        postprocess_config = dict(AMAP_CONFIG.get('postprocess', {}))
+        self.postprocessor = None
+        if postprocess_config.pop('enabled', False):
+            from amap_postprocess import PostProcessor
+            workers = postprocess_config.pop('workers', None)
+            self.postprocessor = PostProcessor(postprocess_config, workers)
+        
+        # 增量刷新：按输出目录中的内容索引判断图片是否变化，未变化的文件不重写（修改时间不变）
+        self.refresh = AMAP_CONFIG.get('refresh', False)
+        self._refresh_indexes = {}
+        self._refresh_lock = threading.Lock()
     
     def get_recommended_zoom_levels(self, mode='default'):
         """
@@ -69,6 +196,38 @@ class AmapDownloader:
         else:
             return {'name': f'级别{zoom_level}', 'description': '自定义缩放级别'}
     
+    def get_request_stats(self):
+        """
+        获取HTTP请求耗时统计
+        
+        Returns:
+            dict: 按接口（district/staticmap）汇总的请求次数、平均/P50/P95/最大耗时（秒）、重试次数及限流等待时间
+        """
+        return self.transport.summary()
+    
+    def get_metrics(self):
+        """
+        获取运行指标快照
+        
+        Returns:
+            dict: 计数器、延迟直方图与缓存命中率（见 Metrics.snapshot）
+        """
+        return self.metrics.snapshot()
+    
+    def _log(self, message):
+        """打印进度信息（安静模式下不打印）"""
+        if not self.quiet:
+            print(message)
+    
+    def get_key_usage(self):
+        """
+        获取密钥池中各密钥的当日用量（未启用密钥池时返回None）
+        
+        Returns:
+            dict: {密钥指纹: {'used': 各接口已用次数, 'remaining': 各接口剩余次数, 'exhausted': 配额已用尽的接口}}
+        """
+        return self.key_pool.usage() if self.key_pool else None
+    
     def search_district(self, keywords, subdistrict=1):
         """
         搜索行政区域信息
@@ -76,6 +235,12 @@ class AmapDownloader:
         :param subdistrict: 子级行政区域级别
         :return: 区域信息
         """
+        if self.district_cache:
+            data = self.district_cache.get(keywords, subdistrict, 'all')
+            self.metrics.record_cache('district', bool(data))
+            if data:
+                return data['districts'][0]
+        
         url = f"{self.base_url}/config/district"
         params = {
             'key': self.api_key,
@@ -85,11 +250,11 @@ class AmapDownloader:
         }
         
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            data = self.transport.get_json(url, params=params, endpoint='district')
             
             if data['status'] == '1' and data['districts']:
+                if self.district_cache:
+                    self.district_cache.put(keywords, subdistrict, 'all', data)
                 return data['districts'][0]
             else:
                 print(f"搜索失败: {data.get('info', '未知错误')}")
@@ -99,6 +264,53 @@ class AmapDownloader:
             print(f"请求失败: {e}")
             return None
     
+    def list_subdistricts(self, keywords, depth=1, levels=None, include_root=True):
+        """
+        一次查询获取行政区域树并展开为列表（如省 -> 市 -> 区县）
+        
+        使用 subdistrict=depth 一次返回整棵子树，代替逐个名称查询各下级区域
+        注意：子树中的区域只有名称、行政代码、中心点等基础信息，不含边界（见 fetch_districts）
+        
+        :param keywords: 上级区域名称或行政代码
+        :param depth: 向下展开的层级数 (1-3)
+        :param levels: 只保留这些级别的区域，如 ['district']（province/city/district/street），None时全部保留
+        :param include_root: 是否包含上级区域本身
+        :return: 区域列表，每项为 {name, adcode, level, center, depth, parent_adcode}，按树的先序排列；未找到时返回None
+        """
+        root = self.search_district(keywords, subdistrict=max(1, min(3, depth)))
+        if not root:
+            return None
+        
+        result = []
+        stack = [(root, 0, None)]
+        while stack:
+            node, node_depth, parent_adcode = stack.pop()
+            if (include_root or node_depth > 0) and (levels is None or node.get('level') in levels):
+                result.append({
+                    'name': node.get('name'),
+                    'adcode': node.get('adcode'),
+                    'level': node.get('level'),
+                    'center': node.get('center'),
+                    'depth': node_depth,
+                    'parent_adcode': parent_adcode,
+                })
+            if node_depth < depth:
+                children = node.get('districts') or []
+                stack.extend((child, node_depth + 1, node.get('adcode')) for child in reversed(children))
+        return result
+    
+    def fetch_districts(self, keywords_list, max_workers=None):
+        """
+        并发查询多个区域的详细信息（含边界），经过区域缓存与限流器
+        :param keywords_list: 区域名称或行政代码列表（推荐行政代码，结果唯一）
+        :param max_workers: 并发数，None时使用 max_concurrency
+        :return: dict {关键词: 区域信息或None}
+        """
+        keywords_list = list(dict.fromkeys(keywords_list))
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_concurrency) as executor:
+            infos = executor.map(lambda keywords: self.search_district(keywords, subdistrict=0), keywords_list)
+            return dict(zip(keywords_list, infos))
+    
     def analyze_boundary(self, polyline):
         """
         分析区域边界数据，计算最佳地图中心点和覆盖范围
@@ -107,27 +319,16 @@ class AmapDownloader:
         """
         if not polyline:
             return None
-            
-        coords_list = polyline.split(';')
-        if len(coords_list) < 3:
-            return None
-            
-        # 解析坐标点
-        lngs, lats = [], []
-        for coord in coords_list:
-            try:
-                lng, lat = map(float, coord.split(','))
-                lngs.append(lng)
-                lats.append(lat)
-            except (ValueError, IndexError):
-                continue
-                
-        if not lngs or not lats:
+        from amap_geometry import parse_polyline
+        
+        # 解析坐标点（向量化解析并按边界字符串缓存，后续步骤复用同一数组）
+        coords = parse_polyline(polyline).coords
+        if len(coords) < 3:
             return None
             
         # 计算边界框
-        min_lng, max_lng = min(lngs), max(lngs)
-        min_lat, max_lat = min(lats), max(lats)
+        min_lng, min_lat = (float(v) for v in coords.min(axis=0))
+        max_lng, max_lat = (float(v) for v in coords.max(axis=0))
         
         # 计算几何中心点
         center_lng = (min_lng + max_lng) / 2
@@ -162,9 +363,9 @@ class AmapDownloader:
             
         # 计算推荐的地图尺寸
         # 根据区域复杂度和跨度确定最佳尺寸
-        if max_distance > 100 or len(coords_list) > 1000:
+        if max_distance > 100 or len(coords) > 1000:
             recommended_size = "2048*2048"  # 大区域或复杂边界用高分辨率
-        elif max_distance > 20 or len(coords_list) > 500:
+        elif max_distance > 20 or len(coords) > 500:
             recommended_size = "1024*1024"  # 中等区域用标准分辨率
         else:
             recommended_size = "512*512"   # 小区域用较低分辨率
@@ -186,7 +387,7 @@ class AmapDownloader:
              },
              'optimal_zoom': optimal_zoom,
              'recommended_size': recommended_size,
-             'boundary_complexity': len(coords_list)
+             'boundary_complexity': len(coords)
          }
     
 
@@ -212,6 +413,13 @@ class AmapDownloader:
         :param scale: 图片清晰度 (1=普通, 2=高清)，高清图片实际像素为size的2倍
         :return: 图片二进制数据
         """
+        params = self._static_map_params(center, zoom, size, markers, paths, scale)
+        return self._fetch_static_map(params)
+    
+    def _static_map_params(self, center=None, zoom=None, size="1024*1024", markers=None, paths=None, scale=None):
+        """
+        构建静态地图请求参数
+        """
         # 使用默认scale值如果未指定
         if scale is None:
             scale = self.default_scale
@@ -238,56 +446,191 @@ class AmapDownloader:
         if markers:
             params['markers'] = markers
         
-        # 构建完整URL用于调试
-        full_url = f"{self.static_map_url}?{'&'.join([f'{k}={v}' for k, v in params.items()])}"
-        print(f"请求URL长度: {len(full_url)} 字符")
-        print(f"请求URL: {full_url[:500]}...")  # 只显示前500个字符
+        return params
+    
+    def _check_static_map_url(self, params):
+        """
+        构建实际发送的完整URL（含百分号编码）用于长度检查与调试，打印时隐藏API密钥
+        :return: URL长度是否在限制以内
+        """
+        full_url = encoded_url(self.static_map_url, params)
+        if not self.quiet:
+            print(f"请求URL长度: {len(full_url)} 字符")
+            print(f"请求URL: {mask_api_key(full_url)[:500]}...")  # 只显示前500个字符
         
         # 检查URL长度
-        if len(full_url) > 8192:
-            print(f"❌ URL过长 ({len(full_url)} 字符)，超过高德地图API限制 (8192 字符)")
+        max_url_length = AMAP_CONFIG.get('max_url_length', 8192)
+        if len(full_url) > max_url_length:
+            print(f"❌ URL过长 ({len(full_url)} 字符)，超过高德地图API限制 ({max_url_length} 字符)")
+            return False
+        return True
+    
+    def _report_static_map_error(self, response):
+        """
+        打印静态地图接口返回的错误信息（非图片响应）
+        """
+        # 尝试解析JSON错误信息
+        try:
+            error_data = response.json()
+            error_code = error_data.get('infocode', 'unknown')
+            error_info = error_data.get('info', 'unknown')
+            print(f"❌ 获取地图失败:")
+            print(f"   错误码: {error_code}")
+            print(f"   错误信息: {error_info}")
+            print(f"   完整响应: {response.text}")
+            
+            # 根据错误码提供解决建议
+            if error_code == "20003":
+                print(f"💡 错误码20003解决建议:")
+                print(f"   1. 检查API密钥是否正确")
+                print(f"   2. 检查请求参数是否符合规范")
+                print(f"   3. 尝试简化边界坐标或禁用边界显示")
+                print(f"   4. 检查网络连接")
+        except:
+            print(f"❌ 获取地图失败: {response.text}")
+    
+    def _fetch_static_map(self, params):
+        """
+        按请求参数获取静态地图图片（优先读取图片缓存，命中时不发起请求也不占用限流配额）
+        :return: 图片二进制数据，失败时返回None
+        """
+        if self.image_cache:
+            cached = self.image_cache.get(params)
+            self.metrics.record_cache('image', cached is not None)
+            if cached is not None:
+                self._log(f"📦 命中图片缓存，大小: {len(cached)} 字节")
+                return cached
+        
+        if not self._check_static_map_url(params):
             return None
         
         try:
-            # 增加超时时间以支持大图片下载
-            response = requests.get(self.static_map_url, params=params, timeout=60)
+            # 超时时间取自配置，失败时由传输层自动重试
+            response = self.transport.get(self.static_map_url, params=params, endpoint='staticmap')
             
             # 打印响应状态
-            print(f"HTTP状态码: {response.status_code}")
-            print(f"响应头Content-Type: {response.headers.get('content-type', 'unknown')}")
+            self._log(f"HTTP状态码: {response.status_code}")
+            self._log(f"响应头Content-Type: {response.headers.get('content-type', 'unknown')}")
             
             response.raise_for_status()
             
             if response.headers.get('content-type', '').startswith('image'):
-                print(f"✅ 成功获取地图图片，大小: {len(response.content)} 字节")
+                self._log(f"✅ 成功获取地图图片，大小: {len(response.content)} 字节")
+                if self.image_cache:
+                    self.image_cache.put(params, response.content)
                 return response.content
             else:
-                # 尝试解析JSON错误信息
-                try:
-                    error_data = response.json()
-                    error_code = error_data.get('infocode', 'unknown')
-                    error_info = error_data.get('info', 'unknown')
-                    print(f"❌ 获取地图失败:")
-                    print(f"   错误码: {error_code}")
-                    print(f"   错误信息: {error_info}")
-                    print(f"   完整响应: {response.text}")
-                    
-                    # 根据错误码提供解决建议
-                    if error_code == "20003":
-                        print(f"💡 错误码20003解决建议:")
-                        print(f"   1. 检查API密钥是否正确")
-                        print(f"   2. 检查请求参数是否符合规范")
-                        print(f"   3. 尝试简化边界坐标或禁用边界显示")
-                        print(f"   4. 检查网络连接")
-                except:
-                    print(f"❌ 获取地图失败: {response.text}")
+                self._report_static_map_error(response)
                 return None
                 
         except requests.RequestException as e:
             print(f"❌ 网络请求失败: {e}")
             return None
     
-    def _download_single_tile(self, center, zoom_level, map_style="normal", traffic=False, labels=True, scale=None):
+    def refresh_index(self, directory):
+        """
+        获取输出目录的内容索引（增量刷新模式使用，每个目录一个）
+        """
+        directory = os.path.abspath(directory)
+        with self._refresh_lock:
+            index = self._refresh_indexes.get(directory)
+            if index is None:
+                index = self._refresh_indexes[directory] = RefreshIndex(directory)
+            return index
+    
+    def save_refresh_indexes(self):
+        """
+        保存增量刷新的内容索引，并在各输出目录写入本次运行的变更列表（changes.json）
+        :return: dict {变更列表路径: {'added', 'changed', 'unchanged'}}
+        """
+        with self._refresh_lock:
+            indexes = list(self._refresh_indexes.values())
+        return dict(index.save() for index in indexes)
+    
+    def _download_static_map(self, params, filepath):
+        """
+        按请求参数下载静态地图并流式写入文件（分块写入临时文件，同时计算字节数与SHA-256，完成后原子重命名）
+
+        图片不会整体读入内存，并发下载多张大图时内存占用保持平稳；
+        响应不是图片（JSON错误）时不写入任何文件。图片缓存命中时直接硬链接/复制到输出路径。
+
+        增量刷新模式下总是向服务端确认（不读取图片缓存）：上一次响应带有ETag/Last-Modified时发送条件请求，
+        返回304或下载内容与索引记录的SHA-256相同时保留原文件不动，结果的 change 为 'unchanged'。
+        :param params: 静态地图请求参数
+        :param filepath: 输出文件路径
+        :return: dict {'filepath', 'bytes', 'sha256', 'cached', 'change'}（缓存命中时sha256为None；
+                 change 为 'added'/'changed'/'unchanged'，未启用增量刷新时为None），失败时返回None
+        """
+        index = self.refresh_index(os.path.dirname(filepath)) if self.refresh else None
+        entry, same_request = index.lookup(filepath, params) if index else (None, False)
+        if self.image_cache and index is None:
+            hit = self.image_cache.materialize(params, filepath)
+            self.metrics.record_cache('image', hit)
+            if hit:
+                return {'filepath': filepath, 'bytes': os.path.getsize(filepath), 'sha256': None, 'cached': True,
+                        'change': None}
+        
+        if not self._check_static_map_url(params):
+            return None
+        
+        # 请求参数与上一次相同时才使用校验器（参数变化时服务端的ETag不对应同一张图片）
+        headers = RefreshIndex.conditional_headers(entry) if entry and same_request else None
+        try:
+            response = self.transport.get(self.static_map_url, params=params, endpoint='staticmap', stream=True,
+                                          headers=headers)
+            # 流式响应需显式关闭才会把连接归还连接池
+            with response:
+                self._log(f"HTTP状态码: {response.status_code}")
+                self._log(f"响应头Content-Type: {response.headers.get('content-type', 'unknown')}")
+                
+                if response.status_code == 304 and headers:
+                    self._log(f"♻️  内容未变化 (304): {os.path.basename(filepath)}")
+                    index.record(filepath, params, entry['sha256'], entry['bytes'], 'unchanged')
+                    return {'filepath': filepath, 'bytes': entry['bytes'], 'sha256': entry['sha256'],
+                            'cached': False, 'change': 'unchanged'}
+                response.raise_for_status()
+                
+                # 根据响应头判断是否为图片，错误信息（JSON）体积很小，可直接读取
+                if not response.headers.get('content-type', '').startswith('image'):
+                    self._report_static_map_error(response)
+                    return None
+                
+                expected = response.headers.get('content-length')
+                chunk_size = AMAP_CONFIG.get('stream_chunk_size', 64 * 1024)
+                with AtomicFile(filepath) as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        # 取消时在数据块之间中止，临时文件随之删除
+                        if self.transport.cancelled:
+                            raise RequestCancelled("下载已取消")
+                        f.write(chunk)
+                    # 连接中途断开时响应体可能不完整，不提交
+                    if expected and expected.isdigit() and f.size != int(expected):
+                        raise requests.exceptions.ChunkedEncodingError(
+                            f"响应体不完整: {f.size}/{expected} 字节")
+                    # 与上一次下载的内容相同：不替换文件，修改时间保持不变
+                    if entry and f.digest() == entry['sha256']:
+                        f.discard()
+                etag, last_modified = response.headers.get('etag'), response.headers.get('last-modified')
+        except requests.RequestException as e:
+            print(f"❌ 网络请求失败: {e}")
+            return None
+        
+        change = None
+        if index:
+            change = 'unchanged' if entry and f.sha256 == entry['sha256'] else ('changed' if entry else 'added')
+            index.record(filepath, params, f.sha256, f.size, change, etag, last_modified)
+            if change == 'unchanged':
+                self._log(f"♻️  内容未变化: {os.path.basename(filepath)}")
+                return {'filepath': filepath, 'bytes': f.size, 'sha256': f.sha256, 'cached': False,
+                        'change': change}
+        
+        self._log(f"✅ 成功获取地图图片，大小: {f.size} 字节")
+        if self.image_cache:
+            self.image_cache.put_file(params, filepath)
+        return {'filepath': filepath, 'bytes': f.size, 'sha256': f.sha256, 'cached': False, 'change': change}
+    
+    def _download_single_tile(self, center, zoom_level, map_style="normal", traffic=False, labels=True, scale=None,
+                              size="1024*1024"):
         """
         下载单个瓦片
         
@@ -298,6 +641,7 @@ class AmapDownloader:
             traffic: 是否显示交通信息
             labels: 是否显示标签
             scale: 图片清晰度 (1=普通, 2=高清)
+            size: 瓦片尺寸 "宽*高"
             
         Returns:
             bytes: 图片二进制数据，失败时返回None
@@ -311,13 +655,129 @@ class AmapDownloader:
         return self.get_static_map(
             center=center_str,
             zoom=zoom_level,
-            size="1024*1024",
+            size=size,
             map_style=map_style,
             traffic=traffic,
             labels=labels,
             scale=scale
         )
     
+    def download_district_mosaic(self, district_name, output_dir="./maps", zoom=16, tile_size="1024*1024",
+                                 map_style="normal", traffic=False, labels=True, scale=None,
+                                 stitch_backend='auto', prune=True, prune_buffer_px=None):
+        """
+        瓦片拼接模式：按Web墨卡托像素网格下载覆盖区域范围的多个瓦片并拼接为一张大图
+        适合高缩放级别（16-18级）下单张静态地图无法覆盖整个区域的情况
+        
+        :param district_name: 行政区域名称
+        :param output_dir: 输出目录
+        :param zoom: 缩放级别
+        :param tile_size: 单个瓦片尺寸（静态地图API单次请求尺寸，最大1024*1024）
+        :param map_style: 地图样式
+        :param traffic: 是否显示交通
+        :param labels: 是否显示标注
+        :param scale: 图片清晰度 (1=普通, 2=高清)
+        :param stitch_backend: 拼接方式 'pil'（内存，输出PNG）、'memmap'（磁盘映射，输出分块BigTIFF，
+                               内存占用恒定）或 'auto'（按像素数自动选择）
+        :param prune: 是否跳过与区域边界多边形不相交的瓦片（区域外部分留空）
+        :param prune_buffer_px: 判断相交时边界向外扩展的像素数，None时使用配置 tile_prune_buffer_px
+        :return: 下载结果信息
+        """
+        print(f"🧩 开始下载 {district_name} 的地图（瓦片拼接模式，级别 {zoom}）...")
+        from amap_geometry import parse_polyline, tile_intersection_mask
+        from amap_tiles import plan_tile_grid, choose_canvas, MemmapCanvas, grid_georef, georef_transform, \
+            write_world_file
+        
+        district_info = self.search_district(district_name)
+        if not district_info:
+            return {"success": False, "error": f"未找到区域: {district_name}"}
+        
+        boundary_analysis = self.analyze_boundary(district_info.get('polyline', ''))
+        if not boundary_analysis:
+            return {"success": False, "error": f"区域 {district_name} 没有可用的边界数据"}
+        
+        grid = plan_tile_grid(boundary_analysis['bounds'], zoom, tile_size)
+        print(f"📐 瓦片网格: {grid['cols']} 列 × {grid['rows']} 行，共 {len(grid['tiles'])} 个瓦片")
+        
+        # 跳过完全位于区域多边形（含缓冲）之外的瓦片，节省配额
+        tiles = grid['tiles']
+        if prune:
+            if prune_buffer_px is None:
+                prune_buffer_px = AMAP_CONFIG.get('tile_prune_buffer_px', 32)
+            mask = tile_intersection_mask(grid, parse_polyline(district_info['polyline']).rings, prune_buffer_px)
+            tiles = [tile for tile in tiles if mask[tile['row'], tile['col']]]
+        skipped = len(grid['tiles']) - len(tiles)
+        total = len(tiles)
+        if skipped:
+            print(f"✂️  跳过 {skipped} 个区域外瓦片，节省 {skipped} 次请求")
+        
+        if scale is None:
+            scale = self.default_scale
+        
+        os.makedirs(output_dir, exist_ok=True)
+        # 磁盘映射画布的缓冲文件与输出文件放在同一目录（保存时的概览图层缓冲同样如此），
+        # 不占用可能是内存盘的系统临时目录；画布关闭时删除
+        filename = f"{district_name}_Z{zoom}_拼接"
+        canvas = choose_canvas(grid, scale, stitch_backend,
+                               AMAP_CONFIG.get('mosaic_memmap_threshold_mp', 64) * 1000000,
+                               buffer_path=temp_path(os.path.join(output_dir, f"{filename}.canvas")))
+        geotiff = isinstance(canvas, MemmapCanvas) or self.georef_output == 'geotiff'
+        filename += '.tif' if geotiff else '.png'
+        filepath = os.path.join(output_dir, filename)
+        
+        def fetch_and_paste(tile):
+            # 瓦片到达后立即解码写入画布并释放，不在内存中累积瓦片数据
+            data = self._download_single_tile(tile['center'], zoom, map_style, traffic, labels, scale, tile_size)
+            if not data:
+                return False
+            canvas.paste(tile['row'], tile['col'], data)
+            return True
+        
+        # 并发下载瓦片（并发数受max_concurrency限制，速率受限流器控制）
+        failed = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                futures = {executor.submit(fetch_and_paste, tile): (tile['row'], tile['col'])
+                           for tile in tiles}
+                for future in as_completed(futures):
+                    if not future.result():
+                        failed.append(futures[future])
+            
+            if failed:
+                return {"success": False, "error": f"{len(failed)}/{total} 个瓦片下载失败", "failed_tiles": sorted(failed)}
+            
+            # 先保存到临时文件再重命名，中断时不会留下不完整的拼接图；
+            # TIFF输出写入Web墨卡托地理参考与概览图层
+            georef = grid_georef(grid, scale)
+            tmp_path = temp_path(filepath)
+            try:
+                image_size = canvas.save(tmp_path, georef_transform(georef), self.geotiff_overviews)
+                os.replace(tmp_path, filepath)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            if not geotiff and self.georef_output == 'world':
+                write_world_file(filepath, georef)
+        except Exception as e:
+            return {"success": False, "error": f"瓦片拼接失败: {str(e)}"}
+        finally:
+            canvas.close()
+        
+        file_size = os.path.getsize(filepath) / 1024 / 1024  # MB
+        print(f"✅ 拼接完成: {filename} ({image_size[0]}×{image_size[1]}像素, {file_size:.2f} MB)")
+        
+        return {
+            "success": True,
+            "filepath": filepath,
+            "file_size_mb": file_size,
+            "image_size": image_size,
+            "tiles": total,
+            "skipped_tiles": skipped,
+            "grid": {k: v for k, v in grid.items() if k != 'tiles'},
+            "georef": georef,
+            "boundary_analysis": boundary_analysis
+        }
+    
     def download_district_map_single(self, district_name, output_dir="./maps", 
                                    map_style="normal", traffic=False, labels=True, 
                                    boundary_simplify_step=2, max_size="2048*2048", scale=None):
@@ -330,7 +790,7 @@ class AmapDownloader:
         :param map_style: 地图样式
         :param traffic: 是否显示交通
         :param labels: 是否显示标注
-        :param boundary_simplify_step: 边界简化步长
+        :param boundary_simplify_step: 边界坐标最小简化间隔
         :param max_size: 最大图片尺寸（高德API最大支持2048*2048）
         :return: 下载结果信息
         """
@@ -352,49 +812,43 @@ class AmapDownloader:
             return {"success": False, "error": "边界数据分析失败"}
         
         # 简化边界坐标以避免URL过长
-        simplified_coords = self._simplify_boundary_coords(polyline, boundary_simplify_step)
-        if not simplified_coords:
+        boundary_path = self._boundary_paths(polyline, self._static_map_params(size=max_size, scale=scale),
+                                             boundary_simplify_step, path_style="5,0x0066FF,1,")
+        if not boundary_path:
             return {"success": False, "error": "边界坐标简化失败"}
         
-        # 构建边界路径参数
-        boundary_path = f"5,0x0066FF,1,:{simplified_coords}"
-        
         # 创建输出目录
         os.makedirs(output_dir, exist_ok=True)
         
         # 下载地图图片
-        print(f"📍 区域中心: ({boundary_analysis['center']['lng']:.6f}, {boundary_analysis['center']['lat']:.6f})")
-        print(f"📏 区域范围: {boundary_analysis['lng_span']:.4f}° × {boundary_analysis['lat_span']:.4f}°")
+        print(f"📍 区域中心: {boundary_analysis['center']}")
+        print(f"📏 区域范围: {boundary_analysis['span']['lng_span']:.4f}° × {boundary_analysis['span']['lat_span']:.4f}°")
         print(f"🎯 使用边界路径直接下载，图片尺寸: {max_size}")
         
-        # 调用静态地图API
-        image_data = self.get_static_map(
-            size=max_size,
-            paths=boundary_path,
-            map_style=map_style,
-            scale=scale
-        )
-        
-        if image_data is None:
-            return {"success": False, "error": "地图图片下载失败"}
-        
-        # 保存图片
+        # 调用静态地图API，图片流式写入文件
         filename = f"{district_name}_单张.png"
         filepath = os.path.join(output_dir, filename)
         
         try:
-            with open(filepath, 'wb') as f:
-                f.write(image_data)
+            result = self._download_static_map(
+                self._static_map_params(size=max_size, paths=boundary_path, scale=scale), filepath)
             
-            file_size = len(image_data) / 1024 / 1024  # MB
-            print(f"✅ 地图下载完成!")
+            if result is None:
+                return {"success": False, "error": "地图图片下载失败"}
+            
+            file_size = result['bytes'] / 1024 / 1024  # MB
+            print(f"✅ 地图下载完成!" if result['change'] != 'unchanged' else "♻️  地图内容未变化，保留原文件")
             print(f"📁 保存路径: {filepath}")
             print(f"📊 文件大小: {file_size:.2f} MB")
+            if self.refresh:
+                self.save_refresh_indexes()
             
             return {
                 "success": True,
                 "filepath": filepath,
                 "file_size_mb": file_size,
+                "sha256": result['sha256'],
+                "change": result['change'],
                 "boundary_analysis": boundary_analysis,
                 "district_info": district_info
             }
@@ -402,30 +856,49 @@ class AmapDownloader:
         except Exception as e:
             return {"success": False, "error": f"保存文件失败: {str(e)}"}
     
-    def _simplify_boundary_coords(self, polyline, step=2):
+    def _boundary_paths(self, polyline, base_params, simplify_step=2, path_style="5,0x0066FF,1,,"):
         """
-        简化边界坐标以避免URL过长
+        生成使完整请求URL不超过长度上限的边界paths参数
+        
+        坐标先舍入到配置的小数位数（boundary_coord_precision）并去掉舍入后重复的连续点，
+        再用Douglas-Peucker保形状简化，对保留点数做二分查找，按编码后的实际URL长度
+        选出上限（max_url_length）内最精细的边界；每个环闭合，多个环各自作为一条路径，以'|'分隔
+        
         :param polyline: 原始边界坐标字符串
-        :param step: 简化步长，每step个点取一个
-        :return: 简化后的坐标字符串
+        :param base_params: 除paths外的静态地图请求参数（用于计算URL的精确长度）
+        :param simplify_step: 最小简化间隔，保留的点数不超过原始点数的1/simplify_step
+        :param path_style: 路径样式 weight,color,transparency,fillcolor,fillTransparency
+        :return: paths参数字符串，无法在长度上限内显示边界时返回None
         """
-        if not polyline:
-            return None
-            
-        coords_list = polyline.split(';')
-        if len(coords_list) < 3:
+        from amap_geometry import parse_polyline, quantize_boundary, format_coords, BoundarySimplifier
+        precision = AMAP_CONFIG.get('boundary_coord_precision', 5)
+        max_url_length = AMAP_CONFIG.get('max_url_length', 8192)
+        original = parse_polyline(polyline)
+        boundary = quantize_boundary(original, precision)
+        if not len(boundary):
             return None
         
-        # 按步长简化坐标点
-        simplified_coords = []
-        for i in range(0, len(coords_list), step):
-            simplified_coords.append(coords_list[i])
+        # 其他参数固定不变，只需计算一次；paths参数编码后追加 '&paths=' 及其值
+        base_length = len(encoded_url(self.static_map_url, base_params)) + len('&paths=')
+        
+        def build(rings):
+            return '|'.join(f"{path_style}:{format_coords(ring, precision, trim=True)}" for ring in rings)
         
-        # 确保闭合（添加第一个点作为最后一个点）
-        if simplified_coords and simplified_coords[-1] != simplified_coords[0]:
-            simplified_coords.append(simplified_coords[0])
+        def measure(rings):
+            return base_length + encoded_param_length(build(rings))
+        
+        # 每个坐标点编码后至少占8个字符，超出该数量的点不可能放进URL，无需参与排序
+        max_points = min(len(boundary) // max(1, simplify_step), max_url_length // 8)
+        rings, _ = BoundarySimplifier(boundary, max_points).fit(measure, max_url_length)
+        if rings is None:
+            return None
         
-        return ';'.join(simplified_coords)
+        paths = build(rings)
+        point_count = sum(len(ring) for ring in rings)
+        self._log(f"✅ 已获取边界路径数据，原始 {len(original)} 个点，简化为 {point_count} 个点（精度{precision}位小数）")
+        self._log(f"Paths参数长度: {len(paths)}")
+        self._log(f"URL长度: {measure(rings)}")
+        return paths
 
     def download_district(self, district_name, output_dir="./maps", zoom_levels=None, 
                          map_style="normal", traffic=False, labels=True, show_boundary=True, 
@@ -449,162 +922,343 @@ class AmapDownloader:
         :param traffic: 是否显示实时交通
         :param labels: 是否显示地名标注
         :param show_boundary: 是否显示区域边界（红色边框线）
-        :param boundary_simplify_step: 边界坐标简化间隔，2表示每隔1个点取1个，3表示每隔2个点取1个
+        :param boundary_simplify_step: 边界坐标最小简化间隔，2表示最多保留1/2的点，3表示最多保留1/3的点
         :param scale: 图片清晰度 (1=普通, 2=高清)
         :return: 保存的文件路径
         """
-        print(f"正在搜索 {district_name} 的区域信息...")
+        plan = self.plan_district(district_name, zoom_levels, show_boundary, boundary_simplify_step)
+        if plan is None:
+            return None
+        
+        # 创建输出目录
+        os.makedirs(output_dir, exist_ok=True)
         
+        # 下载地图 - 支持多级别缩放
+        saved_files = []
+        for zoom in plan['zoom_levels']:
+            filepath = self.download_zoom(plan, zoom, output_dir, map_style, traffic, labels, scale)
+            if filepath:
+                saved_files.append(filepath)
+        
+        # 增量刷新：保存内容索引并更新变更列表
+        if self.refresh:
+            self.save_refresh_indexes()
+        return saved_files
+    
+    def plan_district(self, district_name, zoom_levels=None, show_boundary=True, boundary_simplify_step=2,
+                      district_info=None):
+        """
+        准备区域下载计划：搜索区域、分析边界、生成边界路径参数并确定缩放级别
+        （download_district_map 与异步下载器共用）
+        :param district_name: 行政区域名称
+        :param zoom_levels: 缩放级别列表或单个整数，None时使用边界分析推荐或默认配置
+        :param show_boundary: 是否显示区域边界
+        :param boundary_simplify_step: 边界坐标最小简化间隔
+        :param district_info: 已查询到的区域信息（如 fetch_districts 的结果），提供时不再查询
+        :return: dict包含district_name, district_info, boundary_analysis, paths, zoom_levels；未找到区域时返回None
+        """
         # 搜索区域信息
-        district_info = self.search_district(district_name)
+        if district_info is None:
+            self._log(f"正在搜索 {district_name} 的区域信息...")
+            district_info = self.search_district(district_name)
         if not district_info:
             print(f"未找到 {district_name} 的信息")
             return None
         
-        print(f"找到区域: {district_info['name']}")
-        print(f"行政代码: {district_info['adcode']}")
-        print(f"中心坐标: {district_info['center']}")
+        self._log(f"找到区域: {district_info['name']}")
+        self._log(f"行政代码: {district_info['adcode']}")
+        self._log(f"中心坐标: {district_info['center']}")
         
         # 分析区域边界
         boundary_analysis = None
         if 'polyline' in district_info and district_info['polyline']:
             boundary_analysis = self.analyze_boundary(district_info['polyline'])
             if boundary_analysis:
-                print(f"📊 边界分析结果:")
-                print(f"   几何中心: {boundary_analysis['center']}")
-                print(f"   区域跨度: {boundary_analysis['span']['max_distance_km']:.2f} 公里")
-                print(f"   边界复杂度: {boundary_analysis['boundary_complexity']} 个坐标点")
-                print(f"   推荐缩放级别: {boundary_analysis['optimal_zoom']}")
-                print(f"   推荐地图尺寸: {boundary_analysis['recommended_size']}")
+                self._log(f"📊 边界分析结果:")
+                self._log(f"   几何中心: {boundary_analysis['center']}")
+                self._log(f"   区域跨度: {boundary_analysis['span']['max_distance_km']:.2f} 公里")
+                self._log(f"   边界复杂度: {boundary_analysis['boundary_complexity']} 个坐标点")
+                self._log(f"   推荐缩放级别: {boundary_analysis['optimal_zoom']}")
+                self._log(f"   推荐地图尺寸: {boundary_analysis['recommended_size']}")
                 
                 # 如果没有指定缩放级别，使用分析推荐的级别
                 if zoom_levels is None:
                     zoom_levels = boundary_analysis['optimal_zoom']
-                    print(f"🎯 使用智能推荐的缩放级别: {zoom_levels}")
+                    self._log(f"🎯 使用智能推荐的缩放级别: {zoom_levels}")
         
-        # 创建输出目录
-        os.makedirs(output_dir, exist_ok=True)
+        # 使用传入的缩放级别，如果没有传入则使用默认配置
+        if zoom_levels is None:
+            zoom_levels = AMAP_CONFIG['default_zoom_levels']
+        elif isinstance(zoom_levels, int):
+            zoom_levels = [zoom_levels]  # 将单个整数转换为列表
         
         # 获取边界路径数据
         paths = None
         
         if show_boundary and 'polyline' in district_info and district_info['polyline']:
             # 高德地图静态地图API的paths参数格式
-            # 由于URL长度限制，需要简化边界坐标
-            boundary_coords = district_info['polyline']
-            coords_list = boundary_coords.split(';')
-            
-            # 动态调整简化间隔以确保URL长度合理
-            current_step = boundary_simplify_step
-            max_url_length = 2000  # 更严格的URL长度限制，确保API能正常处理
-            
-            while current_step <= 20:  # 最大间隔限制
-                # 根据当前间隔简化坐标点
-                simplified_coords = coords_list[::current_step]
-                
-                # 确保形成完整闭环：最后一个点与首个点一致
-                if simplified_coords and simplified_coords[-1] != simplified_coords[0]:
-                    simplified_coords.append(simplified_coords[0])
-                
-                # 构建paths参数进行长度检查
-                if simplified_coords:
-                    # 高德地图API paths格式: weight,color,transparency,fillcolor,fillTransparency
-                    path_style = "5,0x0066FF,1,,"  # 5像素宽度，蓝色边框，不透明，无填充
-                    path_coords = ';'.join(simplified_coords)
-                    paths = f"{path_style}:{path_coords}"
-                    
-                    # 估算完整URL长度（包括基础参数）
-                    estimated_url_length = len(self.static_map_url) + len(paths) + 200  # 200为其他参数预留
-                    
-                    if estimated_url_length <= max_url_length:
-                        print(f"✅ 已获取边界路径数据，原始 {len(coords_list)} 个点，简化为 {len(simplified_coords)} 个点（间隔={current_step}）")
-                        print(f"Paths参数长度: {len(paths)}")
-                        print(f"预估URL长度: {estimated_url_length}")
-                        break
-                    else:
-                        print(f"⚠️  间隔{current_step}时URL过长({estimated_url_length}字符)，尝试增大间隔...")
-                        current_step += 1
-                        continue
-                else:
-                    break
+            # 由于URL长度限制，需要简化边界坐标：按各级别中最长的请求参数计算URL长度
+            if boundary_analysis:
+                map_center, map_size = boundary_analysis['center'], boundary_analysis['recommended_size']
+            else:
+                map_center, map_size = district_info['center'], AMAP_CONFIG['default_map_size']
+            base_params = self._static_map_params(center=map_center, zoom=max(zoom_levels, default=None), size=map_size)
+            # 路径样式：5像素宽度，蓝色边框，不透明，无填充
+            paths = self._boundary_paths(district_info['polyline'], base_params, boundary_simplify_step,
+                                         path_style="5,0x0066FF,1,,")
             
-            # 如果即使最大间隔也无法满足长度要求，则禁用边界显示
-            if current_step > 20:
+            # 如果即使最大程度简化也无法满足长度要求，则禁用边界显示
+            if paths is None:
                 print(f"❌ 边界坐标过于复杂，无法在URL长度限制内显示，将禁用边界显示")
-                paths = None
         elif not show_boundary:
-            print("🔲 边界显示已关闭，将显示无边框地图")
+            self._log("🔲 边界显示已关闭，将显示无边框地图")
         else:
             print("⚠️  未找到边界路径数据，将显示无边框地图")
         
-        # 下载地图 - 支持多级别缩放
-        saved_files = []
-        # 使用传入的缩放级别，如果没有传入则使用默认配置
-        if zoom_levels is None:
-            zoom_levels = AMAP_CONFIG['default_zoom_levels']
-        elif isinstance(zoom_levels, int):
-            zoom_levels = [zoom_levels]  # 将单个整数转换为列表
+        self._log(f"使用缩放级别: {zoom_levels}")
         
-        print(f"使用缩放级别: {zoom_levels}")
+        return {
+            'district_name': district_name,
+            'district_info': district_info,
+            'boundary_analysis': boundary_analysis,
+            'paths': paths,
+            'zoom_levels': list(zoom_levels)
+        }
+    
+    def download_zoom(self, plan, zoom, output_dir="./maps", map_style="normal", traffic=False, 
+                      labels=True, scale=None):
+        """
+        按下载计划下载并保存单个缩放级别的地图
+        :param plan: plan_district 返回的下载计划
+        :param zoom: 缩放级别
+        :param output_dir: 输出目录（需已存在）
+        :param map_style: 地图样式
+        :param traffic: 是否显示实时交通
+        :param labels: 是否显示地名标注
+        :param scale: 图片清晰度 (1=普通, 2=高清)
+        :return: 保存的文件路径，失败时返回None
+        """
+        result = self.download_zoom_unit(plan, zoom, output_dir, map_style, traffic, labels, scale)
+        return result['filepath'] if result else None
+    
+    def download_zoom_unit(self, plan, zoom, output_dir="./maps", map_style="normal", traffic=False, 
+                           labels=True, scale=None):
+        """
+        同 download_zoom，返回保存结果（含流式写入时计算的字节数与SHA-256，供任务日志直接使用）
+        :return: dict {'filepath', 'bytes', 'sha256', 'cached', 'change', 'georef'}，失败时返回None
+                 （georef 为图片的地理参考，见 amap_tiles.static_map_georef，瓦片导出时使用；
+                 change 见 _download_static_map，内容未变化时不重新生成地理参考文件，也不提交图片处理）
+        """
+        zoom_desc = ZOOM_LEVELS.get(zoom, f"级别{zoom}")
+        self._log(f"正在下载缩放级别 {zoom} ({zoom_desc}) 的地图...")
         
-        for zoom in zoom_levels:
-            zoom_desc = ZOOM_LEVELS.get(zoom, f"级别{zoom}")
-            print(f"正在下载缩放级别 {zoom} ({zoom_desc}) 的地图...")
-            
-            # 确定最佳中心点和地图尺寸
-            if boundary_analysis:
-                # 使用边界分析得到的几何中心点，通常比行政中心更适合
-                map_center = boundary_analysis['center']
-                map_size = boundary_analysis['recommended_size']
-                print(f"   使用几何中心: {map_center}")
-                print(f"   使用推荐尺寸: {map_size}")
-            else:
-                # 回退到默认设置
-                map_center = district_info['center']
-                map_size = AMAP_CONFIG['default_map_size']
-                print(f"   使用行政中心: {map_center}")
-                print(f"   使用默认尺寸: {map_size}")
-            
-            # 单张地图模式
-            map_data = self.get_static_map(
-                center=map_center,
-                zoom=zoom,
-                size=map_size,
-                paths=paths,  # 保留边界显示
-                map_style=map_style,
-                traffic=traffic,
-                labels=labels,
-                scale=scale
-            )
-            
-            if map_data:
-                # 保存图片
-                style_suffix = ""
-                if map_style != "normal":
-                    style_suffix += f"_{map_style}"
-                if traffic:
-                    style_suffix += "_交通"
-                if not labels:
-                    style_suffix += "_无标注"
-                
-                filename = f"{district_name}_Z{zoom}{style_suffix}.png"
-                filepath = os.path.join(output_dir, filename)
-                
-                with open(filepath, 'wb') as f:
-                    f.write(map_data)
-                
-                file_size_mb = len(map_data) / (1024 * 1024)  # MB
-                print(f"✅ {filename} ({file_size_mb:.1f}MB)")
-                saved_files.append(filepath)
-                
-                # 避免请求过于频繁
-                time.sleep(AMAP_CONFIG['request_delay'])
+        # 确定最佳中心点和地图尺寸
+        boundary_analysis = plan['boundary_analysis']
+        if boundary_analysis:
+            # 使用边界分析得到的几何中心点，通常比行政中心更适合
+            map_center = boundary_analysis['center']
+            map_size = boundary_analysis['recommended_size']
+            self._log(f"   使用几何中心: {map_center}")
+            self._log(f"   使用推荐尺寸: {map_size}")
+        else:
+            # 回退到默认设置
+            map_center = plan['district_info']['center']
+            map_size = AMAP_CONFIG['default_map_size']
+            self._log(f"   使用行政中心: {map_center}")
+            self._log(f"   使用默认尺寸: {map_size}")
+        
+        filename = self.map_filename(plan['district_name'], zoom, map_style, traffic, labels)
+        filepath = os.path.join(output_dir, filename)
+        
+        # 单张地图模式（保留边界显示）
+        params = self._static_map_params(center=map_center, zoom=zoom, size=map_size,
+                                         paths=plan['paths'], scale=scale)
+        
+        # 流式写入临时文件后原子重命名，中断时不会留下不完整的文件，
+        # 也不会改写与图片缓存共享的硬链接；缓存命中时直接硬链接/复制到输出目录
+        result = self._download_static_map(params, filepath)
+        if not result:
+            print(f"❌ 缩放级别 {zoom} 的地图下载失败")
+            return None
+        
+        from amap_tiles import static_map_georef
+        result['georef'] = static_map_georef(map_center, zoom, map_size, scale or self.default_scale)
+        unchanged = result['change'] == 'unchanged'
+        if self.georef_output:
+            existing = self.georef_output_paths(filepath)
+            if unchanged and all(os.path.exists(path) for path in existing):
+                result['georef_files'] = existing
             else:
-                print(f"❌ 缩放级别 {zoom} 的地图下载失败")
+                result['georef_files'] = self.write_georef_outputs(filepath, result['georef'])
+        if unchanged:
+            self._log(f"♻️  {filename} (未变化)")
+            return result
+        if result['cached']:
+            self._log(f"📦 {filename} (来自图片缓存)")
+        else:
+            file_size_mb = result['bytes'] / (1024 * 1024)  # MB
+            self._log(f"✅ {filename} ({file_size_mb:.1f}MB)")
         
-        return saved_files
+        # 提交图片处理后立即返回，编码在工作进程中与后续下载同时进行
+        if self.postprocessor:
+            result['postprocess'] = self.postprocessor.submit(filepath)
+        return result
+    
+    def georef_output_paths(self, filepath, mode=None):
+        """
+        图片对应的地理参考文件路径（见 write_georef_outputs）
+        """
+        from amap_tiles import world_file_paths
+        mode = mode or self.georef_output
+        if mode == 'world':
+            return world_file_paths(filepath)
+        if mode == 'geotiff':
+            return [os.path.splitext(filepath)[0] + '.tif']
+        raise ValueError(f"未知的地理参考输出方式: {mode}")
+    
+    def write_georef_outputs(self, filepath, georef, mode=None):
+        """
+        为下载的图片写入地理参考文件（Web墨卡托 EPSG:3857，高德图片为GCJ-02坐标系）
+        :param filepath: 图片路径
+        :param georef: 图片的地理参考（见 amap_tiles.static_map_georef）
+        :param mode: 'world'（同名 .pgw 与 .prj）或 'geotiff'（同名 .tif，分块压缩并带概览图层），
+                     None时使用配置 georef_output
+        :return: 写入的文件路径列表
+        """
+        from amap_tiles import georef_transform, write_world_file
+        mode = mode or self.georef_output
+        if mode == 'world':
+            return write_world_file(filepath, georef)
+        if mode == 'geotiff':
+            import numpy as np
+            from PIL import Image
+            from amap_tiff import write_geotiff
+            tif_path = os.path.splitext(filepath)[0] + '.tif'
+            with Image.open(filepath) as image:
+                array = np.asarray(image.convert('RGB'))
+            tmp_path = temp_path(tif_path)
+            try:
+                write_geotiff(tmp_path, array, georef_transform(georef), self.geotiff_overviews)
+                os.replace(tmp_path, tif_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            return [tif_path]
+        raise ValueError(f"未知的地理参考输出方式: {mode}")
+    
+    def map_filename(self, district_name, zoom, map_style="normal", traffic=False, labels=True):
+        """
+        生成地图文件名，如 吉州区_Z12.png、吉州区_Z12_satellite_交通.png
+        """
+        style_suffix = ""
+        if map_style != "normal":
+            style_suffix += f"_{map_style}"
+        if traffic:
+            style_suffix += "_交通"
+        if not labels:
+            style_suffix += "_无标注"
+        
+        return f"{district_name}_Z{zoom}{style_suffix}.png"
 
 
+def main(argv=None):
+    """
+    命令行入口
+    
+    示例：
+        python amap_downloader.py 吉州区 --zoom 10 12
+        python amap_downloader.py --batch districts.csv --workers 8 --manifest maps/manifest.json
+        python amap_downloader.py --batch districts.csv --resume
+        python amap_downloader.py 江西省 --hierarchy 2 --levels district --zoom 12
+        python amap_downloader.py 吉州区 --zoom 12 14 --export-mbtiles maps/吉州区.mbtiles
+    """
+    parser = argparse.ArgumentParser(description="高德地图区域范围图片下载器")
+    parser.add_argument('districts', nargs='*', default=['吉州区'], help="行政区域名称或行政代码（默认: 吉州区）")
+    parser.add_argument('--batch', help="批量任务文件（CSV或JSON），每行一个区域，可单独指定zoom/map_style/scale")
+    parser.add_argument('--output-dir', help="输出目录（默认使用配置 default_output_dir，未配置时为 ./maps）")
+    parser.add_argument('--zoom', type=int, nargs='+', help="缩放级别（默认按边界分析推荐）")
+    parser.add_argument('--style', default='normal', choices=['normal', 'satellite', 'roadmap'], help="地图样式")
+    parser.add_argument('--scale', type=int, choices=[1, 2], help="图片清晰度 (1=普通, 2=高清)")
+    parser.add_argument('--workers', type=int, help="并发数（默认使用配置 max_concurrency）")
+    parser.add_argument('--manifest', help="清单文件路径（默认: 输出目录/manifest.json）")
+    parser.add_argument('--journal', help="任务日志路径（默认: 输出目录/journal.sqlite）")
+    parser.add_argument('--resume', action='store_true', help="续传：跳过任务日志中已完成的下载单元")
+    parser.add_argument('--hierarchy', type=int, choices=[1, 2, 3], metavar='DEPTH',
+                        help="层级模式：下载所给区域及其向下DEPTH级的全部下级区域（如省 -> 市 -> 区县）")
+    parser.add_argument('--levels', nargs='+', choices=['province', 'city', 'district'],
+                        help="层级模式下只下载这些级别的区域")
+    parser.add_argument('--quiet', action='store_true', help="安静模式：不打印每个请求的进度信息")
+    parser.add_argument('--metrics-jsonl', help="将每个请求的指标事件写入JSON Lines文件")
+    parser.add_argument('--metrics-prom', help="运行结束时将指标写入Prometheus文本文件")
+    parser.add_argument('--georef', choices=['world', 'geotiff'],
+                        help="地理参考输出：world（PNG + world file）或 geotiff（另存带概览图层的GeoTIFF）")
+    parser.add_argument('--refresh', action='store_true',
+                        help="增量刷新：内容未变化的图片不重写，并在输出目录写入变更列表 changes.json")
+    parser.add_argument('--export-mbtiles', metavar='PATH',
+                        help="下载完成后将图片切分为XYZ瓦片写入MBTiles（更多选项见 amap_export.py）")
+    args = parser.parse_args(argv)
+    # 解析参数之后才读取配置，--help 与参数错误不加载配置文件
+    if args.output_dir is None:
+        args.output_dir = AMAP_CONFIG.get('default_output_dir', './maps')
+    
+    defaults = {'zoom': args.zoom, 'map_style': args.style, 'scale': args.scale}
+    downloader = AmapDownloader(quiet=args.quiet or None)
+    if args.georef:
+        downloader.georef_output = args.georef
+    if args.refresh:
+        downloader.refresh = True
+    if args.metrics_jsonl:
+        downloader.metrics.add_sink(JsonLinesSink(args.metrics_jsonl))
+    if args.metrics_prom:
+        downloader.metrics.add_sink(PrometheusTextSink(args.metrics_prom))
+    if args.batch:
+        jobs = load_jobs(args.batch, defaults)
+    elif args.hierarchy:
+        jobs = []
+        for name in args.districts:
+            jobs.extend(expand_hierarchy(downloader, name, args.hierarchy, args.levels, defaults))
+    else:
+        jobs = [normalize_job({'district': name}, defaults) for name in args.districts]
+    
+    journal = JobJournal(args.journal or os.path.join(args.output_dir, 'journal.sqlite'))
+    try:
+        runner = BatchRunner(downloader, args.output_dir, args.workers, journal=journal, resume=args.resume)
+        manifest = runner.run(jobs)
+    finally:
+        journal.close()
+        if downloader.postprocessor:
+            downloader.postprocessor.close()
+        if downloader.refresh:
+            changes = downloader.save_refresh_indexes()
+        downloader.metrics.close()
+    manifest_path = args.manifest or os.path.join(args.output_dir, 'manifest.json')
+    write_manifest(manifest, manifest_path)
+    
+    summary = manifest['summary']
+    if summary['resumed']:
+        print(f"⏭️  续传跳过 {summary['resumed']} 个已完成的下载单元")
+    if downloader.refresh:
+        for changes_path, counts in changes.items():
+            print(f"🔄 新增 {counts['added']}，变化 {counts['changed']}，未变化 {counts['unchanged']}；"
+                  f"变更列表: {changes_path}")
+    print(f"🏁 完成 {summary['done']}/{summary['units']} 个下载单元，"
+          f"共 {summary['bytes'] / 1024 / 1024:.2f} MB，耗时 {manifest['elapsed']:.1f} 秒")
+    if args.export_mbtiles and summary['done']:
+        from amap_export import export_manifest, print_dedup_summary
+        stats = export_manifest(manifest, mbtiles=args.export_mbtiles, map_style=args.style,
+                                name=os.path.splitext(os.path.basename(args.export_mbtiles))[0])
+        print(f"🧱 导出 {stats['tiles']} 个瓦片（级别 {stats['min_zoom']}-{stats['max_zoom']}）: {args.export_mbtiles}")
+        print_dedup_summary(stats['dedup'])
+    if summary['postprocessed']:
+        print(f"🖼️  已处理 {summary['postprocessed']} 张图片")
+    if downloader.key_pool:
+        downloader.key_pool.save()
+    print(f"📄 清单: {manifest_path}")
+    return 0 if summary['failed'] == 0 else 1
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # 打包后的可执行文件中，图片处理进程池的工作进程在此处执行任务而不是重新运行命令行
+    import multiprocessing
+    multiprocessing.freeze_support()
+    raise SystemExit(main())
@@ -0,0 +1,683 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+瓦片金字塔导出
+将下载的区域图片（单张地图或拼接图，需带地理参考）按Web墨卡托切分为 z/x/y 的256像素瓦片，
+写入MBTiles（SQLite）或目录树，可由XYZ瓦片服务（Leaflet、OpenLayers、MapLibre等）直接加载。
+图片按行条带读取（分块GeoTIFF只解码所需的行，见 amap_tiff.TiledTiffReader），逐级缩小，
+凑满一行瓦片即在线程池中切分与编码（OpenCV编解码时释放GIL），内存占用与图片大小无关，
+瓦片由主线程按批次在单个事务中写入SQLite。
+内容相同的瓦片（大片水域、空白区域等）按像素指纹去重，只编码、存储一次（见 amap_dedup）
+
+注意：高德地图图片使用GCJ-02坐标系，导出的瓦片与高德自有瓦片对齐，叠加WGS-84底图时会有偏移
+
+用法：
+    python amap_export.py maps/manifest.json --mbtiles maps/吉州区.mbtiles
+    python amap_export.py maps/manifest.json --xyz maps/tiles --min-zoom 8 --format webp
+    python amap_export.py --image maps/吉州区_Z16_拼接.tif --mbtiles maps/吉州区_z16.mbtiles
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sqlite3
+import struct
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from amap_dedup import TileDeduplicator, fingerprint_tiles
+from amap_fileio import temp_path
+from amap_tiff import TiledTiffReader
+from amap_tiles import georef_bounds, read_world_file, transform_georef
+
+TILE_SIZE = 256
+
+# 每次从图片读取的行数（须为偶数，逐级缩小时条带之间没有接缝）
+STRIP_ROWS = 512
+
+# 瓦片格式：{格式: 扩展名}（格式名与MBTiles元数据 format 一致）
+TILE_FORMATS = {
+    'png': '.png',
+    'jpg': '.jpg',
+    'webp': '.webp',
+}
+
+
+def _normalize_format(tile_format):
+    tile_format = 'jpg' if tile_format == 'jpeg' else tile_format
+    if tile_format not in TILE_FORMATS:
+        raise ValueError(f"不支持的瓦片格式: {tile_format}")
+    return tile_format
+
+
+def _encode_params(tile_format, quality):
+    if tile_format == 'jpg':
+        return [cv2.IMWRITE_JPEG_QUALITY, quality]
+    if tile_format == 'webp':
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    return [cv2.IMWRITE_PNG_COMPRESSION, 6]
+
+
+def _encode(tile, tile_format, quality):
+    """编码瓦片；JPEG不支持透明，透明部分填充为白色"""
+    if tile.shape[2] == 4 and tile_format == 'jpg':
+        alpha = tile[:, :, 3:4].astype(np.uint16)
+        tile = ((tile[:, :, :3] * alpha + 255 * (255 - alpha)) // 255).astype(np.uint8)
+    ok, data = cv2.imencode(TILE_FORMATS[tile_format], tile, _encode_params(tile_format, quality))
+    if not ok:
+        raise ValueError(f"瓦片编码失败 ({tile_format})")
+    return data.tobytes()
+
+
+def native_zoom(georef):
+    """图片实际像素对应的瓦片缩放级别（高清图 scale=2 相当于高一级）"""
+    return georef['zoom'] + int(round(math.log2(georef.get('scale', 1))))
+
+
+def sources_from_manifest(manifest, map_style=None):
+    """
+    从批量下载清单中取出可导出的图片（已完成且带地理参考的下载单元）
+    :param manifest: 清单dict或清单文件路径
+    :param map_style: 只导出该样式的图片，None时导出全部
+    :return: 图片列表 [{'path', 'georef', 'group'}]
+    """
+    if isinstance(manifest, str):
+        with open(manifest, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    sources = []
+    for unit in manifest['units']:
+        if unit['status'] != 'done' or not unit.get('georef'):
+            continue
+        if map_style and unit['map_style'] != map_style:
+            continue
+        sources.append({'path': unit['filepath'], 'georef': unit['georef'],
+                        'group': (unit['district'], unit['map_style'])})
+    return sources
+
+
+def _image_size(path):
+    """读取图片宽高（只读取文件头，不解码像素）"""
+    with open(path, 'rb') as f:
+        header = f.read(24)
+    if header[:8] == b'\x89PNG\r\n\x1a\n':
+        return struct.unpack('>II', header[16:24])
+    from PIL import Image
+    with Image.open(path) as image:
+        return image.size
+
+
+def sources_from_images(paths):
+    """
+    从带地理参考的图片（拼接输出的GeoTIFF，或带world file的PNG/JPEG）取出可导出的图片
+    :param paths: 图片路径列表
+    :return: 图片列表 [{'path', 'georef', 'group'}]，每张图片单独一组
+    :raises ValueError: 图片没有地理参考
+    """
+    sources = []
+    for path in paths:
+        transform = None
+        try:
+            with TiledTiffReader(path) as reader:
+                transform, (height, width) = reader.transform, reader.shape[:2]
+        except ValueError:
+            transform = read_world_file(path)
+            if transform is not None:
+                width, height = _image_size(path)
+        if transform is None:
+            raise ValueError(f"图片没有地理参考（GeoTIFF标签或world file）: {path}")
+        sources.append({'path': path, 'georef': transform_georef(transform, width, height), 'group': path})
+    return sources
+
+
+def plan_levels(sources, min_zoom=None, max_zoom=None):
+    """
+    为每个瓦片缩放级别选择来源图片
+
+    同一组（同一区域与样式）有多个缩放级别的图片时，每个瓦片级别使用不低于该级别的最接近的图片
+    缩小得到（保留该级别的标注密度），不会放大图片。
+
+    :return: (列表 [(图片, [瓦片缩放级别...])], 最小级别, 最大级别)
+    """
+    natives = [native_zoom(source['georef']) for source in sources]
+    if not natives:
+        return [], None, None
+    min_zoom = min(natives) if min_zoom is None else min_zoom
+    max_zoom = max(natives) if max_zoom is None else max_zoom
+
+    groups = {}
+    for index, source in enumerate(sources):
+        groups.setdefault(source.get('group', index), []).append((native_zoom(source['georef']), source))
+
+    plan = []
+    for members in groups.values():
+        zooms = {id(source): [] for _, source in members}
+        for zoom in range(min_zoom, max_zoom + 1):
+            candidates = [n for n, _ in members if n >= zoom]
+            if not candidates:
+                continue
+            best = min(candidates)
+            for n, source in members:
+                if n == best:
+                    zooms[id(source)].append(zoom)
+        plan.extend((source, zooms[id(source)]) for _, source in members if zooms[id(source)])
+    return plan, min_zoom, max_zoom
+
+
+def _open_source(path):
+    """
+    打开图片供按行读取
+    :return: (高, 宽, read_rows(top, bottom) -> BGR数组, close)
+    """
+    try:
+        reader = TiledTiffReader(path)
+    except ValueError:
+        reader = None
+    if reader is not None:
+        def read_rows(top, bottom):
+            rows = reader.read_rows(top, bottom)
+            if rows.shape[2] < 3:
+                return np.ascontiguousarray(np.repeat(rows[:, :, :1], 3, axis=2))
+            return np.ascontiguousarray(rows[:, :, 2::-1])
+        return reader.height, reader.width, read_rows, reader.close
+    # 其它格式（PNG/JPEG，单张地图或较小的拼接图）由OpenCV整张读取
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"无法读取图片: {path}")
+    return image.shape[0], image.shape[1], lambda top, bottom: image[top:bottom], lambda: None
+
+
+class _LevelStrips:
+    def __init__(self, zoom, left, top, width, emit):
+        """
+        一个缩放级别的行条带：缓存到凑满一行瓦片时产生切分任务，并将条带缩小为1/2传给下一级
+
+        缩小方式与 amap_tiff.build_overview 相同（奇数行/列复制边缘补齐后按2×2区域平均），
+        各级尺寸为上一级的一半（向上取整）。
+
+        :param zoom: 瓦片缩放级别
+        :param left: 左上角全局像素X
+        :param top: 左上角全局像素Y
+        :param width: 宽（像素）
+        :param emit: 是否切分该级别（否则只作为缩小的中间级别）
+        """
+        self.zoom = zoom
+        self.left = left
+        self.top = top
+        self.width = width
+        self.emit = emit
+        self.child = None
+        self._rows = np.empty((0, width, 3), dtype=np.uint8)
+        self._row = top  # 缓存第一行的全局像素Y
+        self._carry = self._rows
+
+    def push(self, strip, final=False):
+        """
+        追加下一段行（final=True 表示图片结束）
+        :return: 切分任务 [(级别图片, 左, 上, 级别, 瓦片行号)]
+        """
+        jobs = []
+        if self.emit:
+            self._rows = np.concatenate([self._rows, strip]) if len(self._rows) else strip
+            while len(self._rows):
+                ty = self._row // TILE_SIZE
+                end = (ty + 1) * TILE_SIZE - self._row
+                if end > len(self._rows) and not final:
+                    break
+                part, self._rows = self._rows[:end], self._rows[end:]
+                if 0 <= ty < 2 ** self.zoom:
+                    jobs.append((part, self.left, self._row, self.zoom, ty))
+                self._row += len(part)
+        if self.child is not None:
+            rows = np.concatenate([self._carry, strip]) if len(self._carry) else strip
+            keep = len(rows) if final else len(rows) // 2 * 2
+            rows, self._carry = rows[:keep], rows[keep:]
+            if len(rows):
+                pad_rows, pad_cols = len(rows) % 2, self.width % 2
+                if pad_rows or pad_cols:
+                    rows = np.pad(rows, ((0, pad_rows), (0, pad_cols), (0, 0)), mode='edge')
+                rows = cv2.resize(rows, (rows.shape[1] // 2, rows.shape[0] // 2), interpolation=cv2.INTER_AREA)
+                rows = rows.reshape(rows.shape[:2] + (3,))
+            else:
+                rows = np.empty((0, (self.width + 1) // 2, 3), dtype=np.uint8)
+            jobs.extend(self.child.push(rows, final))
+        return jobs
+
+
+def _level_chain(georef, width, zooms):
+    """
+    从图片实际分辨率逐级缩小到最低的瓦片级别
+    :return: 最高一级的 _LevelStrips（其余通过 child 链接）
+    """
+    native = native_zoom(georef)
+    scale = 2.0 ** (native - georef['zoom'])
+    head = parent = None
+    for zoom in range(native, min(zooms) - 1, -1):
+        factor = scale * 2.0 ** (zoom - native)
+        level = _LevelStrips(zoom, int(round(georef['left'] * factor)), int(round(georef['top'] * factor)),
+                             width, zoom in zooms)
+        if parent is None:
+            head = level
+        else:
+            parent.child = level
+        parent = level
+        width = (width + 1) // 2
+    return head
+
+
+def _claim(dedup, tiles):
+    """
+    登记瓦片指纹
+    :return: [(瓦片ID, 是否需要编码)]，未启用去重时为 [(None, True)]
+    """
+    if dedup is None:
+        return [(None, True)] * len(tiles)
+    return [dedup.claim(exact, perceptual) for exact, perceptual in fingerprint_tiles(tiles)]
+
+
+def _cut_row(level, left, top, zoom, ty, tile_format, quality, dedup=None, complete=()):
+    """
+    切分并编码一行瓦片
+    :param dedup: TileDeduplicator，重复内容的完整瓦片不再编码
+    :param complete: 已写入完整瓦片的位置 {(z, x, y)}，这些位置跳过（须在登记指纹之前跳过：
+                     被丢弃的瓦片若是某个瓦片ID的首次登记，引用该ID的瓦片将没有数据）
+    :return: [(z, x, y, 数据, 是否完整, 瓦片ID)]，不完整（图片边缘）的瓦片以带透明通道的PNG返回，待合并；
+             与已登记瓦片重复时数据为None，按瓦片ID引用
+    """
+    height, width = level.shape[:2]
+    world_tiles = 2 ** zoom
+    x0 = max(0, left // TILE_SIZE)
+    x1 = min(world_tiles - 1, (left + width - 1) // TILE_SIZE)
+    tiles, whole = [], []
+    for tx in range(x0, x1 + 1):
+        if (zoom, tx, ty) in complete:
+            continue  # 相邻图片重叠处已有完整瓦片
+        # 瓦片与图片相交的区域（全局像素）
+        gx0, gy0 = max(tx * TILE_SIZE, left), max(ty * TILE_SIZE, top)
+        gx1, gy1 = min((tx + 1) * TILE_SIZE, left + width), min((ty + 1) * TILE_SIZE, top + height)
+        region = level[gy0 - top:gy1 - top, gx0 - left:gx1 - left]
+        if region.shape[:2] == (TILE_SIZE, TILE_SIZE):
+            whole.append((tx, region))
+            continue
+        tile = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        ox, oy = gx0 - tx * TILE_SIZE, gy0 - ty * TILE_SIZE
+        tile[oy:oy + region.shape[0], ox:ox + region.shape[1], :3] = region
+        tile[oy:oy + region.shape[0], ox:ox + region.shape[1], 3] = 255
+        tiles.append((zoom, tx, ty, _encode(tile, 'png', quality), False, None))
+    if whole:
+        claims = _claim(dedup, np.stack([region for _, region in whole]))
+        for (tx, region), (tile_id, new) in zip(whole, claims):
+            data = _encode(region, tile_format, quality) if new else None
+            tiles.append((zoom, tx, ty, data, True, tile_id))
+    return tiles
+
+
+class MBTilesWriter:
+    def __init__(self, path, batch_size=1000):
+        """
+        MBTiles（SQLite）瓦片写入
+
+        写入同目录下的临时数据库，按批次在单个事务中批量插入，close 时原子替换目标文件；
+        瓦片行号按MBTiles规范（TMS）翻转。瓦片数据存于 images 表（按瓦片ID只存一份），
+        map 表记录各位置引用的瓦片ID，tiles 视图供读取端按MBTiles规范查询。
+
+        :param path: 输出文件路径（.mbtiles）
+        :param batch_size: 每个事务写入的瓦片数
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.count = 0
+        self.bytes = 0
+        self._map = []
+        self._images = []
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._tmp_path = temp_path(path)
+        self._db = sqlite3.connect(self._tmp_path)
+        # 临时数据库在完成前不会被使用，关闭日志与同步以加快批量写入
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+        self._db.execute("CREATE TABLE map (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, "
+                         "tile_id TEXT)")
+        self._db.execute("CREATE UNIQUE INDEX map_index ON map (zoom_level, tile_column, tile_row)")
+        self._db.execute("CREATE TABLE images (tile_data BLOB, tile_id TEXT)")
+        self._db.execute("CREATE UNIQUE INDEX images_id ON images (tile_id)")
+        self._db.execute("CREATE VIEW tiles AS SELECT map.zoom_level AS zoom_level, "
+                         "map.tile_column AS tile_column, map.tile_row AS tile_row, images.tile_data AS tile_data "
+                         "FROM map JOIN images ON images.tile_id = map.tile_id")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, zoom, x, y, data, tile_id=None):
+        """
+        写入一个瓦片（XYZ行号）
+        :param data: 瓦片数据，None时引用已写入（或稍后写入）的同ID瓦片
+        :param tile_id: 瓦片ID（内容指纹），None时按位置生成
+        """
+        if tile_id is None:
+            tile_id = f"{zoom}/{x}/{y}"
+        self._map.append((zoom, x, (2 ** zoom - 1) - y, tile_id))
+        if data is not None:
+            self._images.append((sqlite3.Binary(data), tile_id))
+            self.bytes += len(data)
+        self.count += 1
+        if len(self._map) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """在一个事务中写入当前批次"""
+        if not self._map and not self._images:
+            return
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO images VALUES (?, ?)", self._images)
+            self._db.executemany("INSERT OR REPLACE INTO map VALUES (?, ?, ?, ?)", self._map)
+        self._map, self._images = [], []
+
+    def set_metadata(self, metadata):
+        """写入元数据（name、format、bounds、center、minzoom、maxzoom等）"""
+        with self._db:
+            self._db.execute("DELETE FROM metadata")
+            self._db.executemany("INSERT INTO metadata VALUES (?, ?)",
+                                 [(k, str(v)) for k, v in metadata.items()])
+
+    def close(self):
+        """写入剩余瓦片并原子替换目标文件"""
+        self.flush()
+        missing = self._db.execute("SELECT COUNT(*) FROM map LEFT JOIN images ON images.tile_id = map.tile_id "
+                                   "WHERE images.tile_id IS NULL").fetchone()[0]
+        if missing:
+            self.abort()
+            raise ValueError(f"{missing} 个瓦片引用的数据未写入")
+        self._db.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """放弃写入并删除临时数据库"""
+        self._db.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+class DirectoryWriter:
+    def __init__(self, root, tile_format='png'):
+        """
+        目录树瓦片写入：root/z/x/y.扩展名，元数据写入 root/metadata.json
+
+        内容重复的瓦片以硬链接指向第一次写入的文件（文件系统不支持时复制）。
+        每个文件先写入临时文件再替换，覆盖旧导出时不会改动与其共享数据的其它链接。
+
+        :param root: 输出目录
+        :param tile_format: 瓦片格式（决定扩展名）
+        """
+        self.root = root
+        self.extension = TILE_FORMATS[_normalize_format(tile_format)]
+        self.count = 0
+        self.bytes = 0
+        self._paths = {}
+        self._waiting = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, zoom, x, y, data, tile_id=None):
+        """
+        写入一个瓦片（XYZ行号）
+        :param data: 瓦片数据，None时链接到同ID瓦片（尚未写入时等其写入后再链接）
+        :param tile_id: 瓦片ID（内容指纹）
+        """
+        directory = os.path.join(self.root, str(zoom), str(x))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{y}{self.extension}")
+        self.count += 1
+        if data is None:
+            if tile_id in self._paths:
+                self._link(self._paths[tile_id], path)
+            else:
+                self._waiting.setdefault(tile_id, []).append(path)
+            return
+        tmp_path = temp_path(path)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.bytes += len(data)
+        if tile_id is not None:
+            self._paths.setdefault(tile_id, path)
+            for waiting in self._waiting.pop(tile_id, []):
+                self._link(path, waiting)
+
+    @staticmethod
+    def _link(source, path):
+        tmp_path = temp_path(path)
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+
+    def set_metadata(self, metadata):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, 'metadata.json'), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+    def close(self):
+        if self._waiting:
+            missing = sum(len(paths) for paths in self._waiting.values())
+            raise ValueError(f"{missing} 个瓦片引用的数据未写入")
+
+    def abort(self):
+        pass
+
+
+def export_tiles(sources, writer, min_zoom=None, max_zoom=None, tile_format='png', quality=85,
+                 workers=None, name='amap', dedup=True, perceptual=True):
+    """
+    将图片切分为瓦片金字塔并写入
+
+    每张图片按行条带读取一次并逐级缩小（内存占用与图片大小无关），每行瓦片的切分编码作为任务并行执行；
+    相邻图片重叠处的边缘瓦片在写入前合并，不会互相覆盖出空白。
+    启用去重时每个瓦片在编码前按像素计算指纹，重复内容只编码、写入一次，其余位置引用其瓦片ID。
+
+    :param sources: 图片列表 [{'path': 图片路径, 'georef': 地理参考, 'group': 分组键(可选)}]，
+                    地理参考见 amap_tiles.static_map_georef / grid_georef，也可用 sources_from_manifest 获取
+    :param writer: MBTilesWriter 或 DirectoryWriter
+    :param min_zoom: 最小瓦片缩放级别，None时为图片中最低的级别
+    :param max_zoom: 最大瓦片缩放级别，None时为图片实际分辨率对应的最高级别
+    :param tile_format: 瓦片格式 png/jpg/webp
+    :param quality: jpg/webp 质量 (1-100)
+    :param workers: 线程数，None时为CPU核数
+    :param name: 瓦片集名称（元数据）
+    :param dedup: 是否对内容相同的瓦片去重
+    :param perceptual: 去重时是否合并仅有细微差异的纯色瓦片（有细节的瓦片只按像素完全相同合并）
+    :return: dict {'tiles': 瓦片数, 'bytes': 写入的字节数, 'min_zoom', 'max_zoom', 'elapsed': 秒,
+                   'dedup': {'unique', 'exact_duplicates', 'perceptual_duplicates', 'bytes_saved'} 或 None}
+    """
+    start = time.perf_counter()
+    tile_format = _normalize_format(tile_format)
+    deduplicator = TileDeduplicator(perceptual) if dedup else None
+    plan, min_zoom, max_zoom = plan_levels(sources, min_zoom, max_zoom)
+    if not plan:
+        raise ValueError("没有可导出的图片（需要带地理参考的下载结果）")
+
+    complete = set()
+    partial = {}
+
+    def write(zoom, x, y, data, tile_id):
+        writer.write(zoom, x, y, data, tile_id)
+        if deduplicator is not None and data is not None:
+            deduplicator.record_size(tile_id, len(data))
+
+    def finish(zoom, x, y, tile, data=None):
+        """登记并编码合并或剩余的瓦片（data 为已编码的数据时不再编码）"""
+        (tile_id, new), = _claim(deduplicator, tile[np.newaxis])
+        if not new:
+            data = None
+        elif data is None:
+            data = _encode(tile, tile_format, quality)
+        write(zoom, x, y, data, tile_id)
+
+    def store(zoom, x, y, data, whole, tile_id):
+        key = (zoom, x, y)
+        if key in complete:
+            return  # 已有完整瓦片（相邻图片重叠处的边缘瓦片；完整瓦片在切分时已跳过）
+        if whole:
+            write(zoom, x, y, data, tile_id)
+            complete.add(key)
+            partial.pop(key, None)
+            return
+        if key not in partial:
+            partial[key] = data
+            return
+        # 合并相邻图片的边缘瓦片（后到的不透明像素覆盖之前的）
+        base = cv2.imdecode(np.frombuffer(partial[key], np.uint8), cv2.IMREAD_UNCHANGED)
+        top = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+        mask = top[:, :, 3] > 0
+        base[mask] = top[mask]
+        if base[:, :, 3].min() == 255:
+            finish(zoom, x, y, np.ascontiguousarray(base[:, :, :3]))
+            complete.add(key)
+            partial.pop(key)
+        else:
+            partial[key] = _encode(base, 'png', quality)
+
+    workers = workers or os.cpu_count()
+    pending = deque()
+
+    def drain(limit):
+        """写入已完成的切分任务，直到未完成的任务不超过 limit 个（已读取的条带不会无限堆积）"""
+        while len(pending) > limit:
+            for tile in pending.popleft().result():
+                store(*tile)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='amap-export') as executor:
+        for source, zooms in plan:
+            height, width, read_rows, close = _open_source(source['path'])
+            head = _level_chain(source['georef'], width, zooms)
+            # complete 在切分期间只会加入本图片的位置（各位置只由本图片的一行瓦片产生），
+            # 切分时跳过的位置与写入时相同，登记过的瓦片不会在写入时被丢弃；
+            # 下一张图片开始前写完本图片的全部瓦片
+            try:
+                for row in range(0, height, STRIP_ROWS):
+                    final = row + STRIP_ROWS >= height
+                    for level, left, top, zoom, ty in head.push(read_rows(row, row + STRIP_ROWS), final):
+                        pending.append(executor.submit(_cut_row, level, left, top, zoom, ty, tile_format,
+                                                       quality, deduplicator, complete))
+                    drain(2 * workers)
+                drain(0)
+            finally:
+                close()
+            print(f"🧱 {os.path.basename(source['path'])} -> 级别 {zooms[0]}-{zooms[-1]}，累计 {writer.count} 个瓦片")
+
+    # 剩余的边缘瓦片（区域外部分透明）
+    for (zoom, x, y), data in sorted(partial.items()):
+        if tile_format == 'png' and deduplicator is None:
+            write(zoom, x, y, data, None)
+        else:
+            tile = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+            finish(zoom, x, y, tile, data if tile_format == 'png' else None)
+
+    bounds = [georef_bounds(source['georef']) for source, _ in plan]
+    west, south = min(b[0] for b in bounds), min(b[1] for b in bounds)
+    east, north = max(b[2] for b in bounds), max(b[3] for b in bounds)
+    writer.set_metadata({
+        'name': name,
+        'format': tile_format,
+        'type': 'baselayer',
+        'version': '1.1',
+        'description': '高德地图静态地图导出（GCJ-02坐标系）',
+        'attribution': '© 高德地图',
+        'bounds': f"{west:.6f},{south:.6f},{east:.6f},{north:.6f}",
+        'center': f"{(west + east) / 2:.6f},{(south + north) / 2:.6f},{min_zoom}",
+        'minzoom': min_zoom,
+        'maxzoom': max_zoom,
+    })
+    return {'tiles': writer.count, 'bytes': writer.bytes, 'min_zoom': min_zoom, 'max_zoom': max_zoom,
+            'elapsed': time.perf_counter() - start,
+            'dedup': deduplicator.summary() if deduplicator is not None else None}
+
+
+def export_manifest(manifest, mbtiles=None, xyz=None, map_style=None, **kwargs):
+    """
+    将批量下载清单中的图片导出为MBTiles或目录树
+    :param manifest: 清单dict或清单文件路径
+    :param mbtiles: MBTiles输出路径
+    :param xyz: 目录树输出路径（与mbtiles二选一）
+    :param map_style: 只导出该样式的图片
+    :param kwargs: 其余参数同 export_tiles
+    :return: 同 export_tiles
+    """
+    sources = sources_from_manifest(manifest, map_style)
+    if mbtiles:
+        writer = MBTilesWriter(mbtiles)
+    else:
+        writer = DirectoryWriter(xyz, kwargs.get('tile_format', 'png'))
+    with writer:
+        return export_tiles(sources, writer, **kwargs)
+
+
+def print_dedup_summary(summary):
+    """打印去重统计"""
+    if not summary:
+        return
+    duplicates = summary['exact_duplicates'] + summary['perceptual_duplicates']
+    if duplicates:
+        print(f"♻️  去重: {summary['unique']} 个不同瓦片，{duplicates} 个重复"
+              f"（其中近似纯色 {summary['perceptual_duplicates']} 个），节省 {summary['bytes_saved'] / 1024 / 1024:.2f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="将下载的区域图片导出为XYZ瓦片（MBTiles或目录树）")
+    parser.add_argument('manifest', nargs='?', help="批量下载清单（manifest.json）")
+    parser.add_argument('--image', action='append', default=[],
+                        help="带地理参考的图片（拼接输出的GeoTIFF，或带world file的PNG），可重复指定；可代替清单")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--mbtiles', help="MBTiles输出路径")
+    output.add_argument('--xyz', help="目录树输出路径（z/x/y.扩展名）")
+    parser.add_argument('--min-zoom', type=int, help="最小瓦片级别（默认为图片中最低的级别）")
+    parser.add_argument('--max-zoom', type=int, help="最大瓦片级别（默认为图片分辨率对应的最高级别）")
+    parser.add_argument('--format', default='png', choices=['png', 'jpg', 'webp'], help="瓦片格式")
+    parser.add_argument('--quality', type=int, default=85, help="jpg/webp 质量")
+    parser.add_argument('--style', help="只导出该地图样式的图片")
+    parser.add_argument('--workers', type=int, help="线程数（默认为CPU核数）")
+    parser.add_argument('--name', help="瓦片集名称（默认为输出文件名）")
+    parser.add_argument('--no-dedup', action='store_true', help="不对内容相同的瓦片去重")
+    parser.add_argument('--exact-dedup', action='store_true', help="只合并像素完全相同的瓦片（不合并近似的纯色瓦片）")
+    args = parser.parse_args(argv)
+    if not args.manifest and not args.image:
+        parser.error("需要指定清单或 --image")
+
+    name = args.name or os.path.splitext(os.path.basename((args.mbtiles or args.xyz).rstrip('/\\')))[0]
+    sources = sources_from_manifest(args.manifest, args.style) if args.manifest else []
+    sources.extend(sources_from_images(args.image))
+    writer = MBTilesWriter(args.mbtiles) if args.mbtiles else DirectoryWriter(args.xyz, args.format)
+    with writer:
+        stats = export_tiles(sources, writer, min_zoom=args.min_zoom, max_zoom=args.max_zoom,
+                             tile_format=args.format, quality=args.quality, workers=args.workers, name=name,
+                             dedup=not args.no_dedup, perceptual=not args.exact_dedup)
+    print(f"✅ 导出 {stats['tiles']} 个瓦片（级别 {stats['min_zoom']}-{stats['max_zoom']}，"
+          f"{stats['bytes'] / 1024 / 1024:.2f} MB），耗时 {stats['elapsed']:.1f} 秒")
+    print_dedup_summary(stats['dedup'])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
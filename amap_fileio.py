@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+输出文件的原子写入
+先写入同目录下的临时文件，完成后用 os.replace 重命名到目标路径；
+进程中途退出时目标路径要么是旧文件要么不存在，不会留下写了一半的图片；
+多个进程读改写同一文件时用 file_lock 互斥
+"""
+
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def temp_path(path):
+    """
+    生成与目标文件同目录、保留扩展名的临时文件路径（同一文件系统，保证可原子重命名）
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    root, ext = os.path.splitext(name)
+    return os.path.join(directory, f".{root}.{os.getpid()}.{threading.get_ident()}.tmp{ext}")
+
+
+class AtomicFile:
+    """
+    原子写入的文件对象，写入时同步计算SHA-256
+
+    用法：
+        with AtomicFile(path) as f:
+            f.write(data)
+        f.sha256  # 正常退出时已重命名到path；发生异常或调用 discard 时删除临时文件
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = temp_path(path)
+        self.size = 0
+        self.sha256 = None
+        self._hash = hashlib.sha256()
+        self._discarded = False
+        self._file = open(self.tmp_path, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and not self._discarded:
+            self.commit()
+        else:
+            self.abort()
+
+    def digest(self):
+        """已写入数据的SHA-256（十六进制）"""
+        return self._hash.hexdigest()
+
+    def discard(self):
+        """放弃本次写入：退出时删除临时文件，不替换目标文件（如内容与已有文件相同，保留其修改时间）"""
+        self._discarded = True
+        self.sha256 = self.digest()
+
+    def write(self, data):
+        self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+
+    def commit(self):
+        """刷新到磁盘并重命名到目标路径（替换已存在的文件或硬链接，而不是改写其内容）"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        self.sha256 = self.digest()
+
+    def abort(self):
+        """放弃写入并删除临时文件"""
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+def atomic_write(path, data):
+    """
+    原子写入二进制数据
+    :return: 数据的SHA-256（十六进制）
+    """
+    with AtomicFile(path) as f:
+        f.write(data)
+    return f.sha256
+
+
+@contextmanager
+def file_lock(path):
+    """
+    跨进程互斥锁（阻塞等待），锁在文件 path 上，进程退出时由系统释放
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK 重试约10秒后仍未获得锁
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    """
+    计算文件的SHA-256（十六进制），文件不存在时返回None
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
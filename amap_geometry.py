@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+区域边界几何计算
+边界坐标串的向量化解析（带缓存）、保形状的边界简化（Douglas-Peucker），
+以及瓦片网格与区域多边形的相交判断（用于跳过区域外的瓦片）
+"""
+
+import math
+from functools import lru_cache
+
+import numpy as np
+
+from amap_tiles import lnglat_array_to_pixel
+
+# 解析结果缓存的条目数：同一区域的边界分析、边界路径与瓦片裁剪在短时间内使用同一字符串，
+# 只需覆盖并发规划中的几个区域（每条边界可达数MB，持久缓存由区域查询缓存负责）
+_PARSE_CACHE_SIZE = 8
+
+
+class Boundary:
+    """
+    解析后的区域边界：所有环的坐标连续存放在一个 (N, 2) float64 数组中（只读，可安全共享）
+    """
+
+    def __init__(self, coords, ring_offsets):
+        """
+        :param coords: (N, 2) 数组 [经度, 纬度]
+        :param ring_offsets: 各环起始下标，长度为环数+1（最后一个元素为N）
+        """
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.coords.setflags(write=False)
+
+    def __len__(self):
+        return len(self.coords)
+
+    @property
+    def rings(self):
+        """各环坐标数组（视图，不复制数据）"""
+        offsets = self.ring_offsets
+        return [self.coords[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def parse_polyline(polyline):
+    """
+    解析高德边界坐标字符串（最近使用的几个结果按字符串缓存，同一区域的各步骤只解析一次）
+
+    :param polyline: 'lng1,lat1;lng2,lat2;...'，多个多边形（如飞地、岛屿）之间以'|'分隔
+    :return: Boundary；少于3个点的环会被丢弃
+    """
+    parts = [part for part in (polyline or '').split('|') if part]
+    counts = [part.count(';') + 1 for part in parts]
+    try:
+        # 快速路径：一次性交给numpy解析全部数值
+        values = np.array(','.join(parts).replace(';', ',').split(','), dtype=np.float64)
+        if values.size != 2 * sum(counts):
+            raise ValueError
+        coords = values.reshape(-1, 2)
+    except ValueError:
+        # 存在格式错误的坐标时逐点解析并跳过错误点
+        rings, counts = [], []
+        for part in parts:
+            points = []
+            for coord in part.split(';'):
+                try:
+                    lng, lat = map(float, coord.split(','))
+                    points.append((lng, lat))
+                except (ValueError, IndexError):
+                    continue
+            rings.extend(points)
+            counts.append(len(points))
+        coords = np.array(rings, dtype=np.float64).reshape(-1, 2)
+
+    # 丢弃少于3个点的环
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    keep = [i for i, count in enumerate(counts) if count >= 3]
+    if len(keep) != len(counts):
+        coords = np.concatenate([coords[offsets[i]:offsets[i + 1]] for i in keep]) if keep \
+            else np.empty((0, 2), dtype=np.float64)
+        offsets = np.concatenate([[0], np.cumsum([counts[i] for i in keep])]).astype(np.int64)
+    return Boundary(coords, offsets)
+
+
+def close_ring(coords):
+    """
+    确保环闭合：最后一个点与首个点不同时追加首个点
+    """
+    if len(coords) and not np.array_equal(coords[0], coords[-1]):
+        return np.vstack([coords, coords[:1]])
+    return coords
+
+
+def format_coords(coords, precision=6, trim=False):
+    """
+    将坐标数组格式化为高德坐标串 'lng1,lat1;lng2,lat2;...'
+    :param precision: 小数位数
+    :param trim: 是否去掉小数末尾的0（如 115.1000 -> 115.1），缩短URL
+    """
+    if trim:
+        def fmt(value):
+            text = f"{value:.{precision}f}"
+            return text.rstrip('0').rstrip('.') if '.' in text else text
+        return ';'.join(f"{fmt(lng)},{fmt(lat)}" for lng, lat in coords.tolist())
+    return ';'.join(f"{lng:.{precision}f},{lat:.{precision}f}" for lng, lat in coords.tolist())
+
+
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def quantize_boundary(boundary, precision):
+    """
+    将边界坐标舍入到指定小数位数，并删除舍入后与前一点重合的连续重复点
+    （结果按边界对象与精度缓存；舍入后不足3个点的环会被丢弃）
+
+    :param boundary: parse_polyline 返回的 Boundary
+    :param precision: 小数位数（5位约1米，4位约11米）
+    :return: 新的 Boundary
+    """
+    coords = np.round(boundary.coords, precision)
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+    offsets = boundary.ring_offsets
+    keep[offsets[:-1]] = True  # 每个环的首个点总是保留
+
+    rings, counts = [], []
+    for i in range(len(offsets) - 1):
+        ring = coords[offsets[i]:offsets[i + 1]][keep[offsets[i]:offsets[i + 1]]]
+        if len(ring) >= 3:
+            rings.append(ring)
+            counts.append(len(ring))
+    coords = np.concatenate(rings) if rings else np.empty((0, 2), dtype=np.float64)
+    return Boundary(coords, np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+
+
+def _split_segments(x, y, starts, ends):
+    """
+    一次向量化计算多条线段的拆分点：各线段 start-end 之间距该线段（首尾重合时为该点）最远的点
+    :param x, y: 各点坐标（连续数组）
+    :return: (距离, 下标) 两个数组，与线段一一对应
+    """
+    lengths = ends - starts - 1
+    offsets = np.zeros(len(starts), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    segment = np.repeat(np.arange(len(starts)), lengths)
+    index = np.arange(len(segment)) + np.repeat(starts + 1 - offsets, lengths)
+    ax, ay = x[starts], y[starts]
+    dx, dy = x[ends] - ax, y[ends] - ay
+    chord = np.hypot(dx, dy)
+    px = x.take(index) - ax.take(segment)
+    py = y.take(index) - ay.take(segment)
+    zero = chord == 0
+    chord[zero] = 1
+    dist = np.abs(dx.take(segment) * py - dy.take(segment) * px)
+    dist /= chord.take(segment)
+    if zero.any():
+        point = zero.take(segment)
+        dist[point] = np.hypot(px[point], py[point])
+    # 每条线段取第一个最大值（与逐段 argmax 相同）
+    farthest = np.maximum.reduceat(dist, offsets)
+    first = np.flatnonzero(dist == farthest.take(segment))
+    owner = segment.take(first)
+    first = first[np.concatenate([[True], owner[1:] != owner[:-1]])]
+    return farthest, index.take(first)
+
+
+def douglas_peucker_rank(coords, max_points=None):
+    """
+    计算Douglas-Peucker简化中各点的保留顺序
+
+    按"当前误差最大的线段优先拆分"的顺序依次选出拆分点，得到的顺序中任意前k个点
+    加上首尾两点，就是对应容差下的Douglas-Peucker简化结果；容差随顺序单调不增。
+    拆分按层进行，每层用一次numpy运算求出所有待拆分线段的最远点；各点的容差是其拆分路径上
+    误差的最小值（子线段的误差可能大于父线段，截断以保证容差单调），按容差从大到小排序即为拆分顺序。
+    只返回前 max_points 个点，其余点视为不重要（容差已不可能进入前 max_points 的线段不再拆分）。
+
+    :param coords: (N, 2) 数组 [经度, 纬度]
+    :param max_points: 最多排序的点数，None时排序全部点
+    :return: (order, tolerance) 两个数组：点下标（不含首尾点）及对应容差（度）
+    """
+    n = len(coords)
+    limit = n if max_points is None else min(n, max_points)
+    if n < 3 or limit <= 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+    # 经度按纬度余弦缩放，使两个方向的距离可比
+    xy = np.array(coords, dtype=np.float64)
+    x = xy[:, 0] * math.cos(math.radians(float(xy[:, 1].mean())))
+    y = np.ascontiguousarray(xy[:, 1])
+
+    points, tolerances, errors, depths = [], [], [], []
+    starts, ends = np.array([0]), np.array([n - 1])
+    caps = np.array([math.inf])
+    depth = 0
+    while len(starts):
+        dist, split = _split_segments(x, y, starts, ends)
+        caps = np.minimum(caps, dist)
+        points.append(split)
+        tolerances.append(caps)
+        errors.append(dist)
+        depths.append(np.full(len(split), depth))
+        starts, ends = np.concatenate([starts, split]), np.concatenate([split, ends])
+        caps = np.concatenate([caps, caps])
+        keep = ends - starts >= 2
+        found = sum(len(t) for t in tolerances)
+        if found >= limit:
+            # 子线段的容差不超过父线段：低于当前第 limit 大容差的线段不会再进入结果
+            threshold = np.partition(np.concatenate(tolerances), found - limit)[found - limit]
+            keep &= caps >= threshold
+        starts, ends, caps = starts[keep], ends[keep], caps[keep]
+        depth += 1
+
+    points, tolerances = np.concatenate(points), np.concatenate(tolerances)
+    # 容差相同时父线段的拆分点在前（任意前k个点都是一次完整的拆分结果），同层误差大的在前
+    rank = np.lexsort((points, -np.concatenate(errors), np.concatenate(depths), -tolerances))[:limit]
+    return points[rank].astype(np.int64), tolerances[rank]
+
+
+class BoundarySimplifier:
+    """
+    多环边界的保形状简化：各环的Douglas-Peucker顺序按容差合并为全局顺序，
+    保留前k个点即为统一容差下的简化结果，k越大越精细
+    """
+
+    def __init__(self, boundary, max_points=None):
+        """
+        :param boundary: parse_polyline 返回的 Boundary
+        :param max_points: 最多保留的点数（限制排序工作量），None时不限
+        """
+        self.boundary = boundary
+        offsets = boundary.ring_offsets
+        anchors, ranked, tolerances = [], [], []
+        for i, ring in enumerate(boundary.rings):
+            start = int(offsets[i])
+            anchors.extend([start, start + len(ring) - 1])
+            order, tolerance = douglas_peucker_rank(ring, max_points)
+            ranked.append(order + start)
+            tolerances.append(tolerance)
+
+        self._anchors = np.array(anchors, dtype=np.int64)
+        if ranked:
+            ranked = np.concatenate(ranked)
+            tolerances = np.concatenate(tolerances)
+            ranked = ranked[np.argsort(-tolerances, kind='stable')]
+        else:
+            ranked = np.empty(0, dtype=np.int64)
+        if max_points is not None:
+            ranked = ranked[:max_points]
+        self._ranked = ranked
+
+    @property
+    def max_rank(self):
+        """可追加保留的点数上限（不含各环首尾点）"""
+        return len(self._ranked)
+
+    def rings(self, count):
+        """
+        保留前count个点时的简化结果
+        :return: 闭合的环列表，简化后不足3个不同点的环被丢弃
+        """
+        keep = np.zeros(len(self.boundary), dtype=bool)
+        keep[self._anchors] = True
+        keep[self._ranked[:count]] = True
+        offsets = self.boundary.ring_offsets
+        rings = []
+        for i, ring in enumerate(self.boundary.rings):
+            ring = close_ring(ring[keep[offsets[i]:offsets[i + 1]]])
+            if len(ring) >= 4:
+                rings.append(ring)
+        return rings
+
+    def fit(self, measure, budget):
+        """
+        二分查找不超过长度预算的最精细简化结果（约 log2(max_rank) 次测量）
+
+        :param measure: 函数 measure(rings) -> 长度（rings可能为空列表）
+        :param budget: 长度预算
+        :return: (rings, count)；即使最粗的简化也超出预算（或没有可用的环）时返回 (None, 0)
+        """
+        low, high = 0, self.max_rank
+        if measure(self.rings(0)) > budget:
+            return None, 0
+        while low < high:
+            mid = (low + high + 1) // 2
+            if measure(self.rings(mid)) <= budget:
+                low = mid
+            else:
+                high = mid - 1
+        rings = self.rings(low)
+        return (rings, low) if rings else (None, 0)
+
+
+def tile_intersection_mask(grid, rings, buffer_px=0, subdivisions=8):
+    """
+    计算瓦片网格中与区域多边形（含缓冲距离）相交的瓦片
+
+    将多边形按网格栅格化到细分单元上（每个瓦片 subdivisions×subdivisions 个单元）：
+    填充多边形内部，并描绘边界线以保证细长部分和仅被边界穿过的瓦片也被标记；
+    再按缓冲距离膨胀（额外多膨胀一个单元以保证判断偏保守），最后按瓦片归约。
+
+    :param grid: plan_tile_grid 返回的网格
+    :param rings: 多边形环列表（Boundary.rings）
+    :param buffer_px: 缓冲距离（该缩放级别下的逻辑像素）
+    :param subdivisions: 每个瓦片在每个方向上的细分单元数
+    :return: (rows, cols) 布尔数组，True 表示需要下载
+    """
+    # OpenCV只在瓦片拼接模式中使用，首次调用时才导入
+    import cv2
+    rows, cols = grid['rows'], grid['cols']
+    if not rings:
+        return np.ones((rows, cols), dtype=bool)
+
+    cell_w = grid['tile_width'] / subdivisions
+    cell_h = grid['tile_height'] / subdivisions
+    origin_x, origin_y = grid['origin']
+
+    # cv2绘制使用定点坐标（shift位小数）以保留亚单元精度
+    shift = 4
+    contours = []
+    for ring in rings:
+        px = lnglat_array_to_pixel(ring, grid['zoom'])
+        cells = np.empty_like(px)
+        cells[:, 0] = (px[:, 0] - origin_x) / cell_w
+        cells[:, 1] = (px[:, 1] - origin_y) / cell_h
+        contours.append(np.round(cells * (1 << shift)).astype(np.int32).reshape(-1, 1, 2))
+
+    raster = np.zeros((rows * subdivisions, cols * subdivisions), dtype=np.uint8)
+    cv2.fillPoly(raster, contours, 1, lineType=cv2.LINE_8, shift=shift)
+    cv2.polylines(raster, contours, True, 1, lineType=cv2.LINE_8, shift=shift)
+
+    radius = math.ceil(buffer_px / min(cell_w, cell_h)) + 1
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1))
+    raster = cv2.dilate(raster, kernel)
+
+    return raster.reshape(rows, subdivisions, cols, subdivisions).any(axis=(1, 3))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量下载任务日志
+以SQLite持久化记录每个下载单元（区域、缩放级别、样式、清晰度）的状态与输出文件校验和，
+批量任务中断后可据此续传，只执行尚未完成的单元
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from amap_fileio import sha256_file
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobJournal:
+    def __init__(self, path):
+        """
+        打开（或创建）任务日志
+
+        :param path: SQLite数据库文件路径（支持~）
+        """
+        path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS units (
+                district TEXT NOT NULL,
+                zoom INTEGER NOT NULL,
+                map_style TEXT NOT NULL,
+                scale INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                filepath TEXT,
+                checksum TEXT,
+                bytes INTEGER,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated REAL NOT NULL,
+                georef TEXT,
+                PRIMARY KEY (district, zoom, map_style, scale)
+            )
+        """)
+        # 旧版本创建的日志没有georef列
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(units)")}
+        if 'georef' not in columns:
+            self._db.execute("ALTER TABLE units ADD COLUMN georef TEXT")
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, district, zoom, map_style, scale):
+        """
+        读取下载单元的记录
+        :return: dict（status/filepath/checksum/bytes/error/attempts/updated/georef），无记录时返回None
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, filepath, checksum, bytes, error, attempts, updated, georef FROM units "
+                "WHERE district = ? AND zoom = ? AND map_style = ? AND scale = ?",
+                (district, zoom, map_style, scale)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ('status', 'filepath', 'checksum', 'bytes', 'error', 'attempts', 'updated', 'georef')
+        entry = dict(zip(keys, row))
+        entry['georef'] = json.loads(entry['georef']) if entry['georef'] else None
+        return entry
+
+    def is_done(self, district, zoom, map_style, scale, verify=False):
+        """
+        下载单元是否已完成：记录为done且输出文件仍存在、大小一致
+        :param verify: 是否重新计算文件校验和进行比对（读取整个文件）
+        """
+        entry = self.get(district, zoom, map_style, scale)
+        if entry is None or entry['status'] != DONE or not entry['filepath']:
+            return False
+        try:
+            if os.path.getsize(entry['filepath']) != entry['bytes']:
+                return False
+        except OSError:
+            return False
+        return not verify or sha256_file(entry['filepath']) == entry['checksum']
+
+    def mark_pending(self, district, zoom, map_style, scale):
+        """标记下载单元开始执行（累计尝试次数）"""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO units (district, zoom, map_style, scale, status, attempts, updated) "
+                "VALUES (?, ?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT (district, zoom, map_style, scale) DO UPDATE SET "
+                "status = excluded.status, error = NULL, attempts = attempts + 1, updated = excluded.updated",
+                (district, zoom, map_style, scale, PENDING, time.time())
+            )
+            self._db.commit()
+
+    def mark_done(self, district, zoom, map_style, scale, filepath, checksum=None, georef=None):
+        """
+        标记下载单元完成
+        :param checksum: 输出文件的SHA-256，None时读取文件计算
+        :param georef: 图片的地理参考（见 amap_tiles.static_map_georef），续传时随清单输出供瓦片导出使用
+        """
+        if checksum is None:
+            checksum = sha256_file(filepath)
+        self._update(district, zoom, map_style, scale, DONE, filepath, checksum,
+                     os.path.getsize(filepath), None, georef)
+
+    def mark_failed(self, district, zoom, map_style, scale, error):
+        """标记下载单元失败"""
+        self._update(district, zoom, map_style, scale, FAILED, None, None, None, error)
+
+    def _update(self, district, zoom, map_style, scale, status, filepath, checksum, size, error, georef=None):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO units (district, zoom, map_style, scale, status, filepath, checksum, bytes, error, "
+                "updated, georef) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (district, zoom, map_style, scale) DO UPDATE SET "
+                "status = excluded.status, filepath = excluded.filepath, checksum = excluded.checksum, "
+                "bytes = excluded.bytes, error = excluded.error, updated = excluded.updated, "
+                "georef = COALESCE(excluded.georef, georef)",
+                (district, zoom, map_style, scale, status, filepath, checksum, size, error, time.time(),
+                 json.dumps(georef) if georef else None)
+            )
+            self._db.commit()
+
+    def summary(self):
+        """
+        按状态统计下载单元数量
+        :return: dict {状态: 数量}
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._db.close()
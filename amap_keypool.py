@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高德地图API密钥池
+多个密钥按接口分别统计每日用量与QPS（令牌桶），每次请求选择余量最多的密钥；
+密钥报告配额用尽时自动切换到其他密钥。每日用量持久化到JSON文件，保存时与文件中其他进程的用量合并，跨进程运行累计
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from amap_fileio import atomic_write, file_lock
+from amap_ratelimit import RateLimiter
+
+# 配额用尽类错误码：该密钥当天（该接口）不再可用
+QUOTA_EXHAUSTED_INFOCODES = {
+    '10003',  # DAILY_QUERY_OVER_LIMIT 访问已超出日访问量
+    '10044',  # USER_DAILY_QUERY_OVER_LIMIT 账号维度日调用量超出限制
+}
+
+# 单个密钥访问过于频繁：短暂冷却，期间优先使用其他密钥
+KEY_COOLDOWN_INFOCODES = {
+    '10004',  # ACCESS_TOO_FREQUENT 单位时间内访问过于频繁
+    '10020',  # CKQPS_HAS_EXCEEDED_THE_LIMIT 某个Key使用某个服务接口QPS超出限制
+}
+
+# 高德配额按北京时间（UTC+8）零点重置
+_RESET_UTC_OFFSET = 8 * 3600
+
+
+def quota_day(now=None):
+    """当前配额日（北京时间日期，如 '2024-12-17'）"""
+    return time.strftime('%Y-%m-%d', time.gmtime((now or time.time()) + _RESET_UTC_OFFSET))
+
+
+def key_fingerprint(key):
+    """密钥指纹（用于持久化与日志，不保存密钥明文）"""
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+class _KeyState:
+    def __init__(self, key, daily_limits, limiter):
+        self.key = key
+        self.fingerprint = key_fingerprint(key)
+        self.daily_limits = daily_limits or {}
+        self.limiter = limiter
+        self.used = {}          # {接口: 当日请求数}
+        self.pending = {}       # {接口: 上次保存后本进程新增的请求数}
+        self.exhausted = set()  # 当日配额已用尽的接口
+        self.cooldown = {}      # {接口: 冷却结束时间（monotonic）}
+
+    def remaining(self, endpoint):
+        """当日剩余请求数，未配置上限时为无穷大"""
+        if endpoint in self.exhausted:
+            return 0
+        limit = self.daily_limits.get(endpoint)
+        if limit is None:
+            return float('inf')
+        return max(0, limit - self.used.get(endpoint, 0))
+
+
+class KeyPool:
+    def __init__(self, keys, daily_limits=None, rate_limits=None, default_qps=0,
+                 state_path=None, cooldown=5.0, save_interval=20):
+        """
+        初始化密钥池
+
+        :param keys: 密钥列表，每项为密钥字符串，或 {'key': 密钥, 'daily_limits': {...}, 'rate_limits': {...}}
+                     以单独覆盖该密钥的每日上限/QPS
+        :param daily_limits: dict {接口名称: 每日请求上限}，未配置的接口不限
+        :param rate_limits: dict {接口名称: {'qps': 每秒请求数, 'burst': 突发量}}（每个密钥各自的QPS）
+        :param default_qps: 未配置的接口使用的QPS，<=0 表示不限流
+        :param state_path: 每日用量持久化文件路径（支持~），None时不持久化
+        :param cooldown: 密钥报告访问过于频繁后的冷却时间（秒）
+        :param save_interval: 每累计多少次请求保存一次用量
+        """
+        if not keys:
+            raise ValueError("密钥池至少需要一个API密钥")
+        self.cooldown = cooldown
+        self.save_interval = save_interval
+        self.state_path = os.path.expanduser(state_path) if state_path else None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._unsaved = 0
+        self._day = quota_day()
+
+        self._keys = []
+        for item in keys:
+            if isinstance(item, str):
+                item = {'key': item}
+            limits = dict(daily_limits or {}, **item.get('daily_limits', {}))
+            # 同一密钥的令牌桶在进程内共享（与单密钥下载器的限流器一致）
+            limiter = RateLimiter.shared(item['key'], item.get('rate_limits', rate_limits), default_qps)
+            self._keys.append(_KeyState(item['key'], limits, limiter))
+        self._by_key = {state.key: state for state in self._keys}
+        self._load()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def keys(self):
+        """密钥列表"""
+        return [state.key for state in self._keys]
+
+    def _roll_day(self):
+        """配额日变化时清零用量（需在锁内调用）"""
+        day = quota_day()
+        if day != self._day:
+            self._day = day
+            for state in self._keys:
+                state.used.clear()
+                state.pending.clear()
+                state.exhausted.clear()
+
+    def _candidates(self, endpoint):
+        now = time.monotonic()
+        available = [s for s in self._keys if s.remaining(endpoint) > 0]
+        ready = [s for s in available if s.cooldown.get(endpoint, 0) <= now]
+        return ready or available
+
+    def has_available(self, endpoint, exclude=None):
+        """
+        是否还有当日配额未用尽的密钥
+        :param exclude: 不计入的密钥
+        """
+        with self._lock:
+            self._roll_day()
+            return any(s.key != exclude and s.remaining(endpoint) > 0 for s in self._keys)
+
+    def acquire(self, endpoint, sleep=None):
+        """
+        为一次请求选择密钥并获取其令牌（阻塞等待该密钥的QPS令牌）
+
+        选择规则：排除当日配额已用尽和冷却中的密钥，优先选择令牌最快可用的密钥，
+        其次选择当日剩余请求数最多的密钥。选择与预约令牌在锁内完成，并发线程会分散到不同密钥。
+
+        :param sleep: 等待函数 sleep(秒数)，默认 time.sleep（传输层传入可被取消打断的等待）
+        :return: (密钥, 等待秒数)；所有密钥当日配额都已用尽时返回 (None, 0)
+        """
+        with self._lock:
+            self._roll_day()
+            candidates = self._candidates(endpoint)
+            if not candidates:
+                return None, 0.0
+            state = min(candidates, key=lambda s: (s.limiter.bucket(endpoint).wait_time(),
+                                                  -s.remaining(endpoint)))
+            wait = state.limiter.bucket(endpoint).reserve()
+            state.used[endpoint] = state.used.get(endpoint, 0) + 1
+            state.pending[endpoint] = state.pending.get(endpoint, 0) + 1
+            self._unsaved += 1
+            save = self._unsaved >= self.save_interval
+        if save:
+            self.save()
+        if wait > 0:
+            (sleep or time.sleep)(wait)
+        return state.key, wait
+
+    def report(self, key, endpoint, infocode):
+        """
+        报告请求结果中的错误码：配额用尽的密钥当天不再用于该接口，访问过于频繁的密钥短暂冷却
+        :return: 是否应换用其他密钥重试
+        """
+        infocode = str(infocode or '')
+        state = self._by_key.get(key)
+        if state is None:
+            return False
+        if infocode in QUOTA_EXHAUSTED_INFOCODES:
+            with self._lock:
+                state.exhausted.add(endpoint)
+                self._unsaved += 1
+            print(f"🔑 密钥 {state.fingerprint[:8]} 的 {endpoint} 当日配额已用尽，切换到其他密钥")
+            self.save()
+            return True
+        if infocode in KEY_COOLDOWN_INFOCODES:
+            with self._lock:
+                state.cooldown[endpoint] = time.monotonic() + self.cooldown
+            return True
+        return False
+
+    def usage(self):
+        """
+        各密钥当日用量
+        :return: dict {密钥指纹: {'used': {...}, 'remaining': {...}, 'exhausted': [...]}}
+        """
+        with self._lock:
+            self._roll_day()
+            result = {}
+            for state in self._keys:
+                endpoints = set(state.used) | set(state.daily_limits)
+                result[state.fingerprint] = {
+                    'used': dict(state.used),
+                    'remaining': {e: state.remaining(e) for e in endpoints},
+                    'exhausted': sorted(state.exhausted),
+                }
+            return result
+
+    def _read_state(self):
+        """读取持久化文件中当日的用量 {密钥指纹: {'used': {...}, 'exhausted': [...]}}，不是当日的数据视为空"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('day') != self._day:
+            return {}
+        return data.get('keys', {})
+
+    def _load(self):
+        if not self.state_path:
+            return
+        saved_keys = self._read_state()
+        for state in self._keys:
+            saved = saved_keys.get(state.fingerprint, {})
+            state.used = {e: int(n) for e, n in saved.get('used', {}).items()}
+            state.exhausted = set(saved.get('exhausted', []))
+
+    def save(self):
+        """
+        保存当日用量（原子写入；文件中只保存密钥指纹）
+
+        保存在进程内串行、跨进程用锁文件互斥：重新读取文件中的用量（包含共享密钥的其他进程保存的请求数），
+        加上本进程上次保存后新增的请求数、合并配额用尽的接口后写回，并以合并结果更新内存中的用量
+        """
+        if not self.state_path:
+            return
+        with self._save_lock, file_lock(self.state_path + '.lock'):
+            with self._lock:
+                self._roll_day()
+            saved_keys = self._read_state()
+            with self._lock:
+                self._unsaved = 0
+                merged = dict(saved_keys)
+                for state in self._keys:
+                    saved = saved_keys.get(state.fingerprint, {})
+                    used = {e: int(n) for e, n in saved.get('used', {}).items()}
+                    for endpoint, count in state.pending.items():
+                        used[endpoint] = used.get(endpoint, 0) + count
+                    state.pending.clear()
+                    state.used = used
+                    state.exhausted |= set(saved.get('exhausted', []))
+                    merged[state.fingerprint] = {'used': dict(used), 'exhausted': sorted(state.exhausted)}
+                data = {'day': self._day, 'keys': merged}
+            atomic_write(self.state_path, json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
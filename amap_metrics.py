@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载器运行指标
+按接口统计请求数、延迟直方图、下载字节数、重试次数、限流等待时间、按错误码分类的失败次数以及缓存命中率，
+通过可插拔的输出（回调函数、JSON Lines文件、Prometheus文本格式）提供给监控系统
+"""
+
+import json
+import threading
+import time
+
+from amap_fileio import atomic_write
+
+# 请求延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 各指标的说明（Prometheus HELP）
+_HELP = {
+    'amap_requests_total': 'HTTP请求数（按接口与最终状态）',
+    'amap_request_duration_seconds': '请求耗时（含重试与退避）',
+    'amap_response_bytes_total': '下载的响应字节数',
+    'amap_retries_total': '重试次数',
+    'amap_rate_limit_wait_seconds_total': '在限流器上等待的总时间',
+    'amap_failures_total': '失败的请求数（按错误码，网络异常为 network）',
+    'amap_cache_requests_total': '缓存查询次数（按缓存类型与命中结果）',
+}
+
+_SUCCESS_INFOCODE = '10000'
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + list(extra or [])
+    if not pairs:
+        return ''
+    escaped = (f'{k}="' + v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metrics:
+    def __init__(self, sinks=None, buckets=LATENCY_BUCKETS):
+        """
+        初始化指标
+
+        :param sinks: 输出列表（CallbackSink/JsonLinesSink/PrometheusTextSink 或任何实现 emit/flush 的对象）
+        :param buckets: 延迟直方图的桶上界（秒）
+        """
+        self.sinks = list(sinks or [])
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        """添加输出"""
+        self.sinks.append(sink)
+
+    def inc(self, name, value=1, **labels):
+        """计数器累加"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """直方图记录一个观测值"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = {'count': 0, 'sum': 0.0, 'buckets': [0] * len(self.buckets)}
+            hist['count'] += 1
+            hist['sum'] += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist['buckets'][i] += 1
+
+    def emit(self, event):
+        """将事件发送给所有输出"""
+        for sink in self.sinks:
+            sink.emit(event)
+
+    def record_request(self, timing):
+        """
+        记录一次请求（作为传输层的请求完成回调：transport.add_listener(metrics.record_request)）
+        :param timing: RequestTiming
+        """
+        endpoint = timing.endpoint
+        if timing.status is None:
+            failure = 'network'
+        elif timing.status >= 400:
+            failure = f"http_{timing.status}"
+        elif timing.infocode and timing.infocode != _SUCCESS_INFOCODE:
+            failure = timing.infocode
+        else:
+            failure = None
+
+        self.inc('amap_requests_total', endpoint=endpoint, result='failure' if failure else 'success')
+        self.observe('amap_request_duration_seconds', timing.elapsed, endpoint=endpoint)
+        if timing.bytes:
+            self.inc('amap_response_bytes_total', timing.bytes, endpoint=endpoint)
+        if timing.attempts > 1:
+            self.inc('amap_retries_total', timing.attempts - 1, endpoint=endpoint)
+        if timing.wait:
+            self.inc('amap_rate_limit_wait_seconds_total', timing.wait, endpoint=endpoint)
+        if failure:
+            self.inc('amap_failures_total', endpoint=endpoint, infocode=failure)
+
+        if self.sinks:
+            event = dict(timing._asdict(), type='request', time=time.time(), failure=failure)
+            self.emit(event)
+
+    def record_cache(self, cache, hit):
+        """
+        记录一次缓存查询
+        :param cache: 缓存类型，如 'district'、'image'
+        :param hit: 是否命中
+        """
+        self.inc('amap_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+        if self.sinks:
+            self.emit({'type': 'cache', 'time': time.time(), 'cache': cache, 'hit': hit})
+
+    def cache_hit_ratio(self):
+        """
+        各缓存的命中率
+        :return: dict {缓存类型: 命中率}
+        """
+        totals = {}
+        with self._lock:
+            for key, value in self._counters.get('amap_cache_requests_total', {}).items():
+                labels = dict(key)
+                hits, count = totals.get(labels['cache'], (0, 0))
+                totals[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), count + value)
+        return {cache: hits / count for cache, (hits, count) in totals.items() if count}
+
+    def snapshot(self):
+        """
+        当前所有指标的快照
+        :return: dict {'counters': {名称: [{'labels': {...}, 'value': 值}]},
+                       'histograms': {名称: [{'labels': {...}, 'count', 'sum', 'buckets': {上界: 累计数}}]},
+                       'cache_hit_ratio': {...}}
+        """
+        with self._lock:
+            counters = {
+                name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: [{'labels': dict(key), 'count': hist['count'], 'sum': hist['sum'],
+                        'buckets': dict(zip(map(str, self.buckets), hist['buckets']))}
+                       for key, hist in series.items()]
+                for name, series in self._histograms.items()
+            }
+        return {'counters': counters, 'histograms': histograms, 'cache_hit_ratio': self.cache_hit_ratio()}
+
+    def to_prometheus(self):
+        """
+        Prometheus文本格式（exposition format）
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(series.items()):
+                    for bound, count in zip(self.buckets, hist['buckets']):
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', str(bound))])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {hist['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {hist['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        """通知所有输出写出当前汇总（如Prometheus文本文件）"""
+        for sink in self.sinks:
+            sink.flush(self)
+
+    def close(self):
+        """写出汇总并关闭所有输出"""
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+
+
+class CallbackSink:
+    def __init__(self, callback):
+        """
+        回调输出：每个事件（请求完成、缓存查询）以dict调用 callback(event)
+        """
+        self.callback = callback
+
+    def emit(self, event):
+        self.callback(event)
+
+    def flush(self, metrics):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    def __init__(self, path):
+        """
+        JSON Lines输出：每个事件追加一行JSON，flush时追加一行指标快照（type=snapshot）
+        :param path: 输出文件路径
+        """
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def emit(self, event):
+        self._write(event)
+
+    def flush(self, metrics):
+        self._write(dict(metrics.snapshot(), type='snapshot', time=time.time()))
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusTextSink:
+    def __init__(self, path):
+        """
+        Prometheus文本文件输出（适用于node_exporter的textfile collector），flush时原子覆盖写入
+        :param path: 输出文件路径（通常以 .prom 结尾）
+        """
+        self.path = path
+
+    def emit(self, event):
+        pass
+
+    def flush(self, metrics):
+        atomic_write(self.path, metrics.to_prometheus().encode('utf-8'))
+
+    def close(self):
+        pass
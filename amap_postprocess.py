@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载后的图片处理
+将下载完成的地图重新编码（WebP/JPEG/优化PNG）、按最长边缩小并生成缩略图。
+编码在进程池中执行，下载线程只负责提交任务，CPU密集的图片处理与网络下载同时进行
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from amap_fileio import temp_path
+
+# 输出格式：{格式: (扩展名, PIL格式名)}
+FORMATS = {
+    'webp': ('.webp', 'WEBP'),
+    'jpeg': ('.jpg', 'JPEG'),
+    'png': ('.png', 'PNG'),
+}
+
+DEFAULT_OPTIONS = {
+    'format': 'webp',     # 输出格式 webp/jpeg/png（png为无损优化压缩），None时不转码
+    'quality': 85,        # webp/jpeg 质量 (1-100)
+    'lossless': False,    # webp 是否无损
+    'max_size': None,     # 输出图片最长边像素，超过时等比缩小，None时保持原尺寸
+    'thumbnails': [],     # 缩略图最长边像素列表，如 [256, 512]
+    'output_dir': None,   # 输出目录，None时与原图同目录
+}
+
+
+def _prepare_mode(image, fmt):
+    """转换为目标格式支持的颜色模式（JPEG不支持透明，调色板图片转为RGB/RGBA）"""
+    if fmt == 'jpeg':
+        return image if image.mode in ('RGB', 'L') else image.convert('RGB')
+    if fmt == 'webp' and image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        return image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+
+def _save(image, path, fmt, options):
+    """按格式编码并原子写入"""
+    kwargs = {}
+    if fmt == 'webp':
+        kwargs = {'quality': options['quality'], 'lossless': options['lossless'], 'method': 4}
+    elif fmt == 'jpeg':
+        kwargs = {'quality': options['quality'], 'optimize': True, 'progressive': True}
+    elif fmt == 'png':
+        kwargs = {'optimize': True}
+    tmp_path = temp_path(path)
+    try:
+        _prepare_mode(image, fmt).save(tmp_path, FORMATS[fmt][1], **kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return {'path': path, 'format': fmt, 'width': image.width, 'height': image.height,
+            'bytes': os.path.getsize(path)}
+
+
+def process_image(path, options=None):
+    """
+    处理一张图片（在工作进程中执行）
+
+    :param path: 下载完成的图片路径
+    :param options: 处理选项（见 DEFAULT_OPTIONS）
+    :return: dict {'source': 原图路径, 'outputs': [{'path', 'format', 'width', 'height', 'bytes'}], 'elapsed': 秒}
+    """
+    options = dict(DEFAULT_OPTIONS, **(options or {}))
+    start = time.perf_counter()
+    fmt = options['format']
+    if fmt is not None and fmt not in FORMATS:
+        raise ValueError(f"不支持的输出格式: {fmt}")
+
+    directory = options['output_dir'] or os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    root, ext = os.path.splitext(os.path.basename(path))
+    out_fmt = fmt or next((f for f, (e, _) in FORMATS.items() if e == ext.lower()), 'png')
+    out_ext = FORMATS[out_fmt][0]
+
+    outputs = []
+    with Image.open(path) as image:
+        image.load()
+        max_size = options['max_size']
+        resized = None
+        if max_size and max(image.size) > max_size:
+            resized = image.copy()
+            resized.thumbnail((max_size, max_size), Image.LANCZOS)
+        # 未转码也未缩小时不重写原图
+        if fmt is not None or resized is not None:
+            outputs.append(_save(resized or image, os.path.join(directory, root + out_ext), out_fmt, options))
+
+        for size in sorted(options['thumbnails'] or [], reverse=True):
+            thumb = (resized or image).copy()
+            thumb.thumbnail((size, size), Image.LANCZOS)
+            outputs.append(_save(thumb, os.path.join(directory, f"{root}_thumb{size}{out_ext}"), out_fmt, options))
+
+    return {'source': path, 'outputs': outputs, 'elapsed': time.perf_counter() - start}
+
+
+class PostProcessor:
+    def __init__(self, options=None, max_workers=None):
+        """
+        初始化图片后处理
+
+        下载完成的文件通过 submit 进入进程池的任务队列，由工作进程编码，
+        下载线程立即返回继续下一个请求；wait/close 时汇总处理结果。
+
+        :param options: 处理选项（见 DEFAULT_OPTIONS）
+        :param max_workers: 工作进程数，None时为CPU核数
+        """
+        self.options = dict(DEFAULT_OPTIONS, **(options or {}))
+        self.max_workers = max_workers
+        self._executor = None
+        self._futures = {}  # {Future: 原图路径}
+        self._lock = threading.Lock()
+
+    def submit(self, path):
+        """
+        提交一张下载完成的图片
+        :return: concurrent.futures.Future，结果同 process_image
+        """
+        with self._lock:
+            # 工作进程在第一次提交时才启动
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            future = self._executor.submit(process_image, path, self.options)
+            self._futures[future] = path
+        return future
+
+    def collect(self, future):
+        """
+        取回一张图片的处理结果并将其移出 wait 的汇总（处理失败由调用方报告）
+        :return: 结果同 process_image；处理失败时抛出异常
+        """
+        with self._lock:
+            self._futures.pop(future, None)
+        return future.result()
+
+    def wait(self):
+        """
+        等待所有已提交且未被 collect 取回的图片处理完成，并打印处理失败的图片
+        :return: dict {'processed': 成功数, 'failed': 失败数, 'bytes': 输出总字节数, 'errors': {原图路径: 错误信息}}
+        """
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        processed, total_bytes, errors = 0, 0, {}
+        for future, path in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                errors[path] = str(e)
+                continue
+            processed += 1
+            total_bytes += sum(output['bytes'] for output in result['outputs'])
+        for source, error in errors.items():
+            print(f"❌ 图片处理失败 {source}: {error}")
+        return {'processed': processed, 'failed': len(errors), 'bytes': total_bytes, 'errors': errors}
+
+    def close(self):
+        """等待剩余任务并关闭进程池"""
+        summary = self.wait()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        return summary
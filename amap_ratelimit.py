@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高德地图API限流器
+按接口（district/staticmap）配置QPS与突发量的令牌桶，可在多线程与asyncio任务间共享
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        """
+        令牌桶
+
+        :param rate: 每秒补充的令牌数（即QPS），<=0 表示不限流
+        :param burst: 桶容量（允许的瞬时突发请求数），默认等于max(1, rate)
+        """
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """
+        预约令牌，返回需要等待的秒数
+
+        令牌允许透支：调用方等待返回的时长后即视为获得令牌。
+        预约在锁内完成、等待在锁外进行，因此多个线程/协程可以同时排队而不互相阻塞。
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def wait_time(self, tokens=1):
+        """
+        估算现在获取令牌需要等待的秒数（不消耗令牌）
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            available = min(self.capacity, self._tokens + (time.monotonic() - self._updated) * self.rate)
+        return max(0.0, tokens - available) / self.rate
+
+    def acquire(self, tokens=1, sleep=None):
+        """
+        阻塞获取令牌（线程中使用）
+        :param sleep: 等待函数 sleep(秒数)，默认 time.sleep（传输层传入可被取消打断的等待）
+        :return: 实际等待的秒数
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            (sleep or time.sleep)(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        """
+        获取令牌（协程中使用，不阻塞事件循环）
+        :return: 实际等待的秒数
+        """
+        # asyncio 导入较慢，只在协程路径中使用（同步下载与GUI启动时不加载）
+        import asyncio
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    # 进程内按API密钥共享的限流器（同一密钥的配额由所有下载器共同遵守）
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, limits=None, default_qps=0):
+        """
+        按接口分组的限流器
+
+        :param limits: dict {接口名称: {'qps': 每秒请求数, 'burst': 突发量}}
+        :param default_qps: 未配置的接口使用的QPS，<=0 表示不限流
+        """
+        self._buckets = {}
+        self._default_qps = default_qps
+        self._lock = threading.Lock()
+        for endpoint, limit in (limits or {}).items():
+            self._buckets[endpoint] = TokenBucket(limit.get('qps', 0), limit.get('burst'))
+
+    @classmethod
+    def shared(cls, name, limits=None, default_qps=0):
+        """
+        获取进程内共享的限流器，同名（通常为API密钥）只创建一次
+        """
+        with cls._shared_lock:
+            if name not in cls._shared:
+                cls._shared[name] = cls(limits, default_qps)
+            return cls._shared[name]
+
+    def bucket(self, endpoint):
+        """获取接口对应的令牌桶"""
+        with self._lock:
+            if endpoint not in self._buckets:
+                self._buckets[endpoint] = TokenBucket(self._default_qps)
+            return self._buckets[endpoint]
+
+    def acquire(self, endpoint, tokens=1, sleep=None):
+        """
+        阻塞获取指定接口的令牌
+        :param sleep: 等待函数 sleep(秒数)，默认 time.sleep
+        :return: 实际等待的秒数
+        """
+        return self.bucket(endpoint).acquire(tokens, sleep)
+
+    async def acquire_async(self, endpoint, tokens=1):
+        """
+        协程中获取指定接口的令牌
+        :return: 实际等待的秒数
+        """
+        return await self.bucket(endpoint).acquire_async(tokens)
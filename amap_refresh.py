@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量刷新
+在输出目录中保存内容索引（每个输出文件的请求参数、内容SHA-256、大小与HTTP校验器 ETag/Last-Modified），
+重新下载时内容未变化的文件保持原样（不重写、修改时间不变），并输出本次新增/变化文件的变更列表，
+下游任务只需处理变化的部分
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from amap_cache import ImageCache
+from amap_fileio import atomic_write
+
+INDEX_NAME = '.amap_index.json'
+CHANGES_NAME = 'changes.json'
+
+# 记录到索引中的参数值超过该长度时（如边界路径paths）只保存其哈希
+_MAX_PARAM_LENGTH = 256
+
+
+def describe_params(params):
+    """
+    索引中保存的请求参数（去掉API密钥，过长的值以SHA-256代替）
+    """
+    described = {}
+    for name, value in params.items():
+        if name == 'key' or value is None:
+            continue
+        value = str(value)
+        if len(value) > _MAX_PARAM_LENGTH:
+            value = 'sha256:' + hashlib.sha256(value.encode('utf-8')).hexdigest()
+        described[name] = value
+    return described
+
+
+class RefreshIndex:
+    def __init__(self, directory):
+        """
+        输出目录的内容索引（线程安全），索引文件为 directory/.amap_index.json，
+        文件以相对于目录的路径为键，目录整体移动后索引仍然有效
+
+        :param directory: 输出目录
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_NAME)
+        self.changes = []
+        self._lock = threading.Lock()
+        self._files = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._files = json.load(f).get('files', {})
+        except (OSError, ValueError):
+            pass
+
+    def _name(self, filepath):
+        return os.path.relpath(os.path.abspath(filepath), os.path.abspath(self.directory))
+
+    def lookup(self, filepath, params):
+        """
+        查找输出文件上一次下载的记录
+        :return: (记录, 请求参数是否相同)；文件不存在或没有记录时返回 (None, False)
+        """
+        with self._lock:
+            entry = self._files.get(self._name(filepath))
+        if entry is None or not os.path.exists(filepath):
+            return None, False
+        return entry, entry.get('request') == ImageCache.request_key(params)
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        上一次响应的HTTP校验器对应的条件请求头，服务端支持时内容未变化返回304（不传输图片）
+        """
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def record(self, filepath, params, sha256, size, status, etag=None, last_modified=None):
+        """
+        记录一次下载结果
+        :param status: 'added'（新文件）、'changed'（内容变化，已重写）或 'unchanged'（未重写）
+        """
+        name = self._name(filepath)
+        with self._lock:
+            previous = self._files.get(name, {})
+            self._files[name] = {
+                'request': ImageCache.request_key(params),
+                'params': describe_params(params),
+                'sha256': sha256,
+                'bytes': size,
+                # 304响应不一定携带校验器，沿用上一次的
+                'etag': etag or (previous.get('etag') if status == 'unchanged' else None),
+                'last_modified': last_modified or (previous.get('last_modified') if status == 'unchanged' else None),
+                'checked': time.time(),
+                'updated': previous.get('updated') if status == 'unchanged' else time.time(),
+            }
+            self.changes.append({'filepath': filepath, 'status': status, 'sha256': sha256, 'bytes': size})
+
+    @staticmethod
+    def _count(changes):
+        counts = {'added': 0, 'changed': 0, 'unchanged': 0}
+        for change in changes:
+            counts[change['status']] += 1
+        return counts
+
+    def summary(self):
+        """
+        本次运行（上一次保存之后）的变化统计
+        :return: dict {'added', 'changed', 'unchanged'}
+        """
+        with self._lock:
+            return self._count(self.changes)
+
+    def save(self):
+        """
+        原子写入索引与本次运行的变更列表（directory/changes.json），之后开始新的一次运行：
+        同一个实例被多次使用（如GUI中长期使用的下载器）时，每个变更列表只包含上一次保存之后的变化
+        :return: (变更列表文件路径, 本次运行的变化统计 {'added', 'changed', 'unchanged'})
+        """
+        with self._lock:
+            index = {'version': 1, 'files': self._files}
+            changes = {
+                'generated': time.time(),
+                'added': [c['filepath'] for c in self.changes if c['status'] == 'added'],
+                'changed': [c['filepath'] for c in self.changes if c['status'] == 'changed'],
+                'unchanged': [c['filepath'] for c in self.changes if c['status'] == 'unchanged'],
+            }
+            counts = self._count(self.changes)
+            atomic_write(self.path, json.dumps(index, ensure_ascii=False, indent=1).encode('utf-8'))
+            self.changes = []
+        changes_path = os.path.join(self.directory, CHANGES_NAME)
+        atomic_write(changes_path, json.dumps(changes, ensure_ascii=False, indent=2).encode('utf-8'))
+        return changes_path, counts
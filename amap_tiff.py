@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分块TIFF/BigTIFF写入器
+按256×256分块从数组（可为numpy.memmap）中流式读取、压缩并写入，内存占用与图片大小无关；
+支持GeoTIFF地理参考标签（EPSG:3857）与逐级缩小的内部概览图层。
+TiledTiffReader 按行读取这种分块TIFF，只解码所需行所在的分块
+"""
+
+import os
+import struct
+import tempfile
+import zlib
+
+import cv2
+import numpy as np
+
+# TIFF数据类型
+ASCII = 2
+SHORT = 3
+LONG = 4
+DOUBLE = 12
+LONG8 = 16
+
+_TYPE_FORMATS = {ASCII: 'B', SHORT: 'H', LONG: 'I', DOUBLE: 'd', LONG8: 'Q'}
+_TYPE_SIZES = {ASCII: 1, SHORT: 2, LONG: 4, DOUBLE: 8, LONG8: 8}
+
+# 常用标签
+TAG_NEW_SUBFILE_TYPE = 254
+TAG_IMAGE_WIDTH = 256
+TAG_IMAGE_LENGTH = 257
+TAG_BITS_PER_SAMPLE = 258
+TAG_COMPRESSION = 259
+TAG_PHOTOMETRIC = 262
+TAG_SAMPLES_PER_PIXEL = 277
+TAG_PLANAR_CONFIG = 284
+TAG_PREDICTOR = 317
+TAG_TILE_WIDTH = 322
+TAG_TILE_LENGTH = 323
+TAG_TILE_OFFSETS = 324
+TAG_TILE_BYTE_COUNTS = 325
+TAG_SAMPLE_FORMAT = 339
+
+COMPRESSION_NONE = 1
+COMPRESSION_DEFLATE = 8
+
+# GeoTIFF标签
+TAG_MODEL_PIXEL_SCALE = 33550
+TAG_MODEL_TIEPOINT = 33922
+TAG_GEO_KEY_DIRECTORY = 34735
+
+# GeoKey：投影坐标系 EPSG:3857（Web墨卡托），单位米，像素表示面积
+_GEO_KEYS = [
+    1, 1, 0, 4,          # 版本 1.1.0，共4个键
+    1024, 0, 1, 1,       # GTModelTypeGeoKey = ModelTypeProjected
+    1025, 0, 1, 1,       # GTRasterTypeGeoKey = RasterPixelIsArea
+    3072, 0, 1, 3857,    # ProjectedCSTypeGeoKey = EPSG:3857
+    3076, 0, 1, 9001,    # ProjLinearUnitsGeoKey = 米
+]
+
+# 概览图层构建时每次读取的行数（须为偶数），内存占用与图片高度无关
+OVERVIEW_STRIP_ROWS = 1024
+
+# 超过该大小（字节）时自动使用BigTIFF（经典TIFF的偏移量为32位）
+BIGTIFF_THRESHOLD = 2 ** 32 - 2 ** 25
+
+
+class TiledTiffWriter:
+    def __init__(self, path, bigtiff=False, tile_size=256, compress=True, compress_level=6):
+        """
+        分块TIFF写入器，支持多页（如金字塔概览图层）
+
+        :param path: 输出文件路径
+        :param bigtiff: 是否写入BigTIFF（64位偏移，适合超过4GB的图片）
+        :param tile_size: 分块尺寸（须为16的倍数）
+        :param compress: 是否使用Deflate压缩（配合水平差分预测）
+        :param compress_level: zlib压缩级别
+        """
+        self.bigtiff = bigtiff
+        self.tile_size = tile_size
+        self.compress = compress
+        self.compress_level = compress_level
+        self._offset_format = '<Q' if bigtiff else '<I'
+        self._file = open(path, 'wb')
+        if bigtiff:
+            self._file.write(b'II' + struct.pack('<HHHQ', 43, 8, 0, 0))
+            self._next_ifd_pointer = 8
+        else:
+            self._file.write(b'II' + struct.pack('<HI', 42, 0))
+            self._next_ifd_pointer = 4
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add_page(self, image, subfile_type=0, extra_tags=None):
+        """
+        写入一页图像
+        :param image: (高, 宽, 3) uint8 RGB数组，可为numpy.memmap
+        :param subfile_type: NewSubfileType（0=主图，1=缩略/概览图）
+        :param extra_tags: 额外标签列表 [(tag, type, values), ...]
+        """
+        height, width = image.shape[:2]
+        samples = image.shape[2] if image.ndim == 3 else 1
+        tile = self.tile_size
+        offsets, counts = [], []
+
+        for top in range(0, height, tile):
+            for left in range(0, width, tile):
+                block = np.zeros((tile, tile, samples), dtype=np.uint8)
+                part = np.asarray(image[top:top + tile, left:left + tile]).reshape(-1, min(tile, width - left), samples)
+                block[:part.shape[0], :part.shape[1]] = part
+                data = self._encode(block)
+                offsets.append(self._file.tell())
+                counts.append(len(data))
+                self._file.write(data)
+
+        offset_type = LONG8 if self.bigtiff else LONG
+        tags = [
+            (TAG_NEW_SUBFILE_TYPE, LONG, [subfile_type]),
+            (TAG_IMAGE_WIDTH, LONG, [width]),
+            (TAG_IMAGE_LENGTH, LONG, [height]),
+            (TAG_BITS_PER_SAMPLE, SHORT, [8] * samples),
+            (TAG_COMPRESSION, SHORT, [COMPRESSION_DEFLATE if self.compress else COMPRESSION_NONE]),
+            (TAG_PHOTOMETRIC, SHORT, [2 if samples >= 3 else 1]),
+            (TAG_SAMPLES_PER_PIXEL, SHORT, [samples]),
+            (TAG_PLANAR_CONFIG, SHORT, [1]),
+            (TAG_TILE_WIDTH, SHORT, [tile]),
+            (TAG_TILE_LENGTH, SHORT, [tile]),
+            (TAG_TILE_OFFSETS, offset_type, offsets),
+            (TAG_TILE_BYTE_COUNTS, offset_type, counts),
+            (TAG_SAMPLE_FORMAT, SHORT, [1] * samples),
+        ]
+        if self.compress:
+            tags.append((TAG_PREDICTOR, SHORT, [2]))
+        tags.extend(extra_tags or [])
+        self._write_ifd(sorted(tags, key=lambda t: t[0]))
+
+    def _encode(self, block):
+        if not self.compress:
+            return block.tobytes()
+        # 水平差分预测（Predictor=2）：逐行对同一通道做差分，大幅提升地图类图片的压缩率
+        diff = block.copy()
+        diff[:, 1:] -= block[:, :-1]
+        return zlib.compress(diff.tobytes(), self.compress_level)
+
+    def _write_ifd(self, tags):
+        f = self._file
+        inline_size = 8 if self.bigtiff else 4
+        entries = []
+        # 先写入放不进目录项的标签值
+        for tag, dtype, values in tags:
+            if dtype == ASCII:
+                values = list(values.encode('ascii') + b'\0') if isinstance(values, str) else values
+            payload = struct.pack(f'<{len(values)}{_TYPE_FORMATS[dtype]}', *values)
+            if len(payload) > inline_size:
+                if f.tell() % 2:
+                    f.write(b'\0')
+                value_offset = f.tell()
+                f.write(payload)
+                value = struct.pack(self._offset_format, value_offset)
+            else:
+                value = payload.ljust(inline_size, b'\0')
+            entries.append((tag, dtype, len(values), value))
+
+        if f.tell() % 2:
+            f.write(b'\0')
+        ifd_offset = f.tell()
+        if self.bigtiff:
+            f.write(struct.pack('<Q', len(entries)))
+            for tag, dtype, count, value in entries:
+                f.write(struct.pack('<HHQ', tag, dtype, count) + value)
+        else:
+            f.write(struct.pack('<H', len(entries)))
+            for tag, dtype, count, value in entries:
+                f.write(struct.pack('<HHI', tag, dtype, count) + value)
+        next_pointer = f.tell()
+        f.write(struct.pack(self._offset_format, 0))
+
+        # 回填上一页（或文件头）指向本页的偏移
+        f.seek(self._next_ifd_pointer)
+        f.write(struct.pack(self._offset_format, ifd_offset))
+        f.seek(0, 2)
+        self._next_ifd_pointer = next_pointer
+
+    def close(self):
+        """关闭文件"""
+        if not self._file.closed:
+            self._file.close()
+
+
+class TiledTiffReader:
+    def __init__(self, path):
+        """
+        分块TIFF读取器（读取第一页，即主图），按行条带解码，内存占用只与读取的行数有关
+
+        支持 TiledTiffWriter 写入的格式：小端序经典TIFF或BigTIFF、分块存储、8位、
+        无压缩或Deflate压缩（可带水平差分预测）。其它TIFF抛出 ValueError，可改用 OpenCV 整张读取。
+
+        :param path: 文件路径
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._read_header()
+        except Exception:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _read_header(self):
+        f = self._file
+        header = f.read(16)
+        if header[:2] != b'II':
+            raise ValueError(f"不支持的TIFF字节序: {self.path}")
+        version, = struct.unpack('<H', header[2:4])
+        if version == 43:  # BigTIFF
+            offset_format, count_format, entry_format = '<Q', '<Q', '<HHQ8s'
+            offset, = struct.unpack('<Q', header[8:16])
+        elif version == 42:
+            offset_format, count_format, entry_format = '<I', '<H', '<HHI4s'
+            offset, = struct.unpack('<I', header[4:8])
+        else:
+            raise ValueError(f"不是TIFF文件: {self.path}")
+        f.seek(offset)
+        count, = struct.unpack(count_format, f.read(struct.calcsize(count_format)))
+        entry_size = struct.calcsize(entry_format)
+        entries = [struct.unpack(entry_format, f.read(entry_size)) for _ in range(count)]
+        self.tags = {}
+        for code, dtype, n, value in entries:
+            if dtype not in _TYPE_FORMATS:
+                continue
+            size = _TYPE_SIZES[dtype] * n
+            if size > len(value):  # 值放不下时字段存放的是偏移量
+                f.seek(struct.unpack(offset_format, value)[0])
+                value = f.read(size)
+            self.tags[code] = list(struct.unpack(f'<{n}{_TYPE_FORMATS[dtype]}', value[:size]))
+
+        def tag(code, default=None):
+            values = self.tags.get(code)
+            return values[0] if values else default
+
+        if TAG_TILE_WIDTH not in self.tags or TAG_TILE_OFFSETS not in self.tags:
+            raise ValueError(f"不是分块存储的TIFF: {self.path}")
+        self.width, self.height = tag(TAG_IMAGE_WIDTH), tag(TAG_IMAGE_LENGTH)
+        self.samples = tag(TAG_SAMPLES_PER_PIXEL, 1)
+        self.tile_width, self.tile_length = tag(TAG_TILE_WIDTH), tag(TAG_TILE_LENGTH)
+        self.compression = tag(TAG_COMPRESSION, COMPRESSION_NONE)
+        self.predictor = tag(TAG_PREDICTOR, 1)
+        if (set(self.tags.get(TAG_BITS_PER_SAMPLE, [8])) != {8} or tag(TAG_PLANAR_CONFIG, 1) != 1
+                or self.compression not in (COMPRESSION_NONE, COMPRESSION_DEFLATE) or self.predictor not in (1, 2)):
+            raise ValueError(f"不支持的TIFF编码: {self.path}")
+        self.offsets = self.tags[TAG_TILE_OFFSETS]
+        self.byte_counts = self.tags[TAG_TILE_BYTE_COUNTS]
+        self.tiles_across = -(-self.width // self.tile_width)
+
+    @property
+    def shape(self):
+        """(高, 宽, 通道数)"""
+        return self.height, self.width, self.samples
+
+    @property
+    def transform(self):
+        """
+        GeoTIFF地理参考 (左上角X, 左上角Y, 像素宽, 像素高)，单位米（与 geotiff_tags 对应）；没有地理参考时为None
+        """
+        scale, tiepoint = self.tags.get(TAG_MODEL_PIXEL_SCALE), self.tags.get(TAG_MODEL_TIEPOINT)
+        if not scale or not tiepoint or len(tiepoint) < 6:
+            return None
+        i, j, _, x, y, _ = tiepoint[:6]
+        return x - i * scale[0], y + j * scale[1], scale[0], scale[1]
+
+    def _read_tile(self, index):
+        self._file.seek(self.offsets[index])
+        data = self._file.read(self.byte_counts[index])
+        if self.compression == COMPRESSION_DEFLATE:
+            data = zlib.decompress(data)
+        tile = np.frombuffer(data, dtype=np.uint8).reshape(self.tile_length, self.tile_width, self.samples)
+        if self.predictor == 2:
+            # 还原水平差分预测：逐行对同一通道累加（按uint8回绕）
+            tile = np.cumsum(tile, axis=1, dtype=np.uint8)
+        return tile
+
+    def read_rows(self, top, bottom):
+        """
+        读取 [top, bottom) 行
+        :return: (行数, 宽, 通道数) uint8 数组
+        """
+        bottom = min(bottom, self.height)
+        out = np.empty((max(0, bottom - top), self.width, self.samples), dtype=np.uint8)
+        for tile_row in range(top // self.tile_length, -(-bottom // self.tile_length)):
+            y0 = tile_row * self.tile_length
+            src0, src1 = max(top, y0) - y0, min(bottom, y0 + self.tile_length) - y0
+            for tile_col in range(self.tiles_across):
+                x0 = tile_col * self.tile_width
+                x1 = min(self.width, x0 + self.tile_width)
+                tile = self._read_tile(tile_row * self.tiles_across + tile_col)
+                out[y0 + src0 - top:y0 + src1 - top, x0:x1] = tile[src0:src1, :x1 - x0]
+        return out
+
+    def close(self):
+        """关闭文件"""
+        self._file.close()
+
+
+def write_tiled_tiff(path, image, bigtiff=None, tile_size=256, compress=True, extra_tags=None):
+    """
+    将RGB数组写为分块TIFF
+    :param path: 输出文件路径
+    :param image: (高, 宽, 3) uint8 数组，可为numpy.memmap
+    :param bigtiff: 是否使用BigTIFF，None时按图片大小自动选择
+    :param tile_size: 分块尺寸
+    :param compress: 是否使用Deflate压缩
+    :param extra_tags: 额外标签列表 [(tag, type, values), ...]
+    """
+    if bigtiff is None:
+        bigtiff = image.nbytes >= BIGTIFF_THRESHOLD
+    with TiledTiffWriter(path, bigtiff=bigtiff, tile_size=tile_size, compress=compress) as writer:
+        writer.add_page(image, extra_tags=extra_tags)
+
+
+def geotiff_tags(transform):
+    """
+    GeoTIFF地理参考标签（EPSG:3857）
+    :param transform: (左上角X, 左上角Y, 像素宽, 像素高)，单位米（见 amap_tiles.georef_transform）
+    :return: 标签列表，用于 add_page 的 extra_tags
+    """
+    x, y, pixel_width, pixel_height = transform
+    return [
+        (TAG_MODEL_PIXEL_SCALE, DOUBLE, [pixel_width, pixel_height, 0.0]),
+        (TAG_MODEL_TIEPOINT, DOUBLE, [0.0, 0.0, 0.0, x, y, 0.0]),
+        (TAG_GEO_KEY_DIRECTORY, SHORT, _GEO_KEYS),
+    ]
+
+
+def build_overview(image, out=None):
+    """
+    将图片缩小为1/2（2×2区域平均，cv2.INTER_AREA），按行条带处理，源图片可为numpy.memmap
+    :param image: (高, 宽, 通道) uint8 数组
+    :param out: 输出数组（形状为向上取整的一半），None时新建
+    :return: 缩小后的数组
+    """
+    height, width = image.shape[:2]
+    out_height, out_width = (height + 1) // 2, (width + 1) // 2
+    if out is None:
+        out = np.empty((out_height, out_width) + image.shape[2:], dtype=image.dtype)
+    for top in range(0, height, OVERVIEW_STRIP_ROWS):
+        strip = np.asarray(image[top:top + OVERVIEW_STRIP_ROWS])
+        # 奇数行/列复制边缘补齐，保证每个条带都是精确的2倍缩小，条带之间没有接缝
+        pad_rows, pad_cols = strip.shape[0] % 2, width % 2
+        if pad_rows or pad_cols:
+            strip = np.pad(strip, ((0, pad_rows), (0, pad_cols)) + ((0, 0),) * (strip.ndim - 2), mode='edge')
+        half = cv2.resize(strip, (strip.shape[1] // 2, strip.shape[0] // 2), interpolation=cv2.INTER_AREA)
+        out[top // 2:top // 2 + half.shape[0]] = half.reshape(half.shape[:2] + image.shape[2:])
+    return out
+
+
+def write_geotiff(path, image, transform, overviews=True, bigtiff=None, tile_size=256, compress=True,
+                  memmap_threshold=64 * 1024 * 1024, buffer_dir=None):
+    """
+    写入带地理参考（EPSG:3857）的分块压缩GeoTIFF，并附带逐级缩小的内部概览图层
+
+    概览图层依次缩小为1/2，直到不超过一个分块，作为 NewSubfileType=1 的后续页面写入，
+    GIS软件（QGIS/GDAL）打开大图时直接读取合适的概览层，无需解码全分辨率图片。
+
+    :param path: 输出文件路径
+    :param image: (高, 宽, 3) uint8 RGB数组，可为numpy.memmap
+    :param transform: (左上角X, 左上角Y, 像素宽, 像素高)，单位米
+    :param overviews: 是否生成概览图层
+    :param bigtiff: 是否使用BigTIFF，None时按图片大小自动选择
+    :param tile_size: 分块尺寸
+    :param compress: 是否使用Deflate压缩
+    :param memmap_threshold: 源图片为numpy.memmap时，超过该字节数的概览图层也使用磁盘映射
+    :param buffer_dir: 概览图层映射缓冲文件所在目录，None时使用输出文件所在目录（不使用可能是内存盘的系统临时目录）
+    """
+    if bigtiff is None:
+        bigtiff = image.nbytes * 4 // 3 >= BIGTIFF_THRESHOLD
+    if buffer_dir is None:
+        buffer_dir = os.path.dirname(os.path.abspath(path))
+    buffers = []
+    try:
+        with TiledTiffWriter(path, bigtiff=bigtiff, tile_size=tile_size, compress=compress) as writer:
+            writer.add_page(image, extra_tags=geotiff_tags(transform))
+            level = image
+            while overviews and max(level.shape[:2]) > tile_size:
+                shape = ((level.shape[0] + 1) // 2, (level.shape[1] + 1) // 2) + level.shape[2:]
+                out = None
+                if isinstance(image, np.memmap) and np.prod(shape) > memmap_threshold:
+                    handle, buffer_path = tempfile.mkstemp(suffix='.overview', prefix='.', dir=buffer_dir)
+                    os.close(handle)
+                    buffers.append(buffer_path)
+                    out = np.memmap(buffer_path, dtype=np.uint8, mode='w+', shape=shape)
+                level = build_overview(level, out)
+                writer.add_page(level, subfile_type=1)
+    finally:
+        level = out = None
+        for buffer_path in buffers:
+            try:
+                os.remove(buffer_path)
+            except OSError:
+                pass
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Web墨卡托瓦片拼接引擎
+将区域边界范围按指定缩放级别切分为静态地图瓦片网格，下载后无缝拼接为一张大图
+拼接画布支持内存（PIL）与磁盘映射（numpy.memmap + 分块BigTIFF）两种后端
+"""
+
+import io
+import math
+import os
+import threading
+
+import numpy as np
+
+from amap_fileio import atomic_write
+
+# 坐标换算与地理参考只依赖numpy；图片编解码（PIL、OpenCV）与TIFF写入只在拼接画布中使用，首次使用时才导入，
+# 单图下载与命令行启动不加载这些模块
+
+# Web墨卡托在zoom=0时的世界像素宽度
+WORLD_TILE_SIZE = 256
+# Web墨卡托有效纬度范围
+MAX_LATITUDE = 85.05112878
+# Web墨卡托（EPSG:3857）地球半径（米）
+EARTH_RADIUS = 6378137.0
+
+
+def lnglat_to_pixel(lng, lat, zoom):
+    """
+    经纬度转换为指定缩放级别下的全局像素坐标（Web墨卡托）
+    :return: (x, y) 浮点像素坐标，原点为左上角
+    """
+    world = WORLD_TILE_SIZE * (2 ** zoom)
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    sin_lat = math.sin(math.radians(lat))
+    x = (lng + 180.0) / 360.0 * world
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * world
+    return x, y
+
+
+def lnglat_array_to_pixel(coords, zoom):
+    """
+    批量将经纬度转换为全局像素坐标（lnglat_to_pixel的向量化版本）
+    :param coords: (N, 2) 数组 [经度, 纬度]
+    :return: (N, 2) float64 数组 [x, y]
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    world = WORLD_TILE_SIZE * (2 ** zoom)
+    sin_lat = np.sin(np.radians(np.clip(coords[:, 1], -MAX_LATITUDE, MAX_LATITUDE)))
+    pixels = np.empty_like(coords)
+    pixels[:, 0] = (coords[:, 0] + 180.0) / 360.0 * world
+    pixels[:, 1] = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)) * world
+    return pixels
+
+
+def pixel_to_lnglat(x, y, zoom):
+    """
+    全局像素坐标转换为经纬度（lnglat_to_pixel的逆运算）
+    :return: (lng, lat)
+    """
+    world = WORLD_TILE_SIZE * (2 ** zoom)
+    lng = x / world * 360.0 - 180.0
+    n = math.pi - 2 * math.pi * y / world
+    lat = math.degrees(math.atan(math.sinh(n)))
+    return lng, lat
+
+
+def parse_size(size):
+    """
+    解析尺寸字符串 "宽*高"
+    :return: (宽, 高)
+    """
+    width, height = size.split('*')
+    return int(width), int(height)
+
+
+def plan_tile_grid(bounds, zoom, tile_size="1024*1024"):
+    """
+    计算覆盖边界范围的瓦片网格
+
+    在全局像素空间中将边界外接矩形取整，按瓦片尺寸划分网格并使网格居中覆盖该矩形。
+    相邻瓦片中心严格相距一个瓦片宽/高（像素），因此拼接后既无重叠也无缝隙。
+
+    :param bounds: analyze_boundary 返回的 bounds（min_lng/max_lng/min_lat/max_lat）
+    :param zoom: 缩放级别
+    :param tile_size: 单个瓦片尺寸 "宽*高"（静态地图API单次请求的尺寸，建议为偶数）
+    :return: dict包含 zoom, tile_width, tile_height, rows, cols, origin（网格左上角全局像素）,
+             crop（区域矩形相对网格的 x, y, 宽, 高，单位为逻辑像素）以及 tiles 列表
+    """
+    tile_width, tile_height = parse_size(tile_size)
+
+    left, bottom = lnglat_to_pixel(bounds['min_lng'], bounds['min_lat'], zoom)
+    right, top = lnglat_to_pixel(bounds['max_lng'], bounds['max_lat'], zoom)
+    left, top = math.floor(left), math.floor(top)
+    right, bottom = math.ceil(right), math.ceil(bottom)
+    width, height = max(1, right - left), max(1, bottom - top)
+
+    cols = math.ceil(width / tile_width)
+    rows = math.ceil(height / tile_height)
+    origin_x = left - (cols * tile_width - width) // 2
+    origin_y = top - (rows * tile_height - height) // 2
+
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            center_x = origin_x + col * tile_width + tile_width / 2
+            center_y = origin_y + row * tile_height + tile_height / 2
+            lng, lat = pixel_to_lnglat(center_x, center_y, zoom)
+            tiles.append({
+                'row': row,
+                'col': col,
+                'center': f"{lng:.6f},{lat:.6f}",
+            })
+
+    return {
+        'zoom': zoom,
+        'tile_width': tile_width,
+        'tile_height': tile_height,
+        'rows': rows,
+        'cols': cols,
+        'origin': (origin_x, origin_y),
+        'crop': (left - origin_x, top - origin_y, width, height),
+        'tiles': tiles,
+    }
+
+
+def static_map_georef(center, zoom, size, scale=1):
+    """
+    静态地图图片的地理参考（高德静态地图以 location 为图片中心、按Web墨卡托渲染）
+
+    :param center: 中心点 "经度,纬度"
+    :param zoom: 缩放级别
+    :param size: 图片尺寸 "宽*高"（逻辑像素）
+    :param scale: 图片清晰度，高清(scale=2)图片的实际像素是逻辑尺寸的2倍
+    :return: dict {'zoom', 'scale', 'left', 'top', 'width', 'height'}，
+             left/top 为图片左上角在该缩放级别下的全局像素坐标，width/height 为逻辑像素
+    """
+    lng, lat = (float(v) for v in center.split(','))
+    width, height = parse_size(size)
+    x, y = lnglat_to_pixel(lng, lat, zoom)
+    return {'zoom': zoom, 'scale': scale, 'left': x - width / 2, 'top': y - height / 2,
+            'width': width, 'height': height}
+
+
+def grid_georef(grid, scale=1, crop=True):
+    """
+    拼接图片的地理参考（格式同 static_map_georef）
+    :param grid: plan_tile_grid 返回的网格
+    :param crop: 拼接时是否裁剪到区域外接矩形
+    """
+    origin_x, origin_y = grid['origin']
+    if crop:
+        x, y, width, height = grid['crop']
+    else:
+        x, y = 0, 0
+        width, height = grid['cols'] * grid['tile_width'], grid['rows'] * grid['tile_height']
+    return {'zoom': grid['zoom'], 'scale': scale, 'left': origin_x + x, 'top': origin_y + y,
+            'width': width, 'height': height}
+
+
+def georef_bounds(georef):
+    """
+    地理参考对应的经纬度范围
+    :return: (最小经度, 最小纬度, 最大经度, 最大纬度)
+    """
+    zoom = georef['zoom']
+    min_lng, max_lat = pixel_to_lnglat(georef['left'], georef['top'], zoom)
+    max_lng, min_lat = pixel_to_lnglat(georef['left'] + georef['width'], georef['top'] + georef['height'], zoom)
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def georef_transform(georef):
+    """
+    地理参考对应的Web墨卡托（EPSG:3857）仿射参数
+    :return: (左上角X, 左上角Y, 像素宽, 像素高)，单位米；像素为图片实际像素（高清图为逻辑像素的一半）
+    """
+    world = WORLD_TILE_SIZE * (2 ** georef['zoom'])
+    meters_per_pixel = 2 * math.pi * EARTH_RADIUS / world
+    x = georef['left'] * meters_per_pixel - math.pi * EARTH_RADIUS
+    y = math.pi * EARTH_RADIUS - georef['top'] * meters_per_pixel
+    pixel_size = meters_per_pixel / georef.get('scale', 1)
+    return x, y, pixel_size, pixel_size
+
+
+def transform_georef(transform, width, height):
+    """
+    由Web墨卡托仿射参数反推地理参考（georef_transform 的逆运算），用于读取已有的GeoTIFF或带world file的图片
+    :param transform: (左上角X, 左上角Y, 像素宽, 像素高)，单位米
+    :param width: 图片宽（像素）
+    :param height: 图片高（像素）
+    :return: 地理参考（scale=1，缩放级别为图片实际像素对应的级别）
+    :raises ValueError: 像素不是正方形或不对应整数缩放级别（不是按瓦片级别下载的图片）
+    """
+    x, y, pixel_width, pixel_height = transform
+    zoom = math.log2(2 * math.pi * EARTH_RADIUS / (WORLD_TILE_SIZE * pixel_width)) if pixel_width > 0 else 0.5
+    if abs(zoom - round(zoom)) > 1e-6 or not math.isclose(pixel_width, pixel_height, rel_tol=1e-6):
+        raise ValueError(f"像素尺寸 {pixel_width}×{pixel_height} 米不对应整数瓦片缩放级别")
+    zoom = int(round(zoom))
+    return {'zoom': zoom, 'scale': 1, 'left': int(round((x + math.pi * EARTH_RADIUS) / pixel_width)),
+            'top': int(round((math.pi * EARTH_RADIUS - y) / pixel_width)), 'width': width, 'height': height}
+
+
+# EPSG:3857 的WKT（写入 .prj，供不读取world file坐标系的GIS软件识别）
+WEB_MERCATOR_WKT = (
+    'PROJCS["WGS_1984_Web_Mercator_Auxiliary_Sphere",GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",'
+    'SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],'
+    'PROJECTION["Mercator_Auxiliary_Sphere"],PARAMETER["False_Easting",0.0],PARAMETER["False_Northing",0.0],'
+    'PARAMETER["Central_Meridian",0.0],PARAMETER["Standard_Parallel_1",0.0],'
+    'PARAMETER["Auxiliary_Sphere_Type",0.0],UNIT["Meter",1.0]]'
+)
+
+
+def world_file_paths(image_path):
+    """
+    图片的 world file 与 .prj 文件路径
+    :return: [world file路径, .prj路径]
+    """
+    root, ext = os.path.splitext(image_path)
+    # world file 扩展名：扩展名首尾字母 + w（.png -> .pgw，.jpg -> .jgw，.tif -> .tfw）
+    world_path = f"{root}.{ext[1]}{ext[-1]}w" if len(ext) >= 3 else f"{root}.wld"
+    return [world_path, f"{root}.prj"]
+
+
+def write_world_file(image_path, georef):
+    """
+    为图片写入world file（如 .png -> .pgw）与 .prj 坐标系文件
+    :return: 写入的文件路径列表
+    """
+    x, y, pixel_width, pixel_height = georef_transform(georef)
+    world_path, prj_path = world_file_paths(image_path)
+    # 依次为：像素宽、旋转、旋转、-像素高、左上角像素中心的X、Y
+    lines = [pixel_width, 0.0, 0.0, -pixel_height, x + pixel_width / 2, y - pixel_height / 2]
+    atomic_write(world_path, ''.join(f"{value:.10f}\n" for value in lines).encode('ascii'))
+    atomic_write(prj_path, WEB_MERCATOR_WKT.encode('ascii'))
+    return [world_path, prj_path]
+
+
+def read_world_file(image_path):
+    """
+    读取图片的world file（write_world_file 的逆运算）
+    :return: (左上角X, 左上角Y, 像素宽, 像素高)，单位米；没有world file时为None
+    """
+    world_path = world_file_paths(image_path)[0]
+    if not os.path.exists(world_path):
+        return None
+    with open(world_path, 'r', encoding='ascii') as f:
+        values = [float(line) for line in f.read().split()]
+    if len(values) != 6 or values[1] or values[2]:
+        raise ValueError(f"不支持的world file（须为6行且无旋转）: {world_path}")
+    pixel_width, pixel_height = values[0], -values[3]
+    # world file记录的是左上角像素的中心
+    return values[4] - pixel_width / 2, values[5] + pixel_height / 2, pixel_width, pixel_height
+
+
+class _Canvas:
+    """拼接画布基类：瓦片到达后立即按网格位置写入，只保留裁剪后的区域"""
+
+    def __init__(self, grid, scale=1, crop=True):
+        """
+        :param grid: plan_tile_grid 返回的网格
+        :param scale: 图片清晰度，高清(scale=2)瓦片的实际像素是逻辑尺寸的2倍
+        :param crop: 是否裁剪到区域外接矩形
+        """
+        self.grid = grid
+        self.tile_px = (grid['tile_width'] * scale, grid['tile_height'] * scale)
+        if crop:
+            x, y, width, height = grid['crop']
+            self.offset = (x * scale, y * scale)
+            self.size = (width * scale, height * scale)
+        else:
+            self.offset = (0, 0)
+            self.size = (grid['cols'] * self.tile_px[0], grid['rows'] * self.tile_px[1])
+
+    def _placement(self, row, col, tile_w, tile_h):
+        """计算瓦片在画布中的目标区域与瓦片内的源区域（已裁剪到画布范围）"""
+        dest_x = col * self.tile_px[0] - self.offset[0]
+        dest_y = row * self.tile_px[1] - self.offset[1]
+        left, top = max(0, dest_x), max(0, dest_y)
+        right = min(self.size[0], dest_x + tile_w)
+        bottom = min(self.size[1], dest_y + tile_h)
+        if right <= left or bottom <= top:
+            return None
+        return (left, top, right, bottom), (left - dest_x, top - dest_y, right - dest_x, bottom - dest_y)
+
+    def paste(self, row, col, data):
+        """写入一个瓦片（图片二进制数据），可在多个下载线程中并发调用"""
+        raise NotImplementedError
+
+    def save(self, filepath, transform=None, overviews=False):
+        """
+        保存拼接结果，返回输出图片的像素尺寸 (宽, 高)
+        :param transform: 地理参考仿射参数（见 georef_transform），保存为TIFF时写入GeoTIFF标签
+        :param overviews: 保存为TIFF时是否生成内部概览图层
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """释放画布占用的资源"""
+
+
+class PilCanvas(_Canvas):
+    """内存画布（PIL），适合中小尺寸拼接，输出PNG等常规格式"""
+
+    def __init__(self, grid, scale=1, crop=True):
+        from PIL import Image
+        super().__init__(grid, scale, crop)
+        self.image = Image.new('RGB', self.size)
+        self._lock = threading.Lock()
+
+    def paste(self, row, col, data):
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as tile:
+            placement = self._placement(row, col, tile.width, tile.height)
+            if placement:
+                dest, src = placement
+                region = tile.convert('RGB').crop(src)
+                with self._lock:
+                    self.image.paste(region, dest[:2])
+
+    def save(self, filepath, transform=None, overviews=False):
+        from amap_tiff import write_geotiff, write_tiled_tiff
+        if filepath.lower().endswith(('.tif', '.tiff')):
+            array = np.asarray(self.image)
+            if transform:
+                write_geotiff(filepath, array, transform, overviews)
+            else:
+                write_tiled_tiff(filepath, array)
+        else:
+            self.image.save(filepath)
+        return self.image.size
+
+
+class MemmapCanvas(_Canvas):
+    """
+    磁盘映射画布（numpy.memmap），瓦片解码后直接写入映射文件，
+    峰值内存与瓦片数量无关，适合数十亿像素级的高缩放级别拼接；输出为分块（Big）TIFF
+    """
+
+    def __init__(self, grid, buffer_path, scale=1, crop=True):
+        """
+        :param buffer_path: 映射缓冲文件路径（与画布像素等大，应放在输出文件旁边：
+                            系统临时目录可能是内存盘或空间不足），close 时删除
+        """
+        super().__init__(grid, scale, crop)
+        self.buffer_path = buffer_path
+        width, height = self.size
+        try:
+            self.array = np.memmap(buffer_path, dtype=np.uint8, mode='w+', shape=(height, width, 3))
+        except Exception:
+            self.array = None
+            self.close()
+            raise
+
+    def paste(self, row, col, data):
+        import cv2
+        # 各瓦片写入互不重叠的区域，无需加锁；OpenCV解码时释放GIL，可多线程并行
+        tile = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if tile is None:
+            raise ValueError(f"瓦片({row}, {col})解码失败")
+        placement = self._placement(row, col, tile.shape[1], tile.shape[0])
+        if placement:
+            (left, top, right, bottom), (sx0, sy0, sx1, sy1) = placement
+            # OpenCV解码为BGR，写入时转换为RGB
+            self.array[top:bottom, left:right] = tile[sy0:sy1, sx0:sx1, ::-1]
+
+    def save(self, filepath, transform=None, overviews=False):
+        from amap_tiff import write_geotiff, write_tiled_tiff
+        self.array.flush()
+        if transform:
+            write_geotiff(filepath, self.array, transform, overviews)
+        else:
+            write_tiled_tiff(filepath, self.array)
+        return self.size
+
+    def close(self):
+        """释放映射并删除缓冲文件"""
+        self.array = None
+        try:
+            os.remove(self.buffer_path)
+        except OSError:
+            pass
+
+
+def choose_canvas(grid, scale=1, backend='auto', memmap_threshold=64000000, buffer_path=None):
+    """
+    根据拼接尺寸选择画布
+    :param grid: plan_tile_grid 返回的网格
+    :param scale: 图片清晰度 (1=普通, 2=高清)
+    :param backend: 'pil'、'memmap' 或 'auto'（像素数超过阈值时使用memmap）
+    :param memmap_threshold: auto模式下切换到memmap的像素数阈值
+    :param buffer_path: memmap画布的缓冲文件路径（见 MemmapCanvas），选择memmap时必须指定
+    :return: 画布实例
+    """
+    if backend == 'auto':
+        _, _, width, height = grid['crop']
+        backend = 'memmap' if width * height * scale * scale > memmap_threshold else 'pil'
+    if backend == 'memmap':
+        if buffer_path is None:
+            raise ValueError("磁盘映射画布需要指定缓冲文件路径 buffer_path")
+        return MemmapCanvas(grid, buffer_path, scale)
+    return PilCanvas(grid, scale)
+
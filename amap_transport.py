@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高德地图HTTP传输层
+统一管理连接池、keep-alive、超时、失败重试（指数退避+抖动）以及每次请求的耗时统计
+"""
+
+import random
+import re
+import socket
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from urllib.parse import quote_plus
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 高德限流/服务繁忙类错误码，稍后重试通常可以恢复
+RETRYABLE_INFOCODES = {
+    '10004',  # ACCESS_TOO_FREQUENT 单位时间内访问过于频繁
+    '10014',  # QPS_HAS_EXCEEDED_THE_LIMIT 云图服务QPS超限
+    '10015',  # GATEWAY_TIMEOUT 受单机QPS限流限制
+    '10016',  # SERVER_IS_BUSY 服务器负载过高
+    '10019',  # CQPS_HAS_EXCEEDED_THE_LIMIT 使用的某个服务总QPS超限
+    '10020',  # CKQPS_HAS_EXCEEDED_THE_LIMIT 某个Key使用某个服务接口QPS超出限制
+    '10021',  # CUQPS_HAS_EXCEEDED_THE_LIMIT 账号使用某个服务接口QPS超出限制
+}
+
+# 网络层可重试异常（连接被重置、超时、响应体中断等）
+RETRYABLE_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+# 取消时等待两个信号（全局取消与任务的token）的轮询间隔（秒）
+_CANCEL_POLL = 0.1
+
+
+class QuotaExhaustedError(requests.RequestException):
+    """密钥池中所有密钥的当日配额都已用尽"""
+
+
+class RequestCancelled(requests.RequestException):
+    """请求已被取消（AmapTransport.cancel）"""
+
+
+# 中止进行中的请求：发送请求的线程登记其正在使用的连接，取消方关闭该连接的套接字，
+# 阻塞在建立连接或等待响应上的请求立即以连接错误结束，而不是等到超时
+_current = threading.local()  # 当前线程正在发送请求的传输层（_current.transport）
+_connections = {}             # {线程标识: 正在使用的连接}
+
+
+class _AbortableConnectionMixin:
+    def connect(self):
+        _connections[threading.get_ident()] = self
+        super().connect()
+        self._check_cancelled()
+
+    def request(self, *args, **kwargs):
+        _connections[threading.get_ident()] = self
+        self._check_cancelled()
+        return super().request(*args, **kwargs)
+
+    @staticmethod
+    def _check_cancelled():
+        # 登记连接之后检查：取消方要么看到已登记的连接并将其关闭，要么在这里被发现
+        # （urllib3 将异常作为连接错误抛出，由 _send 转为 RequestCancelled）
+        transport = getattr(_current, 'transport', None)
+        if transport is not None and transport.cancelled:
+            raise RequestCancelled("请求已取消")
+
+
+class _AbortableHTTPConnection(_AbortableConnectionMixin, HTTPConnection):
+    pass
+
+
+class _AbortableHTTPSConnection(_AbortableConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _AbortableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _AbortableHTTPConnection
+
+
+class _AbortableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _AbortableHTTPSConnection
+
+
+class _AbortableAdapter(HTTPAdapter):
+    """连接可被其他线程中止的适配器（经代理的请求不支持中止，仍在超时后结束）"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _AbortableHTTPConnectionPool,
+            'https': _AbortableHTTPSConnectionPool,
+        }
+
+
+def _abort_connection(ident):
+    """关闭线程 ident 正在使用的连接的套接字，唤醒阻塞在该连接上的读写"""
+    sock = getattr(_connections.get(ident), 'sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+# 单次请求的耗时记录
+RequestTiming = namedtuple('RequestTiming', [
+    'endpoint',   # 接口名称，如 'district'、'staticmap'
+    'status',     # 最终HTTP状态码，网络异常时为None
+    'elapsed',    # 总耗时（秒，包含重试与退避等待）
+    'attempts',   # 实际发送次数
+    'bytes',      # 响应体字节数（流式请求为Content-Length，未知时为None）
+    'infocode',   # 高德返回的infocode（仅JSON响应）
+    'wait',       # 在限流器上等待的总时间（秒）
+])
+
+
+def encoded_url(url, params=None):
+    """
+    按requests的编码规则生成实际发送的完整URL（; , : | 等字符会被百分号编码）
+    """
+    return requests.Request('GET', url, params=params).prepare().url
+
+
+def mask_api_key(url):
+    """
+    隐藏URL中的API密钥（用于打印与日志）
+    """
+    return re.sub(r'([?&]key=)[^&]*', r'\1***', url)
+
+
+def encoded_param_length(value):
+    """
+    查询参数值编码后的长度（与requests的urlencode规则一致）
+    """
+    return len(quote_plus(str(value)))
+
+
+class AmapTransport:
+    def __init__(self, timeout=30, pool_size=10, max_retries=3, backoff=0.5,
+                 backoff_max=10.0, headers=None, history=1000, rate_limiter=None, key_pool=None):
+        """
+        初始化传输层
+
+        :param timeout: 请求超时时间（秒），也可以是 (连接超时, 读取超时) 元组
+        :param pool_size: 连接池大小（同一主机最多保持的keep-alive连接数）
+        :param max_retries: 最大重试次数（不含首次请求）
+        :param backoff: 退避基准时间（秒），第n次重试等待约 backoff * 2^n
+        :param backoff_max: 单次退避等待上限（秒）
+        :param headers: 附加的公共请求头
+        :param history: 保留的最近请求耗时记录条数
+        :param rate_limiter: 限流器（RateLimiter），每次发送（含重试）前按接口获取令牌
+        :param key_pool: 密钥池（KeyPool），设置后每次发送前由密钥池选择密钥（写入key参数）并按该密钥限流，
+                         密钥配额用尽或访问过于频繁时立即换用其他密钥重试（不计入重试次数）
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+        self.key_pool = key_pool
+
+        self.session = requests.Session()
+        adapter = _AbortableAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+        self.timings = deque(maxlen=history)
+        self._cancelled = threading.Event()
+        self._local = threading.local()
+        self._sending = {}  # {线程标识: 该线程的取消token}，正在等待响应的请求
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """
+        注册请求完成回调，每次请求结束后以 RequestTiming 调用
+        :param callback: 回调函数 callback(timing)
+        """
+        self._listeners.append(callback)
+
+    @property
+    def cancelled(self):
+        """当前线程的请求是否已取消（流式读取响应体的调用方在每个数据块之间检查）"""
+        token = getattr(self._local, 'token', None)
+        return self._cancelled.is_set() or (token is not None and token.is_set())
+
+    def cancel(self, token=None):
+        """
+        取消进行中与后续的请求：在限流器上或重试退避中等待的请求立即结束，等待响应的请求的连接被关闭，
+        之后的请求直接抛出 RequestCancelled
+
+        :param token: None时取消所有线程的请求，直到调用 reset；
+                      指定时设置该 token，只中止在其 cancel_scope 中进行的请求
+        """
+        if token is None:
+            self._cancelled.set()
+        else:
+            token.set()
+        for ident, scope in list(self._sending.items()):
+            if token is None or scope is token:
+                _abort_connection(ident)
+
+    def reset(self):
+        """清除 cancel 设置的取消状态，恢复发送请求"""
+        self._cancelled.clear()
+
+    @contextmanager
+    def cancel_scope(self, token):
+        """
+        在当前线程中以 token（threading.Event）作为取消信号：token 被设置后，本线程进行中与之后的请求
+        抛出 RequestCancelled。共享同一传输层的多个任务各自使用一个 token，取消其中一个不影响其它任务，
+        也无需清除共享的取消状态
+
+        :param token: threading.Event，每个任务一个
+        """
+        previous = getattr(self._local, 'token', None)
+        self._local.token = token
+        try:
+            yield token
+        finally:
+            self._local.token = previous
+
+    def get(self, url, params=None, endpoint='default', stream=False, headers=None):
+        """
+        发送GET请求（带重试）
+        :param url: 请求地址
+        :param params: 查询参数
+        :param endpoint: 接口名称，用于耗时统计
+        :param stream: 是否流式读取响应体
+        :param headers: 本次请求附加的请求头（如条件请求的 If-None-Match）
+        :return: requests.Response（非2xx状态码由调用方通过raise_for_status处理）
+        """
+        response, _ = self._send(url, params, endpoint, stream, headers)
+        return response
+
+    def get_json(self, url, params=None, endpoint='default'):
+        """
+        发送GET请求并解析JSON（带重试，JSON只解析一次）
+        :return: 解析后的JSON数据
+        """
+        response, data = self._send(url, params, endpoint, stream=False)
+        response.raise_for_status()
+        if data is None:
+            data = response.json()
+        return data
+
+    def _send(self, url, params, endpoint, stream, headers=None):
+        start = time.perf_counter()
+        attempt = 0
+        failovers = 0
+        wait = 0.0
+        key = None
+        while True:
+            if self.cancelled:
+                raise RequestCancelled("请求已取消")
+            attempt += 1
+            retry_after = None
+            if self.key_pool is not None:
+                key, waited = self.key_pool.acquire(endpoint, sleep=self._wait)
+                wait += waited
+                if key is None:
+                    self._record(endpoint, None, start, attempt - 1, None, None, wait)
+                    raise QuotaExhaustedError(f"所有API密钥的 {endpoint} 当日配额都已用尽")
+                params = dict(params or {}, key=key)
+            elif self.rate_limiter is not None:
+                wait += self.rate_limiter.acquire(endpoint, sleep=self._wait)
+            if self.cancelled:
+                raise RequestCancelled("请求已取消")
+            try:
+                response = self._get(url, params, stream, headers)
+                if self.cancelled:
+                    response.close()
+                    raise RequestCancelled("请求已取消")
+            except RETRYABLE_EXCEPTIONS:
+                if self.cancelled:
+                    # 取消时连接被关闭，不再重试
+                    raise RequestCancelled("请求已取消")
+                if attempt > self.max_retries:
+                    self._record(endpoint, None, start, attempt, None, None, wait)
+                    raise
+                self._sleep_backoff(attempt)
+                continue
+
+            data, infocode = None, None
+            if 'json' in response.headers.get('content-type', ''):
+                try:
+                    data = response.json()
+                    infocode = str(data.get('infocode', '')) or None
+                except ValueError:
+                    pass
+
+            # 密钥配额用尽/访问过于频繁：换用其他密钥立即重试，最多把每个密钥都试一遍
+            if (key is not None and infocode and self.key_pool.report(key, endpoint, infocode)
+                    and failovers < len(self.key_pool) - 1 and self.key_pool.has_available(endpoint, exclude=key)):
+                failovers += 1
+                attempt -= 1
+                response.close()
+                continue
+
+            retryable = (response.status_code >= 500 or response.status_code == 429
+                         or infocode in RETRYABLE_INFOCODES)
+            if retryable and attempt <= self.max_retries:
+                retry_after = response.headers.get('retry-after')
+                response.close()
+                self._sleep_backoff(attempt, retry_after)
+                continue
+
+            if stream:
+                size = response.headers.get('content-length')
+                size = int(size) if size and size.isdigit() else None
+            else:
+                size = len(response.content)
+            self._record(endpoint, response.status_code, start, attempt, size, infocode, wait)
+            return response, data
+
+    def _get(self, url, params, stream, headers):
+        """发送一次请求，期间登记本线程，以便取消时关闭其连接"""
+        ident = threading.get_ident()
+        self._sending[ident] = getattr(self._local, 'token', None)
+        _current.transport = self
+        try:
+            return self.session.get(url, params=params, timeout=self.timeout, stream=stream, headers=headers)
+        finally:
+            _current.transport = None
+            _connections.pop(ident, None)
+            self._sending.pop(ident, None)
+
+    def _wait(self, delay):
+        """
+        等待 delay 秒，全局 cancel 或当前线程的 token 被设置时立即返回
+        :return: 是否已取消
+        """
+        token = getattr(self._local, 'token', None)
+        if token is None:
+            return self._cancelled.wait(delay)
+        # 同时等待两个信号：分段等待任务的 token，每段之间检查全局取消
+        deadline = time.monotonic() + delay
+        while not self._cancelled.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if token.wait(min(remaining, _CANCEL_POLL)):
+                return True
+        return True
+
+    def _sleep_backoff(self, attempt, retry_after=None):
+        """指数退避 + 抖动；服务端给出Retry-After时优先使用"""
+        if retry_after and retry_after.isdigit():
+            delay = min(float(retry_after), self.backoff_max)
+        else:
+            delay = min(self.backoff * (2 ** (attempt - 1)), self.backoff_max)
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        # 等待期间取消时立即返回（下一次循环开始时抛出 RequestCancelled）
+        self._wait(delay)
+
+    def _record(self, endpoint, status, start, attempts, size, infocode, wait):
+        timing = RequestTiming(endpoint, status, time.perf_counter() - start, attempts, size, infocode, wait)
+        self.timings.append(timing)
+        for callback in self._listeners:
+            callback(timing)
+
+    def summary(self):
+        """
+        汇总最近请求的耗时统计
+        :return: dict，按接口名称给出 count/avg/p50/p95/max（秒）、重试次数及限流等待总时间
+        """
+        by_endpoint = {}
+        for timing in list(self.timings):
+            by_endpoint.setdefault(timing.endpoint, []).append(timing)
+
+        result = {}
+        for endpoint, items in by_endpoint.items():
+            elapsed = sorted(t.elapsed for t in items)
+            count = len(elapsed)
+            result[endpoint] = {
+                'count': count,
+                'avg': sum(elapsed) / count,
+                'p50': elapsed[int(0.50 * (count - 1))],
+                'p95': elapsed[int(0.95 * (count - 1))],
+                'max': elapsed[-1],
+                'retries': sum(t.attempts - 1 for t in items),
+                'rate_limit_wait': sum(t.wait for t in items),
+            }
+        return result
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
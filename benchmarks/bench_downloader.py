@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载器吞吐量/延迟基准
+在本地模拟服务（mock_amap_server.py）上以不同并发数运行以下场景，不消耗API配额：
+- map:    download_district_map（多个区域并发，每个区域多个缩放级别）
+- single: download_district_map_single（多个区域并发）
+- batch:  BatchRunner 批量下载
+
+输出每个场景/并发数的 请求数/秒、P50/P95/P99 延迟、字节/秒 与 峰值常驻内存（RSS）
+
+用法：
+    python benchmarks/bench_downloader.py
+    python benchmarks/bench_downloader.py --concurrency 1 4 16 --districts 32 --latency 0.05 --json bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import AMAP_CONFIG  # noqa: E402
+from mock_amap_server import MockAmapServer  # noqa: E402
+from amap_downloader import AmapDownloader  # noqa: E402
+from amap_batch import normalize_job, BatchRunner  # noqa: E402
+
+SCENARIOS = ('map', 'single', 'batch')
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），不支持的平台返回0"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位为KB，macOS上为字节
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def make_downloader(server, run_id, concurrency):
+    """创建指向模拟服务、不使用缓存与限流的下载器（每次运行使用独立的密钥以免共享令牌桶）"""
+    AMAP_CONFIG.update({
+        'api_base_url': server.base_url,
+        'request_delay': 0,
+        'rate_limits': {},
+        'max_concurrency': concurrency,
+        'pool_size': max(10, concurrency),
+        'district_cache': {'enabled': False},
+        'image_cache': {'enabled': False},
+        'api_keys': [],
+    })
+    return AmapDownloader(api_key=f"bench-{run_id}", quiet=True)
+
+
+def run_scenario(scenario, downloader, districts, zoom_levels, output_dir, concurrency):
+    if scenario == 'map':
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda name: downloader.download_district_map(
+                name, output_dir, zoom_levels=zoom_levels), districts))
+    elif scenario == 'single':
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda name: downloader.download_district_map_single(
+                name, output_dir, max_size="1024*1024"), districts))
+    elif scenario == 'batch':
+        jobs = [normalize_job({'district': name, 'zoom': zoom_levels}) for name in districts]
+        BatchRunner(downloader, output_dir, concurrency).run(jobs)
+    else:
+        raise ValueError(f"未知场景: {scenario}")
+
+
+def benchmark(server, scenario, concurrency, districts, zoom_levels, run_id):
+    """运行一个场景并汇总指标"""
+    downloader = make_downloader(server, run_id, concurrency)
+    timings = []
+    downloader.transport.add_listener(timings.append)
+
+    with tempfile.TemporaryDirectory(prefix='amap-bench-') as output_dir:
+        start = time.perf_counter()
+        # 安静模式之外的区域级进度信息也丢弃，避免控制台成为瓶颈
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_scenario(scenario, downloader, districts, zoom_levels, output_dir, concurrency)
+        wall = time.perf_counter() - start
+    downloader.transport.close()
+
+    latencies = [t.elapsed for t in timings]
+    total_bytes = sum(t.bytes or 0 for t in timings)
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': len(timings),
+        'errors': sum(1 for t in timings if t.status != 200 or (t.infocode and t.infocode != '10000')),
+        'retries': sum(t.attempts - 1 for t in timings),
+        'wall_s': round(wall, 3),
+        'req_per_s': round(len(timings) / wall, 2) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'bytes_per_s': round(total_bytes / wall) if wall else 0,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="高德地图下载器性能基准（本地模拟服务）")
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--districts', type=int, default=16, help="每个场景下载的区域数")
+    parser.add_argument('--zoom', type=int, nargs='+', default=[10, 12], help="map/batch场景的缩放级别")
+    parser.add_argument('--latency', type=float, default=0.02, help="模拟服务的固定延迟（秒）")
+    parser.add_argument('--jitter', type=float, default=0.01, help="模拟服务的随机延迟上限（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="模拟服务返回限流错误码(10004)的比例")
+    parser.add_argument('--polyline-points', type=int, default=5000, help="合成边界的坐标点数")
+    parser.add_argument('--image-size', default='1024*1024', help="模拟服务返回的图片尺寸")
+    parser.add_argument('--json', help="将结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    districts = [f"基准区域{i}" for i in range(args.districts)]
+    results = []
+    with MockAmapServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        polyline_points=args.polyline_points, image_size=args.image_size) as server:
+        run_id = 0
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                run_id += 1
+                result = benchmark(server, scenario, concurrency, districts, args.zoom, run_id)
+                results.append(result)
+                print(f"{scenario:<7} c={concurrency:<3} {result['requests']:>5} req  "
+                      f"{result['req_per_s']:>8.1f} req/s  "
+                      f"p50 {result['p50_ms']:>7.1f}ms  p95 {result['p95_ms']:>7.1f}ms  p99 {result['p99_ms']:>7.1f}ms  "
+                      f"{result['bytes_per_s'] / 1024 / 1024:>7.2f} MB/s  "
+                      f"RSS {result['peak_rss_mb']:>6.1f}MB  errors {result['errors']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准
+在全新的子进程中测量：
+- import:  python -X importtime 下 amap_downloader 与 map_downloader_gui 的累计导入耗时
+- deferred: 导入 amap_downloader 后 numpy/cv2/PIL/asyncio/config 是否仍未加载（应在首次使用时才导入）
+- cli:     命令行从启动进程到本地模拟服务收到第一个请求的耗时
+- gui:     图形界面从启动进程到窗口完成首次绘制的耗时（需要图形显示环境，否则跳过）
+
+输出各项的中位数；指定 --max-import-ms 时导入耗时超出或重量级模块被提前加载则以非零状态退出，可用于CI防止回退
+
+用法：
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 7 --max-import-ms 250 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_amap_server import MockAmapServer  # noqa: E402
+
+IMPORT_MODULES = ('amap_downloader', 'map_downloader_gui')
+# 导入 amap_downloader 时不应加载的模块
+DEFERRED_MODULES = ('numpy', 'cv2', 'PIL', 'asyncio', 'config')
+
+CLI_SCRIPT = """
+import sys
+import amap_downloader
+amap_downloader.AMAP_CONFIG.update({
+    'api_key': 'bench-startup', 'api_keys': [], 'api_base_url': sys.argv[1], 'request_delay': 0,
+    'rate_limits': {}, 'district_cache': {'enabled': False}, 'image_cache': {'enabled': False},
+})
+amap_downloader.main(['基准区域', '--output-dir', sys.argv[2], '--zoom', '10', '--quiet'])
+"""
+
+GUI_SCRIPT = """
+import time
+import tkinter as tk
+import map_downloader_gui
+root = tk.Tk()
+map_downloader_gui.MapDownloaderGUI(root)
+root.update()
+print(time.time())
+root.destroy()
+"""
+
+
+def run_python(args, **kwargs):
+    return subprocess.run([sys.executable] + args, cwd=ROOT, capture_output=True, text=True, **kwargs)
+
+
+def import_time_ms(module):
+    """python -X importtime 报告的模块累计导入耗时（毫秒）"""
+    result = run_python(['-X', 'importtime', '-c', f"import {module}"])
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败: {result.stderr.strip().splitlines()[-1]}")
+    for line in reversed(result.stderr.splitlines()):
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"未找到 {module} 的导入耗时")
+
+
+def loaded_heavy_modules():
+    """导入 amap_downloader 后已被加载的重量级模块"""
+    script = (f"import sys, json, amap_downloader; "
+              f"print(json.dumps([m for m in {DEFERRED_MODULES!r} if m in sys.modules]))")
+    result = run_python(['-c', script])
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return json.loads(result.stdout)
+
+
+def time_to_first_request_ms(timeout=30):
+    """命令行从启动进程到模拟服务收到第一个请求的耗时（毫秒），收到请求后即结束子进程"""
+    with MockAmapServer() as server, tempfile.TemporaryDirectory(prefix='amap-startup-') as output_dir:
+        start = time.time()
+        process = subprocess.Popen([sys.executable, '-c', CLI_SCRIPT, server.base_url, output_dir], cwd=ROOT,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            while server.first_request_at is None:
+                if process.poll() is not None:
+                    raise RuntimeError(f"命令行未发出请求即退出: {process.stderr.read().decode(errors='replace')}")
+                if time.time() - start > timeout:
+                    raise RuntimeError("等待第一个请求超时")
+                time.sleep(0.001)
+            return (server.first_request_at - start) * 1000
+        finally:
+            process.kill()
+            process.wait()
+            process.stderr.close()
+
+
+def has_display():
+    if sys.platform.startswith('linux'):
+        return bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+    return True
+
+
+def time_to_window_ms():
+    """图形界面从启动进程到窗口完成首次绘制的耗时（毫秒）"""
+    start = time.time()
+    result = run_python(['-c', GUI_SCRIPT])
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return (float(result.stdout.strip().splitlines()[-1]) - start) * 1000
+
+
+def median_ms(measure, runs):
+    return round(statistics.median(measure() for _ in range(runs)), 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="高德地图下载器启动耗时基准")
+    parser.add_argument('--runs', type=int, default=5, help="每项测量的次数（取中位数）")
+    parser.add_argument('--max-import-ms', type=float,
+                        help="amap_downloader 累计导入耗时上限（毫秒），超出时以非零状态退出")
+    parser.add_argument('--skip-cli', action='store_true', help="不测量命令行的第一个请求耗时")
+    parser.add_argument('--skip-gui', action='store_true', help="不测量图形界面的窗口显示耗时")
+    parser.add_argument('--json', help="将结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    results = {'import_ms': {}}
+    for module in IMPORT_MODULES:
+        results['import_ms'][module] = median_ms(lambda: import_time_ms(module), args.runs)
+        print(f"import {module:<20} {results['import_ms'][module]:>8.1f} ms")
+
+    results['eager_heavy_modules'] = loaded_heavy_modules()
+    print(f"导入时已加载的重量级模块: {', '.join(results['eager_heavy_modules']) or '无'}")
+
+    if not args.skip_cli:
+        results['cli_first_request_ms'] = median_ms(time_to_first_request_ms, args.runs)
+        print(f"命令行第一个请求            {results['cli_first_request_ms']:>8.1f} ms")
+
+    if not args.skip_gui:
+        if has_display():
+            results['gui_window_ms'] = median_ms(time_to_window_ms, args.runs)
+            print(f"图形界面窗口显示            {results['gui_window_ms']:>8.1f} ms")
+        else:
+            print("⚠️  没有图形显示环境，跳过窗口显示耗时")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📄 结果已保存: {args.json}")
+
+    failures = []
+    if results['eager_heavy_modules']:
+        failures.append(f"导入 amap_downloader 时提前加载了 {', '.join(results['eager_heavy_modules'])}")
+    if args.max_import_ms is not None and results['import_ms']['amap_downloader'] > args.max_import_ms:
+        failures.append(f"amap_downloader 导入耗时 {results['import_ms']['amap_downloader']} ms "
+                        f"超过上限 {args.max_import_ms} ms")
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+配置文件示例
+请复制此文件为 config.py 并填入您的API密钥
+"""
+
+# 高德地图API配置
+AMAP_CONFIG = {
+    # 请在此处填入您的高德地图API密钥
+    # 申请地址: https://console.amap.com/
+    # 示例: 'api_key': 'abcd1234567890abcd1234567890abcd',
+    'api_key': 'YOUR_AMAP_API_KEY_HERE',
+    
+    # 默认地图参数
+    'default_zoom_levels': [8, 10, 12, 14],  # 可选范围: 3-18
+    'default_map_size': '1024*1024',         # 可选: 512*512, 1024*1024, 2048*2048
+    'default_output_dir': './maps',          # 输出目录
+    'default_scale': 2,                      # 默认图片清晰度 (1=普通, 2=高清)
+    'default_zoom_levels': [8, 10, 12, 14],  # 默认缩放级别组合
+    
+    # 请求参数
+    'request_delay': 0.5,  # 请求间隔（秒），未配置rate_limits时按 1/request_delay 换算QPS
+    'timeout': 30,         # 请求超时时间（秒）
+
+    # HTTP连接与重试
+    'pool_size': 10,           # 连接池大小（keep-alive复用的连接数）
+    'max_retries': 3,          # 5xx、连接重置及限流错误码的最大重试次数
+    'retry_backoff': 0.5,      # 重试退避基准时间（秒），按指数增长并加入随机抖动
+    'retry_backoff_max': 10,   # 单次退避等待上限（秒）
+    'max_concurrency': 8,      # 异步/并发下载时同时进行的最大请求数
+
+    'tile_prune_buffer_px': 32,        # 瓦片拼接时跳过区域外瓦片，边界向外扩展的缓冲像素
+    'mosaic_memmap_threshold_mp': 64,  # 瓦片拼接超过该像素数（百万）时改用磁盘映射画布并输出分块BigTIFF
+
+    # 按接口限流（令牌桶），同一API密钥的所有线程/下载器共享
+    # qps: 每秒请求数（与高德控制台中的配额一致）；burst: 允许的瞬时突发请求数
+    'rate_limits': {
+        'district': {'qps': 3, 'burst': 3},    # 行政区域查询
+        'staticmap': {'qps': 3, 'burst': 3},   # 静态地图
+    },
+
+    # 行政区域查询缓存（SQLite持久化 + 内存LRU），重复运行同一区域时不再请求district接口
+    'district_cache': {
+        'enabled': True,
+        'path': '~/.amap_downloader/district_cache.sqlite',
+        'ttl_days': 30,          # 缓存有效期（天）
+        'max_mb': 200,           # 磁盘缓存容量上限，超出时淘汰最久未使用的区域
+        'memory_entries': 128,   # 内存LRU条目数
+    },
+
+    # 静态地图图片缓存（可选），按请求参数（不含API密钥）的哈希存储
+    # 重复下载相同区域/级别/尺寸时直接使用缓存，不发请求也不占用限流配额
+    'image_cache': {
+        'enabled': False,
+        'path': '~/.amap_downloader/image_cache',
+        'max_mb': 2048,          # 缓存总大小上限，超出时淘汰最久未使用的图片
+        'hardlink': True,        # 命中时以硬链接放入输出目录（不支持时自动复制）
+    },
+}
+
+# 支持的地图尺寸选项
+MAP_SIZES = {
+    'small': '512*512',
+    'medium': '1024*1024', 
+    'large': '2048*2048'
+}
+
+# 缩放级别说明（根据高德地图API文档，支持3-18级）
+ZOOM_LEVELS = {
+    3: {'name': '国家级', 'description': '显示整个国家，适合全国概览'},
+    4: {'name': '省级', 'description': '显示省份轮廓，适合省级区域分析'}, 
+    5: {'name': '省级', 'description': '显示省份详情，适合大区域规划'},
+    6: {'name': '市级', 'description': '显示城市轮廓，适合城市群分析'},
+    7: {'name': '市级', 'description': '显示城市详情，适合市级规划'},
+    8: {'name': '市级', 'description': '显示城市区域，适合城市概览'},
+    9: {'name': '区县级', 'description': '显示区县轮廓，适合区县分析'},
+    10: {'name': '区县级', 'description': '显示区县详情，适合区域规划'},
+    11: {'name': '区县级', 'description': '显示区县细节，适合详细分析'}, 
+    12: {'name': '乡镇级', 'description': '显示乡镇轮廓，适合乡镇规划'},
+    13: {'name': '乡镇级', 'description': '显示乡镇详情，适合社区分析'},
+    14: {'name': '村庄级', 'description': '显示村庄详情，适合村级规划'},
+    15: {'name': '街道级', 'description': '显示街道详情，适合街区分析'},
+    16: {'name': '街道级', 'description': '显示街道细节，适合精细规划'},
+    17: {'name': '建筑物级', 'description': '显示建筑轮廓，适合建筑分析'},
+    18: {'name': '建筑物级', 'description': '显示建筑细节，适合精确定位'}
+}
+
+# 推荐的缩放级别组合
+RECOMMENDED_ZOOM_COMBINATIONS = {
+    'overview': [6, 8, 10],      # 概览模式：城市到区县
+    'detailed': [10, 12, 14],    # 详细模式：区县到村庄
+    'precision': [14, 16, 18],   # 精确模式：村庄到建筑
+    'multi_scale': [8, 12, 16],  # 多尺度：跨级别分析
+    'default': [8, 10, 12, 14]   # 默认组合：平衡覆盖
+}
+
+# 使用说明:
+# 1. 将此文件复制为 config.py
+# 2. 在 https://console.amap.com/ 申请API密钥
+# 3. 将上面的 'YOUR_AMAP_API_KEY_HERE' 替换为您的真实API密钥
+# 4. 根据需要调整其他参数
\ No newline at end of file
@@ -19,9 +19,93 @@ AMAP_CONFIG = {
     'default_scale': 2,                      # 默认图片清晰度 (1=普通, 2=高清)
     'default_zoom_levels': [8, 10, 12, 14],  # 默认缩放级别组合
     
+    # 接口地址（可改为本地模拟服务地址，如 'http://127.0.0.1:8900/v3'，用于离线测试与性能基准）
+    'api_base_url': 'https://restapi.amap.com/v3',
+
+    # 安静模式：不打印每个请求的URL、状态码等进度信息（错误信息仍会打印）
+    'quiet': False,
+
+    # 运行指标输出（可选）：JSON Lines事件文件、Prometheus文本文件（node_exporter textfile collector）
+    'metrics': {
+        'jsonl_path': None,
+        'prometheus_path': None,
+    },
+
     # 请求参数
-    'request_delay': 0.5,  # 请求间隔（秒），避免频率限制
+    'request_delay': 0.5,  # 请求间隔（秒），未配置rate_limits时按 1/request_delay 换算QPS
     'timeout': 30,         # 请求超时时间（秒）
+
+    # HTTP连接与重试
+    'pool_size': 10,           # 连接池大小（keep-alive复用的连接数）
+    'max_retries': 3,          # 5xx、连接重置及限流错误码的最大重试次数
+    'retry_backoff': 0.5,      # 重试退避基准时间（秒），按指数增长并加入随机抖动
+    'retry_backoff_max': 10,   # 单次退避等待上限（秒）
+    'max_concurrency': 8,      # 异步/并发下载时同时进行的最大请求数
+    'stream_chunk_size': 64 * 1024,  # 图片流式写入磁盘的分块大小（字节），内存占用与图片大小无关
+
+    # 增量刷新：输出目录中保存内容索引（.amap_index.json），重新下载时内容未变化的图片不重写（修改时间不变），
+    # 服务端返回ETag/Last-Modified时发送条件请求；每次运行在输出目录写入变更列表 changes.json
+    'refresh': False,
+
+    # 地理参考输出（Web墨卡托 EPSG:3857；高德图片为GCJ-02坐标系）：
+    # None 仅PNG；'world' 额外写入 .pgw/.prj；'geotiff' 额外写入分块压缩的GeoTIFF（.tif）
+    # 瓦片拼接输出TIFF时始终带地理参考
+    'georef_output': None,
+    'geotiff_overviews': True,         # GeoTIFF是否附带逐级缩小的概览图层（GIS软件打开大图时无需解码全分辨率）
+
+    'tile_prune_buffer_px': 32,        # 瓦片拼接时跳过区域外瓦片，边界向外扩展的缓冲像素
+    'mosaic_memmap_threshold_mp': 64,  # 瓦片拼接超过该像素数（百万）时改用磁盘映射画布并输出分块BigTIFF
+
+    # 静态地图URL长度（按实际编码后的长度计算，; , : | 等字符编码后占3个字符）
+    'max_url_length': 8192,            # 高德地图API的URL长度上限
+    'boundary_coord_precision': 5,     # 边界坐标保留的小数位数（5位约1米，4位约11米），越少可容纳越多点
+
+    # 按接口限流（令牌桶），同一API密钥的所有线程/下载器共享
+    # qps: 每秒请求数（与高德控制台中的配额一致）；burst: 允许的瞬时突发请求数
+    'rate_limits': {
+        'district': {'qps': 3, 'burst': 3},    # 行政区域查询
+        'staticmap': {'qps': 3, 'burst': 3},   # 静态地图
+    },
+
+    # 多密钥池（可选）：填写多个密钥后每次请求自动选择余量最多的密钥，
+    # 某个密钥当日配额用尽（10003/10044）时自动切换到其他密钥，吞吐量随密钥数量扩展
+    # 每项可以是密钥字符串，或 {'key': 密钥, 'daily_limits': {...}, 'rate_limits': {...}} 单独设置上限
+    'api_keys': [],
+    'key_pool': {
+        'daily_limits': {'district': 5000, 'staticmap': 5000},  # 每个密钥各接口的日调用上限
+        'state_path': '~/.amap_downloader/key_usage.json',      # 当日用量持久化文件（只保存密钥指纹）
+        'cooldown': 5,           # 密钥报告访问过于频繁（10004/10020）后的冷却时间（秒）
+    },
+
+    # 行政区域查询缓存（SQLite持久化 + 内存LRU），重复运行同一区域时不再请求district接口
+    'district_cache': {
+        'enabled': True,
+        'path': '~/.amap_downloader/district_cache.sqlite',
+        'ttl_days': 30,          # 缓存有效期（天）
+        'max_mb': 200,           # 磁盘缓存容量上限，超出时淘汰最久未使用的区域
+        'memory_entries': 128,   # 内存LRU条目数
+    },
+
+    # 下载后的图片处理（可选）：转码、缩小与缩略图在进程池中与下载同时进行
+    'postprocess': {
+        'enabled': False,
+        'workers': None,         # 工作进程数，None时为CPU核数
+        'format': 'webp',        # 输出格式 webp/jpeg/png（png为无损优化压缩，覆盖原图），None时不转码
+        'quality': 85,           # webp/jpeg 质量 (1-100)
+        'lossless': False,       # webp 是否无损
+        'max_size': None,        # 输出图片最长边像素，超过时等比缩小
+        'thumbnails': [],        # 缩略图最长边像素列表，如 [256]
+        'output_dir': None,      # 输出目录，None时与原图同目录
+    },
+
+    # 静态地图图片缓存（可选），按请求参数（不含API密钥）的哈希存储
+    # 重复下载相同区域/级别/尺寸时直接使用缓存，不发请求也不占用限流配额
+    'image_cache': {
+        'enabled': False,
+        'path': '~/.amap_downloader/image_cache',
+        'max_mb': 2048,          # 缓存总大小上限，超出时淘汰最久未使用的图片
+        'hardlink': True,        # 命中时以硬链接放入输出目录（不支持时自动复制）
+    },
 }
 
 # 支持的地图尺寸选项
@@ -11,14 +11,137 @@ import threading
 import os
 import json
 import sys
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from amap_downloader import AmapDownloader
+
+# 界面线程取出下载事件的间隔（毫秒）与每次最多处理的事件数
+POLL_INTERVAL_MS = 100
+MAX_EVENTS_PER_POLL = 500
+
+
+class DownloadQueue:
+    def __init__(self, downloader, max_workers=None):
+        """
+        GUI下载队列（不依赖Tk，可单独使用）
+
+        所有区域共享同一个下载器（连接池、限流器与缓存），区域规划与各缩放级别的下载作为独立任务
+        提交到有界线程池；每个请求完成、每张地图保存后向 events 放入事件，由界面线程定时取出：
+        ('queued', 区域)、('planning', 区域)、('planned', 区域, 缩放级别数)、('unit', 区域, 缩放级别, 文件路径或None)、
+        ('failed', 区域, 错误信息)、('request', RequestTiming)、('idle',)（队列全部完成）
+
+        :param downloader: AmapDownloader 实例
+        :param max_workers: 线程数，None时使用下载器的 max_concurrency
+        """
+        self.downloader = downloader
+        self.max_workers = max_workers or downloader.max_concurrency
+        self.events = queue.Queue()
+        self._executor = None
+        self._cancelled = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        downloader.transport.add_listener(lambda timing: self.events.put(('request', timing)))
+    
+    @property
+    def active(self):
+        """是否有未完成的任务"""
+        with self._lock:
+            return self._executor is not None
+    
+    def submit(self, district, output_dir, zoom_levels=None, map_style="normal", traffic=False, labels=True,
+               scale=None):
+        """将一个区域加入队列"""
+        options = {'map_style': map_style, 'traffic': traffic, 'labels': labels, 'scale': scale}
+        with self._lock:
+            if self._executor is None:
+                # 每次执行使用新的取消信号：取消的上一次执行中仍在进行的请求保持取消状态
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='amap-gui')
+                self._cancelled = threading.Event()
+            self.events.put(('queued', district))
+            self._start(self._cancelled, self._plan, district, output_dir, zoom_levels, options)
+    
+    def _start(self, cancelled, task, *args):
+        """提交任务（需持有锁）；队列已取消时不再提交"""
+        if cancelled.is_set() or self._executor is None:
+            return
+        self._pending += 1
+        self._executor.submit(self._run, cancelled, task, *args)
+    
+    def _run(self, cancelled, task, *args):
+        if not cancelled.is_set():
+            # 本任务的请求以该次执行的取消信号中止（传输层在多次执行之间共享）
+            with self.downloader.transport.cancel_scope(cancelled):
+                task(cancelled, *args)
+        with self._lock:
+            if cancelled.is_set():
+                return
+            self._pending -= 1
+            if self._pending:
+                return
+            executor, self._executor = self._executor, None
+        executor.shutdown(wait=False)
+        # 增量刷新模式下保存内容索引与变更列表
+        if self.downloader.refresh:
+            self.downloader.save_refresh_indexes()
+        self.events.put(('idle',))
+    
+    def _plan(self, cancelled, district, output_dir, zoom_levels, options):
+        self.events.put(('planning', district))
+        try:
+            plan = self.downloader.plan_district(district, zoom_levels)
+            if plan is not None:
+                os.makedirs(output_dir, exist_ok=True)
+        except Exception as e:
+            if not cancelled.is_set():
+                self.events.put(('failed', district, str(e)))
+            return
+        if cancelled.is_set():
+            return
+        if plan is None:
+            self.events.put(('failed', district, f"未找到区域: {district}"))
+            return
+        self.events.put(('planned', district, len(plan['zoom_levels'])))
+        with self._lock:
+            for zoom in plan['zoom_levels']:
+                self._start(cancelled, self._download, plan, zoom, output_dir, options)
+    
+    def _download(self, cancelled, plan, zoom, output_dir, options):
+        try:
+            result = self.downloader.download_zoom_unit(plan, zoom, output_dir, **options)
+        except Exception as e:
+            print(f"❌ {plan['district_name']} 缩放级别 {zoom} 下载出错: {e}")
+            result = None
+        if not cancelled.is_set():
+            self.events.put(('unit', plan['district_name'], zoom, result['filepath'] if result else None))
+    
+    def cancel(self):
+        """
+        取消队列：尚未开始的任务不再执行，进行中的请求立即中止（流式下载在下一个数据块处停止，
+        不会留下不完整的文件），已在进行的任务的结果被丢弃
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            if executor is None:
+                return
+            cancelled, self._pending = self._cancelled, 0
+            cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        # 关闭本次执行中正在等待响应的请求的连接
+        self.downloader.transport.cancel(cancelled)
+    
+    def close(self):
+        """取消未完成的任务，等待已提交的图片处理完成并关闭进程池与下载器的连接池"""
+        self.cancel()
+        if self.downloader.postprocessor:
+            self.downloader.postprocessor.close()
+        self.downloader.transport.close()
+
 
 class MapDownloaderGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("高德地图下载器 v1.1.2")
-        self.root.geometry("600x500")
+        self.root.geometry("640x720")
         self.root.resizable(True, True)
         
         # 设置应用图标（如果有的话）
@@ -38,6 +161,13 @@ class MapDownloaderGUI:
         self.progress_var = tk.DoubleVar()
         self.status_var = tk.StringVar(value="就绪")
         
+        # 长期使用的下载器与下载队列（首次下载时创建）
+        self.download_queue = None
+        self.downloader_key = None
+        self.rows = {}
+        self.request_count = 0
+        self.request_bytes = 0
+        
         # 加载配置
         self.load_config()
         
@@ -46,6 +176,9 @@ class MapDownloaderGUI:
         
         # 绑定关闭事件
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        
+        # 定时处理后台下载事件
+        self.root.after(POLL_INTERVAL_MS, self.poll_events)
     
     def create_widgets(self):
         """创建界面组件"""
@@ -78,7 +211,7 @@ class MapDownloaderGUI:
         district_entry.grid(row=3, column=1, sticky=(tk.W, tk.E), pady=5, padx=(5, 0))
         
         # 区域名称说明
-        district_help = ttk.Label(main_frame, text="例如：吉州区、朝阳区、西湖区等", 
+        district_help = ttk.Label(main_frame, text="例如：吉州区；多个区域以逗号或顿号分隔，如 吉州区、青原区", 
                                  foreground="gray", font=("Arial", 9))
         district_help.grid(row=4, column=1, sticky=tk.W, pady=(0, 10), padx=(5, 0))
         
@@ -131,9 +264,31 @@ class MapDownloaderGUI:
         # 初始状态设置
         self.on_zoom_mode_change()
         
-        # 下载按钮
-        download_btn = ttk.Button(main_frame, text="开始下载", command=self.start_download)
-        download_btn.grid(row=8, column=0, columnspan=2, pady=20)
+        # 下载与取消按钮（下载进行中可继续加入区域）
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=8, column=0, columnspan=2, pady=10)
+        download_btn = ttk.Button(button_frame, text="开始下载", command=self.start_download)
+        download_btn.grid(row=0, column=0, padx=5)
+        self.cancel_btn = ttk.Button(button_frame, text="取消", command=self.cancel_download, state='disabled')
+        self.cancel_btn.grid(row=0, column=1, padx=5)
+        
+        # 下载队列
+        queue_frame = ttk.Frame(main_frame)
+        queue_frame.grid(row=12, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(5, 0))
+        queue_frame.columnconfigure(0, weight=1)
+        queue_frame.rowconfigure(0, weight=1)
+        main_frame.rowconfigure(12, weight=1)
+        self.queue_view = ttk.Treeview(queue_frame, columns=('district', 'status', 'detail'), show='headings',
+                                       height=8)
+        self.queue_view.heading('district', text="区域")
+        self.queue_view.heading('status', text="状态")
+        self.queue_view.heading('detail', text="地图")
+        self.queue_view.column('status', width=90, anchor=tk.CENTER)
+        self.queue_view.column('detail', width=110, anchor=tk.CENTER)
+        self.queue_view.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        queue_scroll = ttk.Scrollbar(queue_frame, orient=tk.VERTICAL, command=self.queue_view.yview)
+        queue_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.queue_view.configure(yscrollcommand=queue_scroll.set)
         
         # 进度条
         progress_frame = ttk.Frame(main_frame)
@@ -228,15 +383,16 @@ class MapDownloaderGUI:
             messagebox.showerror("错误", "请输入API密钥")
             return False
         
-        district_name = self.district_name.get().strip()
-        if not district_name:
+        districts = self.parse_districts()
+        if not districts:
             messagebox.showerror("错误", "请输入区域名称")
             return False
         
         # 验证区域名称格式（应该是中文地名，不是哈希值）
-        if len(district_name) > 20 or any(c.isdigit() and len(district_name) > 10 for c in district_name):
-            messagebox.showerror("错误", "请输入有效的区域名称（如：吉州区、朝阳区等）")
-            return False
+        for district_name in districts:
+            if len(district_name) > 20 or any(c.isdigit() and len(district_name) > 10 for c in district_name):
+                messagebox.showerror("错误", f"请输入有效的区域名称（如：吉州区、朝阳区等）: {district_name}")
+                return False
         
         if not self.output_dir.get().strip():
             messagebox.showerror("错误", "请选择保存目录")
@@ -244,140 +400,179 @@ class MapDownloaderGUI:
         
         return True
     
+    def parse_districts(self):
+        """解析区域名称输入，多个区域以逗号、顿号或空格分隔"""
+        names = self.district_name.get().replace('，', ',').replace('、', ',').replace(' ', ',').split(',')
+        return [name.strip() for name in names if name.strip()]
+    
+    def get_downloader(self):
+        """
+        获取长期使用的下载器（连接池、限流器与缓存在多次下载之间共享），API密钥变化时重新创建
+        :return: DownloadQueue，队列执行中更换密钥时返回None
+        """
+        api_key = self.api_key.get().strip()
+        if self.download_queue is not None and self.downloader_key == api_key:
+            return self.download_queue
+        if self.download_queue is not None and self.download_queue.active:
+            messagebox.showerror("错误", "请等待当前队列完成或取消后再更换API密钥")
+            return None
+        if self.download_queue is not None:
+            self.download_queue.close()
+        # 下载器（及requests等依赖）在第一次下载时才导入，窗口不必等待其加载
+        from amap_downloader import AmapDownloader
+        # 界面显示进度，下载器不向控制台打印每个请求的信息
+        downloader = AmapDownloader(api_key, quiet=True)
+        self.download_queue = DownloadQueue(downloader)
+        self.downloader_key = api_key
+        return self.download_queue
+    
     def start_download(self):
-        """开始下载（在新线程中执行）"""
+        """将输入的区域加入下载队列（下载在后台线程池中执行，界面线程只处理进度事件）"""
         if not self.validate_inputs():
             return
         
+        # 在界面线程中解析缩放级别（解析失败时弹出提示）
+        zoom_levels = self.get_zoom_levels()
+        if zoom_levels is None and self.zoom_mode_var.get() == "custom":
+            return
+        
         # 保存配置
         self.save_config()
         
-        # 在新线程中执行下载
-        download_thread = threading.Thread(target=self.download_maps)
-        download_thread.daemon = True
-        download_thread.start()
-    
-    def download_maps(self):
-        """下载地图（后台线程）"""
         try:
-            # 更新状态
-            self.status_var.set("正在初始化...")
-            self.progress_var.set(10)
-            
-            # 验证API密钥
-            api_key = self.api_key.get().strip()
-            if not api_key:
-                self.status_var.set("错误: API密钥为空")
-                self.root.after(0, lambda: messagebox.showerror("错误", "请输入有效的API密钥"))
-                return
-            
-            # 验证区域名称
-            district_name = self.district_name.get().strip()
-            if not district_name:
-                self.status_var.set("错误: 区域名称为空")
-                self.root.after(0, lambda: messagebox.showerror("错误", "请输入要下载的区域名称"))
-                return
-            
-            # 验证输出目录
-            output_dir_str = self.output_dir.get().strip()
-            if not output_dir_str:
-                self.status_var.set("错误: 输出目录为空")
-                self.root.after(0, lambda: messagebox.showerror("错误", "请选择输出目录"))
-                return
-            
-            # 创建下载器
-            try:
-                downloader = AmapDownloader(api_key)
-            except Exception as e:
-                self.status_var.set("错误: 下载器初始化失败")
-                error_msg = str(e)
-                self.root.after(0, lambda: messagebox.showerror("错误", f"下载器初始化失败:\n{error_msg}"))
-                return
-            
-            # 创建输出目录
-            try:
-                output_dir = Path(output_dir_str)
-                output_dir.mkdir(parents=True, exist_ok=True)
-            except Exception as e:
-                self.status_var.set("错误: 无法创建输出目录")
-                error_msg = str(e)
-                self.root.after(0, lambda: messagebox.showerror("错误", f"无法创建输出目录:\n{error_msg}"))
-                return
-            
-            self.status_var.set("正在搜索区域...")
-            self.progress_var.set(30)
-            
-            self.status_var.set("正在下载地图...")
-            self.progress_var.set(60)
-            
-            # 获取用户选择的zoom级别
-            zoom_levels = self.get_zoom_levels()
-            if zoom_levels is None and self.zoom_mode_var.get() == "custom":
-                # 自定义模式但解析失败
-                return
-            
-            # 设置默认下载参数
-            map_style = "normal"  # 标准地图样式
-            traffic = False       # 不显示交通信息
-            labels = True         # 显示标注
-            
-            # 开始下载地图
-            try:
-                if zoom_levels:
-                    self.status_var.set(f"正在下载地图 (级别: {zoom_levels})...")
-                else:
-                    self.status_var.set("正在下载地图 (使用默认级别)...")
-                
-                result = downloader.download_district(
-                    district_name,
-                    str(output_dir),
-                    zoom_levels=zoom_levels,
-                    map_style=map_style,
-                    traffic=traffic,
-                    labels=labels
-                )
-            except Exception as e:
-                error_msg = str(e)
-                self.status_var.set(f"下载错误: {error_msg}")
-                self.root.after(0, lambda msg=error_msg: messagebox.showerror("错误", f"下载错误: {msg}"))
-                return
-            
-            self.progress_var.set(100)
-            
-            # 处理下载结果 - 返回的是文件路径列表
-            if result and isinstance(result, list) and len(result) > 0:
-                # 下载成功，result是保存的文件路径列表
-                file_count = len(result)
-                self.status_var.set(f"下载完成！共保存 {file_count} 个文件")
-                
-                # 保存变量以避免lambda作用域问题
-                name = district_name
-                count = file_count
-                files = result
-                
-                # 构建简洁的成功消息
-                if count == 1:
-                    success_msg = f"{name} 下载完成！"
-                else:
-                    success_msg = f"{name} 下载完成！\n共 {count} 个文件"
-                
-                self.root.after(0, lambda: messagebox.showinfo("下载完成", success_msg))
-            elif result and isinstance(result, list) and len(result) == 0:
-                # 返回空列表，表示下载失败
-                self.status_var.set("下载失败: 没有成功下载任何文件")
-                self.root.after(0, lambda: messagebox.showerror("错误", "下载失败: 没有成功下载任何文件"))
-            else:
-                # 返回None或其他异常情况
-                self.status_var.set("下载失败: 返回结果异常")
-                self.root.after(0, lambda: messagebox.showerror("错误", "下载失败: 返回结果异常"))
-                
+            download_queue = self.get_downloader()
         except Exception as e:
-            self.status_var.set("下载出错")
-            # 使用root.after在主线程中显示错误消息
-            error_msg = str(e)  # 先保存错误消息
-            self.root.after(0, lambda: messagebox.showerror("错误", f"下载过程中出现错误:\n{error_msg}"))
-        finally:
-            self.progress_var.set(0)
+            messagebox.showerror("错误", f"下载器初始化失败:\n{e}")
+            return
+        if download_queue is None:
+            return
+        
+        if not download_queue.active:
+            self.reset_progress()
+        output_dir = self.output_dir.get().strip()
+        for name in self.parse_districts():
+            if name in self.rows and self.rows[name]['status'] in ('等待', '规划中', '下载中'):
+                continue  # 已在队列中
+            item = self.rows[name]['item'] if name in self.rows else self.queue_view.insert('', tk.END)
+            self.rows[name] = {
+                'item': item,
+                'status': '等待',
+                'zooms': len(zoom_levels) if zoom_levels else 0,
+                'done': 0,
+                'failed': 0,
+            }
+            self.update_row(name)
+            download_queue.submit(name, output_dir, zoom_levels)
+        self.cancel_btn.configure(state='normal')
+        self.update_progress()
+    
+    def cancel_download(self):
+        """取消队列：未开始的任务不再执行，进行中的请求立即中止"""
+        if self.download_queue is None or not self.download_queue.active:
+            return
+        self.download_queue.cancel()
+        for name, row in self.rows.items():
+            if row['status'] in ('等待', '规划中', '下载中'):
+                row['status'] = '已取消'
+                self.update_row(name)
+        self.cancel_btn.configure(state='disabled')
+        self.status_var.set("已取消")
+    
+    def reset_progress(self):
+        """开始新的队列时清零进度统计"""
+        self.request_count = 0
+        self.request_bytes = 0
+        self.progress_var.set(0)
+        for name in [name for name, row in self.rows.items() if row['status'] not in ('等待', '规划中', '下载中')]:
+            self.queue_view.delete(self.rows.pop(name)['item'])
+    
+    def update_row(self, name):
+        row = self.rows[name]
+        total = row['zooms'] or ''
+        detail = f"{row['done']}/{total}" if total else ''
+        if row['failed']:
+            detail += f"（失败 {row['failed']}）"
+        self.queue_view.item(row['item'], values=(name, row['status'], detail))
+    
+    def update_progress(self):
+        """按已完成的规划与下载单元计算进度（每个区域计1步规划 + 每个缩放级别1步）"""
+        rows = self.rows.values()
+        total = sum(1 + row['zooms'] for row in rows)
+        done = sum((row['status'] not in ('等待', '规划中')) + row['done'] + row['failed'] for row in rows)
+        self.progress_bar.configure(maximum=max(total, 1))
+        self.progress_var.set(done)
+        units = sum(row['done'] for row in rows)
+        failed = sum(row['failed'] for row in rows)
+        self.status_var.set(f"已完成 {units} 张地图" + (f"，失败 {failed}" if failed else "") +
+                            f" · 请求 {self.request_count} 次 · {self.request_bytes / 1024 / 1024:.1f} MB")
+    
+    def poll_events(self):
+        """
+        界面线程定时取出下载事件并更新界面（工作线程不直接操作Tk控件）
+        每次最多处理 MAX_EVENTS_PER_POLL 个事件，大量事件到达时界面仍能及时响应
+        """
+        if self.download_queue is not None:
+            events = self.download_queue.events
+            idle = False
+            for _ in range(MAX_EVENTS_PER_POLL):
+                try:
+                    event = events.get_nowait()
+                except queue.Empty:
+                    break
+                idle = self.handle_event(event) or idle
+            self.update_progress()
+            if idle:
+                self.on_queue_finished()
+        self.root.after(POLL_INTERVAL_MS, self.poll_events)
+    
+    def handle_event(self, event):
+        """
+        处理一个下载事件
+        :return: 队列是否已全部完成
+        """
+        kind = event[0]
+        if kind == 'request':
+            self.request_count += 1
+            self.request_bytes += event[1].bytes or 0
+            return False
+        if kind == 'idle':
+            return True
+        name = event[1]
+        row = self.rows.get(name)
+        if row is None or row['status'] == '已取消':
+            return False
+        if kind == 'planning':
+            row['status'] = '规划中'
+        elif kind == 'planned':
+            row['zooms'] = event[2]
+            row['status'] = '下载中'
+        elif kind == 'unit':
+            if event[3]:
+                row['done'] += 1
+            else:
+                row['failed'] += 1
+        elif kind == 'failed':
+            row['status'] = '失败'
+            row['error'] = event[2]
+        if row['status'] == '下载中' and row['done'] + row['failed'] >= row['zooms']:
+            row['status'] = '完成' if not row['failed'] else '部分失败'
+        self.update_row(name)
+        return False
+    
+    def on_queue_finished(self):
+        """队列全部完成后汇总结果"""
+        self.cancel_btn.configure(state='disabled')
+        rows = [row for row in self.rows.values() if row['status'] != '已取消']
+        if not rows:
+            return
+        units = sum(row['done'] for row in rows)
+        failed = [name for name, row in self.rows.items() if row['status'] in ('失败', '部分失败')]
+        if units and not failed:
+            messagebox.showinfo("下载完成", f"{len(rows)} 个区域下载完成！\n共 {units} 个文件")
+        elif units:
+            messagebox.showwarning("下载完成", f"共 {units} 个文件，以下区域未全部成功:\n" + '、'.join(failed[:20]))
+        else:
+            messagebox.showerror("错误", "下载失败: 没有成功下载任何文件")
     
     def modify_downloader_precision(self, downloader, max_points):
         """临时修改下载器的精度设置"""
@@ -389,10 +584,20 @@ class MapDownloaderGUI:
     def on_closing(self):
         """关闭应用时的处理"""
         self.save_config()
+        if self.download_queue is not None:
+            self.download_queue.close()
         self.root.destroy()
 
+def preload_downloader():
+    """在后台线程中导入下载器及其依赖"""
+    import amap_downloader  # noqa: F401
+
 def main():
     """主函数"""
+    # 打包后的可执行文件中，图片处理进程池的工作进程在此处执行任务而不是再打开一个窗口
+    import multiprocessing
+    multiprocessing.freeze_support()
+    
     # 创建主窗口
     root = tk.Tk()
     
@@ -411,6 +616,9 @@ def main():
     # 创建应用
     app = MapDownloaderGUI(root)
     
+    # 窗口显示后在后台线程预先导入下载器，第一次点击下载时无需等待
+    root.after_idle(lambda: threading.Thread(target=preload_downloader, daemon=True).start())
+    
     # 运行主循环
     root.mainloop()
 
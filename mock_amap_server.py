@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高德地图API本地模拟服务
+模拟 /v3/config/district 与 /v3/staticmap 接口，用于离线测试并发改动和性能基准，不消耗配额：
+- 行政区域：合成的边界坐标（点数可配置），支持 subdistrict 返回下级区域树
+- 静态地图：按请求尺寸生成的PNG图片（同一尺寸只编码一次），也可固定输出尺寸
+- 可注入延迟（固定+随机抖动）、错误码（按比例返回JSON错误）、HTTP 500以及按密钥的QPS限制
+- 可选返回ETag，请求带匹配的 If-None-Match 时返回304（测试增量刷新）
+
+用法：
+    python mock_amap_server.py --port 8900 --latency 0.05 --error-rate 0.01
+    然后在 config.py 中设置 'api_base_url': 'http://127.0.0.1:8900/v3'
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+from PIL import Image
+
+_LEVELS = ['country', 'province', 'city', 'district', 'street']
+
+
+def synthetic_polyline(center_lng, center_lat, points=2000, radius=0.1, rings=1, seed=0):
+    """
+    生成合成的区域边界（带起伏的近似圆形），多个环之间以'|'分隔
+    :param points: 每个环的坐标点数
+    :param radius: 半径（度）
+    :param rings: 环的数量（第2个起为主环旁的小"飞地"）
+    """
+    rng = np.random.default_rng(seed)
+    parts = []
+    for ring in range(rings):
+        t = np.linspace(0, 2 * np.pi, points, endpoint=False)
+        r = radius * (1 + 0.25 * np.sin(5 * t + ring) + 0.05 * rng.standard_normal(points).cumsum() / math.sqrt(points))
+        if ring:
+            r = r * 0.2
+        cx = center_lng + (radius * 1.5 * ring)
+        lng = cx + r * np.cos(t)
+        lat = center_lat + r * np.sin(t)
+        parts.append(';'.join(f"{x:.6f},{y:.6f}" for x, y in zip(lng.tolist(), lat.tolist())))
+    return '|'.join(parts)
+
+
+class MockAmapServer:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_infocode='10004', http_error_rate=0.0, qps_limit=0, polyline_points=2000,
+                 polyline_rings=1, image_size=None, seed=0, etag=False):
+        """
+        初始化模拟服务
+
+        :param host: 监听地址
+        :param port: 监听端口，0表示自动分配
+        :param latency: 每个请求的固定延迟（秒）
+        :param jitter: 额外的随机延迟上限（秒，均匀分布）
+        :param error_rate: 返回高德错误码（JSON）的比例
+        :param error_infocode: 注入的错误码，如 '10004'（访问过于频繁）、'10003'（日配额用尽）
+        :param http_error_rate: 返回HTTP 500的比例
+        :param qps_limit: 每个密钥每秒允许的请求数，超出时返回10004，0表示不限制
+        :param polyline_points: 合成边界每个环的坐标点数
+        :param polyline_rings: 合成边界的环数
+        :param image_size: 固定的输出图片尺寸 "宽*高"，None时按请求的 size*scale 生成
+        :param seed: 随机种子（错误注入与抖动可复现）
+        :param etag: 静态地图是否返回ETag并支持条件请求（304）
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_infocode = str(error_infocode)
+        self.http_error_rate = http_error_rate
+        self.qps_limit = qps_limit
+        self.polyline_points = polyline_points
+        self.polyline_rings = polyline_rings
+        self.image_size = image_size
+        self.etag = etag
+        self.stats = Counter()
+        # 收到第一个请求的时间（time.time()，用于测量客户端启动到发出第一个请求的耗时）
+        self.first_request_at = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent = {}
+        self._images = {}
+        self._polylines = {}
+        self._thread = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        """接口基础地址，如 http://127.0.0.1:8900/v3（对应配置 api_base_url）"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v3"
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _draw(self):
+        with self._lock:
+            return self._random.random()
+
+    def _rate_limited(self, key):
+        if self.qps_limit <= 0:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            window = self._recent.setdefault(key, deque())
+            while window and now - window[0] >= 1.0:
+                window.popleft()
+            if len(window) >= self.qps_limit:
+                return True
+            window.append(now)
+            return False
+
+    def _handle(self, request):
+        url = urlparse(request.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path.rstrip('/').rsplit('/', 1)[-1]
+        with self._lock:
+            self.stats[endpoint] += 1
+            if self.first_request_at is None:
+                self.first_request_at = time.time()
+
+        delay = self.latency + (self._draw() * self.jitter if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        if self.http_error_rate and self._draw() < self.http_error_rate:
+            return self._send(request, 500, b'Internal Server Error', 'text/plain')
+        if self._rate_limited(query.get('key', '')):
+            return self._send_error(request, '10004', 'ACCESS_TOO_FREQUENT')
+        if self.error_rate and self._draw() < self.error_rate:
+            return self._send_error(request, self.error_infocode, 'MOCK_ERROR')
+
+        if endpoint == 'district':
+            return self._district(request, query)
+        if endpoint == 'staticmap':
+            return self._staticmap(request, query)
+        return self._send_error(request, '20003', 'UNKNOWN_ERROR', status=404)
+
+    def _send(self, request, status, body, content_type, headers=None):
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        try:
+            request.wfile.write(body)
+        except ConnectionError:
+            # 客户端已断开（如取消下载、启动基准在收到第一个请求后结束进程）
+            pass
+
+    def _send_json(self, request, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self._send(request, status, body, 'application/json;charset=UTF-8')
+
+    def _send_error(self, request, infocode, info, status=200):
+        with self._lock:
+            self.stats[f"error_{infocode}"] += 1
+        self._send_json(request, {'status': '0', 'info': info, 'infocode': infocode}, status)
+
+    def _polyline(self, adcode):
+        if adcode not in self._polylines:
+            seed = int(adcode) if adcode.isdigit() else sum(map(ord, adcode))
+            rng = random.Random(seed)
+            lng, lat = 110 + rng.random() * 10, 25 + rng.random() * 10
+            self._polylines[adcode] = (f"{lng:.6f},{lat:.6f}", synthetic_polyline(
+                lng, lat, self.polyline_points, 0.05 + rng.random() * 0.2, self.polyline_rings, seed))
+        return self._polylines[adcode]
+
+    def _node(self, name, adcode, level, depth):
+        center, _ = self._polyline(adcode)
+        children = []
+        if depth > 0 and level != 'street':
+            child_level = _LEVELS[min(len(_LEVELS) - 1, _LEVELS.index(level) + 1)]
+            children = [self._node(f"{name}{i + 1}", f"{adcode}{i + 1:02d}", child_level, depth - 1)
+                        for i in range(3)]
+        return {'citycode': '0796', 'adcode': adcode, 'name': name, 'center': center,
+                'level': level, 'districts': children}
+
+    def _district(self, request, query):
+        keywords = query.get('keywords', '')
+        if not keywords:
+            return self._send_json(request, {'status': '1', 'info': 'OK', 'infocode': '10000',
+                                             'count': '0', 'districts': []})
+        adcode = keywords if keywords.isdigit() else str(360000 + sum(map(ord, keywords)) % 1000)
+        name = f"区域{adcode}" if keywords.isdigit() else keywords
+        level = 'province' if len(adcode) <= 6 and adcode.endswith('0000') else 'district'
+        root = self._node(name, adcode, level, int(query.get('subdistrict', 1)))
+        if query.get('extensions') == 'all':
+            root['polyline'] = self._polyline(adcode)[1]
+        self._send_json(request, {'status': '1', 'info': 'OK', 'infocode': '10000',
+                                  'count': '1', 'districts': [root]})
+
+    def _image(self, width, height):
+        """按尺寸缓存的PNG（渐变+网格，压缩后大小接近真实地图图片）"""
+        size = (width, height)
+        with self._lock:
+            data = self._images.get(size)
+        if data is None:
+            x = np.arange(width, dtype=np.uint16)
+            y = np.arange(height, dtype=np.uint16)
+            image = np.empty((height, width, 3), dtype=np.uint8)
+            image[:, :, 0] = (x[None, :] * 255 // max(1, width - 1)).astype(np.uint8)
+            image[:, :, 1] = (y[:, None] * 255 // max(1, height - 1)).astype(np.uint8)
+            image[:, :, 2] = np.where((x[None, :] % 64 == 0) | (y[:, None] % 64 == 0), 40, 220)
+            buffer = io.BytesIO()
+            Image.fromarray(image).save(buffer, 'PNG')
+            data = buffer.getvalue()
+            with self._lock:
+                self._images[size] = data
+        return data
+
+    def _staticmap(self, request, query):
+        try:
+            if self.image_size:
+                width, height = map(int, self.image_size.split('*'))
+            else:
+                width, height = map(int, query.get('size', '400*400').split('*'))
+                scale = int(query.get('scale', 1))
+                width, height = width * scale, height * scale
+        except ValueError:
+            return self._send_error(request, '20000', 'INVALID_PARAMS')
+        data = self._image(width, height)
+        headers = None
+        if self.etag:
+            etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+            headers = {'ETag': etag}
+            if request.headers.get('If-None-Match') == etag:
+                with self._lock:
+                    self.stats['staticmap_not_modified'] += 1
+                return self._send(request, 304, b'', 'image/png', headers)
+        with self._lock:
+            self.stats['staticmap_bytes'] += len(data)
+        self._send(request, 200, data, 'image/png', headers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="高德地图API本地模拟服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0, help="固定延迟（秒）")
+    parser.add_argument('--jitter', type=float, default=0.0, help="随机延迟上限（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回错误码的比例")
+    parser.add_argument('--error-infocode', default='10004', help="注入的错误码")
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help="返回HTTP 500的比例")
+    parser.add_argument('--qps-limit', type=int, default=0, help="每个密钥的QPS上限，0表示不限制")
+    parser.add_argument('--polyline-points', type=int, default=2000, help="合成边界每个环的坐标点数")
+    parser.add_argument('--polyline-rings', type=int, default=1, help="合成边界的环数")
+    parser.add_argument('--image-size', help="固定输出图片尺寸 宽*高（默认按请求尺寸）")
+    parser.add_argument('--etag', action='store_true', help="静态地图返回ETag并支持条件请求（304）")
+    args = parser.parse_args(argv)
+
+    server = MockAmapServer(args.host, args.port, args.latency, args.jitter, args.error_rate,
+                            args.error_infocode, args.http_error_rate, args.qps_limit,
+                            args.polyline_points, args.polyline_rings, args.image_size, etag=args.etag)
+    print(f"🧪 模拟服务已启动: {server.base_url}  (配置 'api_base_url' 指向该地址)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
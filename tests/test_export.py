@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+瓦片导出回归测试
+
+用法：
+    python -m unittest discover tests
+"""
+
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import amap_export  # noqa: E402
+from amap_export import TILE_SIZE, DirectoryWriter, MBTilesWriter, export_tiles, sources_from_images  # noqa: E402
+from amap_tiff import TiledTiffReader, write_geotiff  # noqa: E402
+from amap_tiles import georef_transform, write_world_file  # noqa: E402
+
+
+def georef(left, width, zoom=2):
+    return {'zoom': zoom, 'scale': 1, 'left': left, 'top': 0, 'width': width, 'height': TILE_SIZE}
+
+
+class OverlappingSourcesTest(unittest.TestCase):
+    """相邻图片重叠处的完整瓦片被跳过时，同一图片中引用其内容的瓦片仍须写入数据"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='amap-export-test-')
+        self.addCleanup(self.directory.cleanup)
+        rng = np.random.default_rng(1)
+        first = rng.integers(0, 256, (TILE_SIZE, 2 * TILE_SIZE, 3), dtype=np.uint8)
+        second = rng.integers(0, 256, (TILE_SIZE, 2 * TILE_SIZE, 3), dtype=np.uint8)
+        # 第二张图片与第一张重叠的瓦片在其下一个瓦片处重复出现
+        second[:, TILE_SIZE:] = second[:, :TILE_SIZE]
+        self.sources = []
+        for name, image, left in (('first.png', first, 0), ('second.png', second, TILE_SIZE)):
+            path = os.path.join(self.directory.name, name)
+            cv2.imwrite(path, image)
+            self.sources.append({'path': path, 'georef': georef(left, 2 * TILE_SIZE)})
+        self.expected = {(2, 0, 0): first[:, :TILE_SIZE], (2, 1, 0): first[:, TILE_SIZE:],
+                         (2, 2, 0): second[:, TILE_SIZE:]}
+
+    def export(self, writer):
+        with writer, contextlib.redirect_stdout(io.StringIO()):
+            return export_tiles(self.sources, writer, workers=2)
+
+    def assert_tiles(self, tiles):
+        self.assertEqual(set(tiles), set(self.expected))
+        for key, data in tiles.items():
+            decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            np.testing.assert_array_equal(decoded, self.expected[key])
+
+    def test_mbtiles(self):
+        path = os.path.join(self.directory.name, 'tiles.mbtiles')
+        stats = self.export(MBTilesWriter(path))
+        self.assertEqual(stats['tiles'], 3)
+        with contextlib.closing(sqlite3.connect(path)) as db:
+            rows = db.execute("SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles").fetchall()
+        self.assert_tiles({(z, x, (2 ** z - 1) - y): bytes(data) for z, x, y, data in rows})
+
+    def test_directory(self):
+        root = os.path.join(self.directory.name, 'xyz')
+        stats = self.export(DirectoryWriter(root))
+        self.assertEqual(stats['tiles'], 3)
+        tiles = {}
+        for z, x, y in self.expected:
+            with open(os.path.join(root, str(z), str(x), f"{y}.png"), 'rb') as f:
+                tiles[(z, x, y)] = f.read()
+        self.assert_tiles(tiles)
+
+    def test_duplicates_outside_overlap_are_merged(self):
+        """重叠处之外的重复瓦片仍按内容去重"""
+        first = cv2.imread(self.sources[0]['path'])
+        # 第二张图片的两个瓦片都与第一张图片的第一个瓦片相同
+        second = np.concatenate([first[:, :TILE_SIZE]] * 2, axis=1)
+        cv2.imwrite(self.sources[1]['path'], second)
+        self.expected[(2, 2, 0)] = first[:, :TILE_SIZE]
+        stats = self.export(MBTilesWriter(os.path.join(self.directory.name, 'dedup.mbtiles')))
+        self.assertEqual(stats['dedup']['unique'], 2)
+        self.assertEqual(stats['dedup']['exact_duplicates'], 1)
+
+
+class StripSourceTest(unittest.TestCase):
+    """拼接图片按行条带读取与切分，结果与整张图片相同"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='amap-export-test-')
+        self.addCleanup(self.directory.cleanup)
+        # 左上角不在瓦片边界上，高度不是条带行数的整数倍
+        self.georef = {'zoom': 4, 'scale': 1, 'left': 300, 'top': 200, 'width': 800, 'height': 555}
+        self.image = np.random.default_rng(2).integers(0, 256, (555, 800, 3), dtype=np.uint8)
+
+    def assert_native_tiles(self, sources):
+        path = os.path.join(self.directory.name, 'tiles.mbtiles')
+        with mock.patch.object(amap_export, 'STRIP_ROWS', 64), MBTilesWriter(path) as writer, \
+                contextlib.redirect_stdout(io.StringIO()):
+            stats = export_tiles(sources, writer, min_zoom=2, workers=2)
+        self.assertEqual((stats['min_zoom'], stats['max_zoom']), (2, 4))
+        with contextlib.closing(sqlite3.connect(path)) as db:
+            rows = db.execute("SELECT tile_column, tile_row, tile_data FROM tiles WHERE zoom_level = 4").fetchall()
+            zooms = {z for z, in db.execute("SELECT DISTINCT zoom_level FROM tiles")}
+        self.assertEqual(zooms, {2, 3, 4})
+        whole = 0
+        for x, tms_y, data in rows:
+            tile = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+            left, top = x * TILE_SIZE - 300, (15 - tms_y) * TILE_SIZE - 200
+            if tile.shape[2] == 3:
+                np.testing.assert_array_equal(tile, self.image[top:top + TILE_SIZE, left:left + TILE_SIZE])
+                whole += 1
+        self.assertEqual(whole, 2)
+
+    def test_geotiff(self):
+        for bigtiff in (False, True):
+            path = os.path.join(self.directory.name, f'mosaic_{bigtiff}.tif')
+            write_geotiff(path, self.image[:, :, ::-1], georef_transform(self.georef), bigtiff=bigtiff)
+            with TiledTiffReader(path) as reader:
+                np.testing.assert_array_equal(reader.read_rows(100, 400)[:, :, ::-1], self.image[100:400])
+            sources = sources_from_images([path])
+            self.assertEqual(sources[0]['georef'], self.georef)
+            self.assert_native_tiles(sources)
+
+    def test_png_with_world_file(self):
+        path = os.path.join(self.directory.name, 'mosaic.png')
+        cv2.imwrite(path, self.image)
+        write_world_file(path, self.georef)
+        sources = sources_from_images([path])
+        self.assertEqual(sources[0]['georef'], self.georef)
+        self.assert_native_tiles(sources)
+
+
+if __name__ == "__main__":
+    unittest.main()